@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Микро-бенчмарк извлечения текста из HTML: BeautifulSoup (эталон — так
+скрейперы работали раньше) против потокового lxml из html_extract.py.
+Сначала проверяет, что результаты совпадают, затем меряет время.
+
+Запуск:  python bench/bench_html_extract.py [--repeat 50] [--samples bench/samples]
+Страницы t.me/s, t.me/<user> и picuki можно сохранить в samples/ под теми же именами.
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bs4 import BeautifulSoup
+import html_extract
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "samples")
+
+
+# ── Эталон: разбор как в скрейперах до перехода на lxml ───────────────────────
+def reference_telegram_posts(html, max_posts=5):
+    soup = BeautifulSoup(html, "html.parser")
+    return [m.get_text(separator=" ", strip=True)
+            for m in soup.select(".tgme_widget_message_text")[:max_posts]]
+
+
+def reference_instagram_posts(html, max_posts=5):
+    soup = BeautifulSoup(html, "html.parser")
+    return [i.get_text(strip=True) for i in soup.select(".photo-description")[:max_posts]]
+
+
+def reference_channel_description(html):
+    soup = BeautifulSoup(html, "html.parser")
+    tag = soup.select_one(".tgme_channel_info_description")
+    return tag.get_text(separator=" ", strip=True) if tag else ""
+
+
+def reference_bio(html):
+    soup = BeautifulSoup(html, "html.parser")
+    tag = soup.select_one(".tgme_page_description")
+    return tag.get_text(separator=" ", strip=True) if tag else ""
+
+
+# ── Быстрый путь ──────────────────────────────────────────────────────────────
+def fast_telegram_posts(html, max_posts=5):
+    return html_extract.select_texts(html, "tgme_widget_message_text", " ", limit=max_posts)
+
+
+def fast_instagram_posts(html, max_posts=5):
+    return html_extract.select_texts(html, "photo-description", limit=max_posts)
+
+
+def fast_channel_description(html):
+    return html_extract.select_first_text(html, "tgme_channel_info_description", " ")
+
+
+def fast_bio(html):
+    return html_extract.select_first_text(html, "tgme_page_description", " ")
+
+
+CASES = [
+    ("telegram_channel.html", "t.me/s посты (5)", reference_telegram_posts, fast_telegram_posts),
+    ("telegram_channel.html", "t.me/s все посты", lambda h: reference_telegram_posts(h, 100),
+     lambda h: fast_telegram_posts(h, 100)),
+    ("telegram_channel.html", "описание канала", reference_channel_description, fast_channel_description),
+    ("picuki_profile.html", "picuki посты (5)", reference_instagram_posts, fast_instagram_posts),
+    ("telegram_profile.html", "bio профиля", reference_bio, fast_bio),
+]
+
+
+def timed(func, html, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(html)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--samples", default=SAMPLES_DIR)
+    args = parser.parse_args()
+
+    mismatches = 0
+    print(f"{'случай':<22} {'KB':>6} {'bs4 мс':>9} {'lxml мс':>9} {'ускорение':>10}")
+    for filename, label, reference, fast in CASES:
+        path = os.path.join(args.samples, filename)
+        if not os.path.exists(path):
+            print(f"{label:<22} нет файла {path}")
+            continue
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+
+        expected, actual = reference(html), fast(html)
+        if expected != actual:
+            mismatches += 1
+            print(f"{label:<22} РАСХОЖДЕНИЕ:\n  bs4:  {expected!r}\n  lxml: {actual!r}")
+            continue
+
+        ref_ms = timed(reference, html, args.repeat)
+        fast_ms = timed(fast, html, args.repeat)
+        print(f"{label:<22} {len(html) / 1024:>6.1f} {ref_ms:>9.2f} {fast_ms:>9.2f} {ref_ms / fast_ms:>9.1f}x")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
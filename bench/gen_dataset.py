@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Генератор синтетической базы контактов для бенчмарков.
+Пишет JSONL: одна строка — страница в формате ответа Notion
+(databases.query), со всеми свойствами из contacts.FIELDS.
+Распределения грубо повторяют живую базу: у части контактов есть
+Telegram-канал или Instagram, у части пустое «Чем занимается» и т.д.
+
+Запуск:  python bench/gen_dataset.py --rows 10000 [--seed 1] [--out bench/data/contacts_10000.jsonl]
+"""
+import os
+import json
+import uuid
+import random
+import argparse
+from datetime import date, datetime, timedelta, timezone
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEFAULT_SIZES = (100, 10_000, 100_000)
+
+# Свойство Notion -> (id свойства, тип). id нужны заглушке для databases.retrieve
+SCHEMA = {
+    "Имя":                   ("title", "title"),
+    "Круг":                  ("krug", "select"),
+    "Приоритет":             ("prio", "select"),
+    "Последний контакт":     ("last", "date"),
+    "Следующий контакт":     ("next", "date"),
+    "Частота контактов дни": ("freq", "number"),
+    "ДР":                    ("bday", "date"),
+    "Личный TG":             ("tgpe", "url"),
+    "Telegram канал":        ("tgch", "url"),
+    "Insta":                 ("inst", "url"),
+    "YouTube":               ("ytub", "url"),
+    "Заметки":               ("note", "rich_text"),
+    "Новости":               ("news", "rich_text"),
+    "Чем занимается":        ("occu", "rich_text"),
+    "Цели":                  ("goal", "rich_text"),
+    "Команда для Manus":     ("manu", "rich_text"),
+}
+
+CIRCLES = ["Клиент активный", "Клиент бывший", "Партнер", "Близкий круг",
+           "Знакомый", "Зона развития", "Другое"]
+PRIORITIES = [("Высокий", 0.2), ("Средний", 0.3), ("Низкий", 0.5)]
+FIRST_NAMES = ["Анна", "Борис", "Вера", "Глеб", "Дарья", "Егор", "Жанна", "Илья",
+               "Ксения", "Лев", "Мария", "Никита", "Ольга", "Павел", "Роман", "София"]
+LAST_NAMES = ["Иванов", "Смирнов", "Кузнецов", "Попов", "Соколов", "Лебедев",
+              "Козлов", "Новиков", "Морозов", "Волков", "Алексеев", "Фёдоров"]
+
+
+def _text(content):
+    if not content:
+        return []
+    return [{"type": "text", "text": {"content": content, "link": None},
+             "plain_text": content, "href": None}]
+
+
+def _value(kind, value):
+    if kind == "title":
+        return _text(value)
+    if kind == "rich_text":
+        return _text(value)
+    if kind == "select":
+        return {"name": value} if value else None
+    if kind == "date":
+        return {"start": value, "end": None} if value else None
+    return value
+
+
+def make_page(rng, i, today):
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}"
+    priority = rng.choices([p for p, _ in PRIORITIES], [w for _, w in PRIORITIES])[0]
+
+    last_contact = next_contact = frequency = None
+    if rng.random() < 0.7:
+        last_contact = (today - timedelta(days=rng.randint(0, 200))).isoformat()
+        frequency = rng.choice([14, 30, 60, 90])
+    if rng.random() < 0.2:
+        next_contact = (today + timedelta(days=rng.randint(-20, 40))).isoformat()
+
+    birthday = None
+    if rng.random() < 0.5:
+        birthday = date(rng.randint(1960, 2002), rng.randint(1, 12), rng.randint(1, 28)).isoformat()
+
+    values = {
+        "Имя": name,
+        "Круг": rng.choice(CIRCLES),
+        "Приоритет": priority,
+        "Последний контакт": last_contact,
+        "Следующий контакт": next_contact,
+        "Частота контактов дни": frequency,
+        "ДР": birthday,
+        "Личный TG": f"https://t.me/user_{i}" if rng.random() < 0.5 else None,
+        "Telegram канал": f"https://t.me/chan_{i}" if rng.random() < 0.3 else None,
+        "Insta": f"https://instagram.com/insta_{i}" if rng.random() < 0.2 else None,
+        "YouTube": None,
+        "Заметки": "Познакомились на конференции" if rng.random() < 0.3 else "",
+        "Новости": "[Обновлено 01.01.2026]\n• Запустил новый проект" if rng.random() < 0.2 else "",
+        "Чем занимается": "" if rng.random() < 0.4 else "Основатель студии разработки",
+        "Цели": "",
+        "Команда для Manus": "",
+    }
+    properties = {
+        prop: {"id": prop_id, "type": kind, kind: _value(kind, values[prop])}
+        for prop, (prop_id, kind) in SCHEMA.items()
+    }
+    edited = datetime.now(timezone.utc) - timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+    page_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    return {
+        "object": "page",
+        "id": page_id,
+        "created_time": edited.strftime("%Y-%m-%dT%H:%M:00.000Z"),
+        "last_edited_time": edited.strftime("%Y-%m-%dT%H:%M:00.000Z"),
+        "archived": False,
+        "in_trash": False,
+        "properties": properties,
+        "url": f"https://www.notion.so/{page_id.replace('-', '')}",
+    }
+
+
+def dataset_path(rows):
+    return os.path.join(DATA_DIR, f"contacts_{rows}.jsonl")
+
+
+def generate(rows, out, seed=1):
+    rng = random.Random(seed)
+    today = date.today()
+    directory = os.path.dirname(out)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        for i in range(rows):
+            f.write(json.dumps(make_page(rng, i, today), ensure_ascii=False))
+            f.write("\n")
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Синтетическая база контактов для бенчмарков")
+    parser.add_argument("--rows", type=int, action="append",
+                        help=f"число строк (можно несколько раз; по умолчанию {DEFAULT_SIZES})")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="файл результата (только для одного --rows)")
+    args = parser.parse_args()
+
+    for rows in args.rows or DEFAULT_SIZES:
+        out = args.out if args.out and len(args.rows or ()) == 1 else dataset_path(rows)
+        generate(rows, out, args.seed)
+        print(f"{rows} строк -> {out} ({os.path.getsize(out) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
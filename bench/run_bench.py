@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Сквозной бенчмарк скриптов против локальных заглушек (bench/stubs.py).
+Для каждого размера базы генерирует датасет (если его ещё нет), поднимает
+заглушки и запускает monitor_social.py, digest.py, enrich_contacts.py
+отдельными процессами с чистым локальным состоянием. Время каждого
+прогона сравнивается с timeout-minutes соответствующего job в Actions.
+
+По умолчанию действуют боевые лимиты (Gemini RPM, темп Notion и Telegram) —
+так видно, укладывается ли job в таймаут. --unthrottled снимает их, чтобы
+мерить собственные накладные расходы скриптов.
+--warm запускает каждый скрипт второй раз на том же состоянии
+(инкрементальная синхронизация, кэш Gemini, состояние источников).
+
+Запуск:  python bench/run_bench.py --sizes 100,10000 [--scripts digest] [--unthrottled] [--json out.json]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from gen_dataset import dataset_path, generate
+
+# скрипт -> timeout-minutes его job в .github/workflows/daily-monitor.yml
+SCRIPTS = {
+    "monitor_social": 20,
+    "digest": 10,
+    "enrich_contacts": 30,
+}
+
+UNTHROTTLED_ENV = {
+    "GEMINI_RPM": "100000",
+    "GEMINI_TPM": "1000000000",
+    "NOTION_WRITE_RPS": "1000",
+    "NOTION_READ_RPS": "1000",
+    "TG_CHAT_RATE": "1000",
+    "TG_CHAT_BURST": "1000",
+    "TG_GLOBAL_RATE": "1000",
+}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get_json(url, method="GET"):
+    req = urllib.request.Request(url, method=method, data=b"" if method == "POST" else None)
+    with urllib.request.urlopen(req, timeout=5) as resp:
+        return json.loads(resp.read())
+
+
+def start_stubs(dataset, stub_args):
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "stubs.py"), "--dataset", dataset,
+         "--port", str(port), *stub_args],
+        stdout=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 120   # 100k строк читаются несколько секунд
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit("заглушки не запустились")
+        try:
+            _get_json(f"{base}/_stats")
+            return proc, base
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("заглушки не ответили за 120 с")
+
+
+def script_env(base, state_dir, unthrottled, reports_dir):
+    env = dict(os.environ)
+    env.update({
+        "NOTION_TOKEN": "bench",
+        "NOTION_DATABASE_ID": "bench-db",
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "TELEGRAM_CHAT_ID": "1",
+        "GEMINI_API_KEY": "bench",
+        "NOTION_BASE_URL": base,
+        "TELEGRAM_API_BASE": base,
+        "TELEGRAM_WEB_BASE": base,
+        "GEMINI_API_BASE": base,
+        "PICUKI_BASE": base,
+        "CONTACT_STORE_PATH": os.path.join(state_dir, "contacts.sqlite"),
+        "SOURCE_STATE_PATH": os.path.join(state_dir, "sources.sqlite"),
+        "GEMINI_CACHE_PATH": os.path.join(state_dir, "gemini.sqlite"),
+        "PROGRESS_JOURNAL_PATH": os.path.join(state_dir, "progress.sqlite"),
+        "SCM_REPORTS_DIR": reports_dir,
+    })
+    if unthrottled:
+        env.update(UNTHROTTLED_ENV)
+    return env
+
+
+def run_script(script, env, timeout, log_path):
+    started = time.perf_counter()
+    with open(log_path, "w", encoding="utf-8") as log:
+        try:
+            proc = subprocess.run([sys.executable, f"{script}.py"], cwd=ROOT_DIR, env=env,
+                                  stdout=log, stderr=subprocess.STDOUT, timeout=timeout)
+            status = "ok" if proc.returncode == 0 else f"exit {proc.returncode}"
+        except subprocess.TimeoutExpired:
+            status = "TIMEOUT"
+    return time.perf_counter() - started, status
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="100,10000",
+                        help="размеры базы через запятую (100,10000,100000)")
+    parser.add_argument("--scripts", default=",".join(SCRIPTS))
+    parser.add_argument("--unthrottled", action="store_true",
+                        help="снять боевые лимиты Gemini/Notion/Telegram")
+    parser.add_argument("--warm", action="store_true",
+                        help="второй прогон каждого скрипта на том же состоянии")
+    parser.add_argument("--timeout-scale", type=float, default=1.0,
+                        help="множитель к таймаутам job (0.5 — предупреждать раньше)")
+    parser.add_argument("--stub-arg", action="append", default=[],
+                        help="аргумент для stubs.py, например --stub-arg=--limit=notion=3")
+    parser.add_argument("--json", help="сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    scripts = [s for s in args.scripts.split(",") if s]
+    unknown = set(scripts) - set(SCRIPTS)
+    if unknown:
+        raise SystemExit(f"неизвестные скрипты: {', '.join(sorted(unknown))}")
+
+    results = []
+    log_dir = tempfile.mkdtemp(prefix="scm-bench-logs-")
+    print(f"{'строк':>7} {'скрипт':<16} {'прогон':<6} {'сек':>8} {'статус':<8} запросы (notion/tg/gemini/t.me/picuki)")
+    for size in sizes:
+        dataset = dataset_path(size)
+        if not os.path.exists(dataset):
+            print(f"  генерирую {dataset}...")
+            generate(size, dataset)
+        proc, base = start_stubs(dataset, args.stub_arg)
+        try:
+            for script in scripts:
+                timeout = SCRIPTS[script] * 60 * args.timeout_scale
+                with tempfile.TemporaryDirectory(prefix="scm-bench-state-") as state_dir:
+                    env = script_env(base, state_dir, args.unthrottled,
+                                     os.path.join(log_dir, "reports"))
+                    for run in (("cold", "warm") if args.warm else ("cold",)):
+                        _get_json(f"{base}/_reset", "POST")
+                        log_path = os.path.join(log_dir, f"{script}-{size}-{run}.log")
+                        seconds, status = run_script(script, env, timeout, log_path)
+                        stats = _get_json(f"{base}/_stats")
+                        counts = "/".join(str(stats[s]["requests"]) for s in
+                                          ("notion", "telegram", "gemini", "tme", "picuki"))
+                        print(f"{size:>7} {script:<16} {run:<6} {seconds:>8.1f} {status:<8} {counts}")
+                        results.append({"rows": size, "script": script, "run": run,
+                                        "seconds": round(seconds, 3), "status": status,
+                                        "timeout_seconds": timeout, "stubs": stats,
+                                        "log": log_path})
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    print(f"Логи и отчёты прогонов: {log_dir}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"unthrottled": args.unthrottled, "results": results}, f,
+                      ensure_ascii=False, indent=2)
+    sys.exit(0 if all(r["status"] == "ok" for r in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Локальные заглушки внешних сервисов для бенчмарков — один HTTP-сервер:
+  Notion     POST /v1/databases/<id>/query (пагинация, filter, filter_properties),
+             GET  /v1/databases/<id>, PATCH /v1/pages/<id>
+  Bot API    /bot<token>/sendMessage, getUpdates, answerCallbackQuery, editMessageText, ...
+  Gemini     POST /v1beta/models/<model>:generateContent (в т.ч. пакетный JSON-ответ)
+  t.me       GET /s/<channel> (лента с data-post и ?before=), GET /<username> (bio)
+  picuki     GET /profile/<username>
+Для каждого сервиса задаются задержка (--latency notion=150), случайные
+429 (--error-rate gemini=0.05) и жёсткий лимит запросов в секунду, сверх
+которого отвечает 429 (--limit notion=3). Счётчики — GET /_stats,
+сброс — POST /_reset.
+
+Скрипты направляются сюда переменными NOTION_BASE_URL, TELEGRAM_API_BASE,
+TELEGRAM_WEB_BASE, GEMINI_API_BASE, PICUKI_BASE (см. http_client.py).
+
+Запуск:  python bench/stubs.py --dataset bench/data/contacts_100.jsonl --port 8930
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ratelimit import TokenBucket
+from notion_query import matches
+from gen_dataset import SCHEMA, CIRCLES, PRIORITIES
+
+SERVICES = ("notion", "telegram", "gemini", "tme", "picuki")
+DEFAULT_LATENCY_MS = {"notion": 150, "telegram": 60, "gemini": 1200, "tme": 250, "picuki": 400}
+TG_PAGE_SIZE = 20
+
+
+# ── Данные ────────────────────────────────────────────────────────────────────
+class Dataset:
+    """Страницы базы как готовые JSON-строки — без разбора на объекты,
+    чтобы 100k строк держались в памяти дёшево."""
+
+    def __init__(self, path):
+        self.rows = []   # (last_edited_time, строка JSON)
+        if path:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        edited = re.search(r'"last_edited_time": "([^"]+)"', line).group(1)
+                        self.rows.append((edited, line))
+        self._filtered = {}   # JSON фильтра -> подходящие строки (между страницами пагинации)
+        self._pages = None    # разобранные страницы — только когда пришёл фильтр по свойствам
+        self._lock = threading.Lock()
+
+    def _parsed(self):
+        with self._lock:
+            if self._pages is None:
+                self._pages = [json.loads(line) for _, line in self.rows]
+            return self._pages
+
+    def _filter(self, flt):
+        since = (flt.get("last_edited_time") or {}).get("on_or_after")
+        if since and "timestamp" in flt:
+            return [r for r in self.rows if r[0] >= since]
+        key = json.dumps(flt, sort_keys=True, ensure_ascii=False)
+        rows = self._filtered.get(key)
+        if rows is None:
+            rows = self._filtered[key] = [r for r, page in zip(self.rows, self._parsed())
+                                          if matches(flt, page)]
+        return rows
+
+    def query(self, body, filter_properties=None):
+        rows = self._filter(body["filter"]) if body.get("filter") else self.rows
+        start = int(body.get("start_cursor") or 0)
+        size = min(int(body.get("page_size") or 100), 100)
+        chunk = [line for _, line in rows[start:start + size]]
+        has_more = start + size < len(rows)
+        if filter_properties:
+            chunk = [_project(line, set(filter_properties)) for line in chunk]
+        return ('{"object": "list", "results": [' + ", ".join(chunk)
+                + f'], "has_more": {json.dumps(has_more)}, '
+                + f'"next_cursor": {json.dumps(str(start + size) if has_more else None)}}}')
+
+
+SELECT_OPTIONS = {"Круг": CIRCLES, "Приоритет": [name for name, _ in PRIORITIES]}
+
+
+def _schema_property(name, prop_id, kind):
+    prop = {"id": prop_id, "name": name, "type": kind}
+    if kind == "select":
+        prop["select"] = {"options": [{"name": o} for o in SELECT_OPTIONS.get(name, [])]}
+    return prop
+
+
+def _project(line, ids):
+    page = json.loads(line)
+    page["properties"] = {name: prop for name, prop in page["properties"].items()
+                          if SCHEMA[name][0] in ids}
+    return json.dumps(page, ensure_ascii=False)
+
+
+def _stable(value, mod):
+    return int(hashlib.md5(value.encode("utf-8")).hexdigest(), 16) % mod
+
+
+def telegram_channel_page(channel, before=None):
+    newest = 100 + _stable(channel, 400)
+    top = min(before - 1, newest) if before else newest
+    ids = range(max(1, top - TG_PAGE_SIZE + 1), top + 1)
+    messages = "".join(
+        f'<div class="tgme_widget_message_wrap"><div class="tgme_widget_message" data-post="{channel}/{i}">'
+        f'<div class="tgme_widget_message_text js-message_text">Пост {i} канала {channel}: '
+        f'запустили новый продукт, выступили на конференции, ищем партнёров.</div></div></div>'
+        for i in ids
+    )
+    return (f'<html><body><div class="tgme_channel_info_description">Канал {channel} '
+            f'о стартапах и продуктах</div><section class="tgme_channel_history">{messages}'
+            f'</section></body></html>')
+
+
+def telegram_profile_page(username):
+    return (f'<html><body><div class="tgme_page_title">{username}</div>'
+            f'<div class="tgme_page_description">Основатель {username} Studio, '
+            f'делаем мобильные приложения</div></body></html>')
+
+
+def picuki_page(username):
+    posts = "".join(f'<div class="photo-description">Пост {i} от @{username}: новый проект и поездка</div>'
+                    for i in range(6))
+    return f'<html><body>{posts}</body></html>'
+
+
+def gemini_answer(body):
+    prompt = body["contents"][0]["parts"][0]["text"]
+    config = body.get("generationConfig") or {}
+    if config.get("responseMimeType") == "application/json":
+        ids = re.findall(r"### page_id: (\S+)", prompt)
+        text = json.dumps([{"page_id": pid, "summary": "• Запустил новый продукт\n• Выступил на конференции"}
+                           for pid in ids], ensure_ascii=False)
+    else:
+        text = "• Запустил новый продукт\n• Выступил на конференции"
+    tokens = len(prompt) // 3
+    return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}],
+            "usageMetadata": {"promptTokenCount": tokens, "candidatesTokenCount": 20}}
+
+
+# ── Сервер ────────────────────────────────────────────────────────────────────
+class Stubs:
+    def __init__(self, dataset, latency, error_rate, limits, seed=1):
+        self.dataset = dataset
+        self.latency = latency
+        self.error_rate = error_rate
+        self.buckets = {s: TokenBucket(rps, rps) for s, rps in limits.items()}
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.message_id = 0
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stats = {s: {"requests": 0, "throttled": 0, "writes": 0} for s in SERVICES}
+
+    def count(self, service, key="requests"):
+        with self.lock:
+            self.stats[service][key] += 1
+
+    def throttled(self, service):
+        """True — ответить 429: сработала инъекция или превышен лимит сервиса."""
+        bucket = self.buckets.get(service)
+        if bucket is not None:
+            if bucket.delay() > 0:
+                self.count(service, "throttled")
+                return True
+            bucket.reserve()
+        rate = self.error_rate.get(service, 0.0)
+        if rate:
+            with self.lock:
+                hit = self.rng.random() < rate
+            if hit:
+                self.count(service, "throttled")
+                return True
+        return False
+
+    def next_message_id(self):
+        with self.lock:
+            self.message_id += 1
+            return self.message_id
+
+
+def make_handler(stubs):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body, content_type="application/json", headers=None):
+            data = body if isinstance(body, bytes) else (
+                body if isinstance(body, str) else json.dumps(body, ensure_ascii=False)).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            try:
+                return json.loads(raw) if raw else {}
+            except ValueError:
+                return {}
+
+        def _service(self, path):
+            if path.startswith("/v1/"):
+                return "notion"
+            if path.startswith("/bot"):
+                return "telegram"
+            if path.startswith("/v1beta/"):
+                return "gemini"
+            if path.startswith("/profile/"):
+                return "picuki"
+            return "tme"
+
+        def _handle(self, method):
+            url = urlsplit(self.path)
+            path, query = url.path, parse_qs(url.query)
+            if path == "/_stats":
+                return self._send(200, stubs.stats)
+            if path == "/_reset":
+                stubs.reset()
+                return self._send(200, {"ok": True})
+
+            service = self._service(path)
+            body = self._body() if method in ("POST", "PATCH") else {}
+            stubs.count(service)
+            delay = stubs.latency.get(service, 0) / 1000
+            if delay:
+                time.sleep(delay)
+            if stubs.throttled(service):
+                return self._throttle(service)
+            return getattr(self, f"_{service}")(method, path, query, body)
+
+        def _throttle(self, service):
+            if service == "notion":
+                return self._send(429, {"object": "error", "status": 429, "code": "rate_limited",
+                                        "message": "Rate limited"}, headers={"Retry-After": "1"})
+            if service == "telegram":
+                return self._send(429, {"ok": False, "error_code": 429,
+                                        "description": "Too Many Requests: retry after 1",
+                                        "parameters": {"retry_after": 1}})
+            if service == "gemini":
+                return self._send(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED", "details": [
+                    {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "1s"}]}})
+            return self._send(429, "Too Many Requests", "text/plain", {"Retry-After": "1"})
+
+        # ── Сервисы ───────────────────────────────────────────────────────────
+        def _notion(self, method, path, query, body):
+            m = re.match(r"/v1/databases/([^/]+)/query$", path)
+            if m and method == "POST":
+                return self._send(200, stubs.dataset.query(body, query.get("filter_properties")))
+            m = re.match(r"/v1/databases/([^/]+)$", path)
+            if m and method == "GET":
+                return self._send(200, {"object": "database", "id": m.group(1), "properties": {
+                    name: _schema_property(name, prop_id, kind)
+                    for name, (prop_id, kind) in SCHEMA.items()}})
+            m = re.match(r"/v1/pages/([^/]+)$", path)
+            if m and method == "PATCH":
+                stubs.count("notion", "writes")
+                return self._send(200, {"object": "page", "id": m.group(1), "properties": {}})
+            return self._send(404, {"object": "error", "status": 404, "code": "object_not_found",
+                                    "message": path})
+
+        def _telegram(self, method, path, query, body):
+            api_method = path.rsplit("/", 1)[-1]
+            if api_method == "getUpdates":
+                return self._send(200, {"ok": True, "result": []})
+            if api_method == "sendMessage":
+                stubs.count("telegram", "writes")
+                return self._send(200, {"ok": True, "result": {
+                    "message_id": stubs.next_message_id(), "date": int(time.time()),
+                    "chat": {"id": body.get("chat_id")}, "text": body.get("text", "")}})
+            return self._send(200, {"ok": True, "result": True})
+
+        def _gemini(self, method, path, query, body):
+            if not path.endswith(":generateContent") or not body.get("contents"):
+                return self._send(400, {"error": {"code": 400, "message": "bad request"}})
+            return self._send(200, gemini_answer(body))
+
+        def _tme(self, method, path, query, body):
+            parts = path.strip("/").split("/")
+            if parts[0] == "s" and len(parts) > 1:
+                before = query.get("before", [None])[0]
+                return self._send(200, telegram_channel_page(parts[1], int(before) if before else None),
+                                  "text/html; charset=utf-8")
+            return self._send(200, telegram_profile_page(parts[0]), "text/html; charset=utf-8")
+
+        def _picuki(self, method, path, query, body):
+            return self._send(200, picuki_page(path.rsplit("/", 1)[-1]), "text/html; charset=utf-8")
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def do_PATCH(self):
+            self._handle("PATCH")
+
+    return Handler
+
+
+def _per_service(values, cast, defaults=None):
+    result = dict(defaults or {})
+    for item in values or []:
+        service, _, value = item.partition("=")
+        if service not in SERVICES:
+            raise SystemExit(f"неизвестный сервис {service!r}, есть: {', '.join(SERVICES)}")
+        result[service] = cast(value)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заглушки Notion/Telegram/Gemini/t.me/picuki")
+    parser.add_argument("--dataset", help="JSONL из bench/gen_dataset.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8930)
+    parser.add_argument("--latency", action="append", metavar="SERVICE=MS",
+                        help=f"задержка ответа, по умолчанию {DEFAULT_LATENCY_MS}")
+    parser.add_argument("--error-rate", action="append", metavar="SERVICE=P",
+                        help="доля ответов 429")
+    parser.add_argument("--limit", action="append", metavar="SERVICE=RPS",
+                        help="запросов в секунду, сверх — 429")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    stubs = Stubs(
+        Dataset(args.dataset),
+        _per_service(args.latency, float, DEFAULT_LATENCY_MS),
+        _per_service(args.error_rate, float),
+        _per_service(args.limit, float),
+        args.seed,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(stubs))
+    server.daemon_threads = True
+    print(f"Заглушки слушают http://{args.host}:{args.port} "
+          f"({len(stubs.dataset.rows)} страниц в базе)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Social Capital Monitor — локальный снимок базы контактов
+SQLite-копия страниц Notion, общая для всех скриптов.
+Первый запуск делает полную синхронизацию, дальше из Notion забираются
+только страницы с last_edited_time новее прошлой синхронизации.
+Архивированные страницы удаляются из снимка; архивированные из бота —
+сразу (forget), а раз в CONTACT_STORE_FULL_SYNC_DAYS дней делается полная
+синхронизация, чтобы вычистить страницы, архивированные в самом Notion
+(query их не отдаёт).
+Из Notion забираются только свойства из contacts.FIELDS (filter_properties);
+фильтр и проекция конкретного скрипта применяются уже к снимку в SQL
+(см. notion_query.py).
+"""
+import os
+import json
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import metrics
+import profiling
+import notion_query
+from contacts import FIELDS
+from pipeline import merge, prefetch
+from ratelimit import TokenBucket
+from notion_writer import call_with_retries
+
+# ── Конфигурация ──────────────────────────────────────────────────────────────
+# Пустая строка отключает снимок — скрипты читают Notion напрямую
+CONTACT_STORE_PATH   = os.environ.get("CONTACT_STORE_PATH", ".cache/contacts.sqlite")
+FULL_SYNC_EVERY_DAYS = int(os.environ.get("CONTACT_STORE_FULL_SYNC_DAYS", "7"))
+# Сколько ответов query (по 100 страниц) читать вперёд в фоне; 0 — без упреждения
+PREFETCH_RESPONSES   = int(os.environ.get("NOTION_PREFETCH_RESPONSES", "1"))
+# Полное чтение базы делится на непересекающиеся выборки по «Круг»
+# (каждый вариант + пустое значение), выборки читаются одновременно.
+# Курсор одной выборки последователен, поэтому потоков больше выборок не бывает
+READ_WORKERS         = int(os.environ.get("NOTION_READ_WORKERS", "3"))
+READ_RPS             = float(os.environ.get("NOTION_READ_RPS", "3"))   # общий темп чтения
+PARTITION_FIELD      = "circle"
+
+_read_bucket = TokenBucket(READ_RPS, max(1.0, READ_WORKERS))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    database_id      TEXT NOT NULL,
+    page_id          TEXT NOT NULL,
+    last_edited_time TEXT NOT NULL,
+    properties       TEXT NOT NULL,
+    PRIMARY KEY (database_id, page_id)
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    database_id  TEXT PRIMARY KEY,
+    cursor       TEXT,
+    full_sync_at TEXT,
+    properties   TEXT
+);
+"""
+
+
+def _iter_responses(notion, database_id, query):
+    """Ответы databases.query по курсору — по 100 страниц в каждом."""
+    cursor = None
+    while True:
+        kwargs = {"database_id": database_id, "page_size": 100, **query}
+        if cursor:
+            kwargs["start_cursor"] = cursor
+        with metrics.stage("notion_read"):
+            resp = call_with_retries(notion.databases.query, before=_read_bucket.acquire,
+                                     wait=_read_bucket.pause, **kwargs)
+        metrics.incr("notion.pages_read", len(resp["results"]))
+        yield resp
+        if not resp.get("has_more"):
+            break
+        cursor = resp["next_cursor"]
+
+
+def iter_query(notion, database_id, **query):
+    """Постранично читает базу Notion и отдаёт страницы по одной.
+    Следующие PREFETCH_RESPONSES ответов запрашиваются в фоне, пока
+    вызывающий разбирает текущий: сеть и разбор идут одновременно, а в
+    памяти — не больше (1 + PREFETCH_RESPONSES) ответов, сколько бы ни было в базе."""
+    responses = _iter_responses(notion, database_id, query)
+    if PREFETCH_RESPONSES > 0:
+        responses = prefetch(responses, PREFETCH_RESPONSES, name="notion-prefetch")
+    for resp in responses:
+        yield from resp["results"]
+
+
+def iter_partitioned(notion, database_id, filter=None, **query):
+    """Читает базу (с фильтром filter) параллельно по выборкам PARTITION_FIELD
+    и отдаёт страницы одним потоком; порядок страниц не сохраняется.
+    Страница, которую изменили во время чтения, может прийти из двух выборок —
+    повтор отбрасывается; пропавшую так страницу догонит следующая
+    инкрементальная синхронизация (у неё свежий last_edited_time).
+    Без схемы базы или при READ_WORKERS <= 1 — обычное последовательное чтение."""
+    if filter is not None:
+        query["filter"] = filter
+    options = notion_query.select_options(notion, database_id, PARTITION_FIELD)
+    if not options or READ_WORKERS <= 1:
+        yield from iter_query(notion, database_id, **query)
+        return
+
+    base = [filter] if filter is not None else []
+    sources = [
+        _iter_responses(notion, database_id, {**query, "filter": notion_query.all_of(*base, part)})
+        for part in notion_query.partitions(options, PARTITION_FIELD)
+    ]
+    seen = set()
+    for resp in merge(sources, workers=min(READ_WORKERS, len(sources)),
+                      depth=READ_WORKERS, name="notion-read"):
+        for page in resp["results"]:
+            if page["id"] in seen:
+                metrics.incr("notion.duplicate_pages")
+                continue
+            seen.add(page["id"])
+            yield page
+
+
+class ContactStore:
+    """Снимок страниц базы Notion в SQLite."""
+
+    def __init__(self, path=CONTACT_STORE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Арендаторы (tenants.py) синхронизируют свои базы параллельно — ждём
+        # блокировку; sync держит её только на время записи, не чтения Notion
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.executescript(_SCHEMA)
+        # Снимки, созданные до проекции свойств: колонки properties ещё нет
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(sync_state)")}
+        if "properties" not in columns:
+            self.conn.execute("ALTER TABLE sync_state ADD COLUMN properties TEXT")
+
+    def close(self):
+        self.conn.close()
+
+    # ── Синхронизация ─────────────────────────────────────────────────────────
+    def _state(self, database_id):
+        row = self.conn.execute(
+            "SELECT cursor, full_sync_at, properties FROM sync_state WHERE database_id = ?",
+            (database_id,)
+        ).fetchone()
+        return row if row else (None, None, None)
+
+    def _needs_full_sync(self, cursor, full_sync_at, synced_properties, properties):
+        if not cursor or not full_sync_at:
+            return True
+        # Набор свойств снимка поменялся — инкремент не дозаполнит старые страницы
+        if synced_properties != properties:
+            return True
+        try:
+            last_full = datetime.fromisoformat(full_sync_at)
+        except ValueError:
+            return True
+        return datetime.now(timezone.utc) - last_full > timedelta(days=FULL_SYNC_EVERY_DAYS)
+
+    @profiling.hot
+    def sync(self, notion, database_id):
+        """Подтягивает изменения из Notion. Возвращает (режим, кол-во страниц из Notion)."""
+        cursor, full_sync_at, synced_properties = self._state(database_id)
+        # Снимок общий для всех скриптов — в нём все свойства из карты полей
+        ids = notion_query.property_ids(notion, database_id, notion_query.property_names(FIELDS))
+        properties = ",".join(sorted(ids)) if ids else None
+        full = self._needs_full_sync(cursor, full_sync_at, synced_properties, properties)
+
+        query = {"filter_properties": ids} if ids else {}
+        if full:
+            pages = iter_partitioned(notion, database_id, **query)
+        else:
+            # last_edited_time в Notion округлён до минуты, поэтому on_or_after:
+            # страницы той же минуты придут повторно и просто перезапишутся
+            pages = iter_query(notion, database_id, filter={
+                "timestamp": "last_edited_time",
+                "last_edited_time": {"on_or_after": cursor},
+            }, **query)
+
+        # Сначала читаем Notion, потом пишем одной короткой транзакцией:
+        # пока идёт сеть, файл не заблокирован, и параллельные арендаторы
+        # (tenants.run_all) не ждут чужую полную синхронизацию
+        new_cursor = cursor
+        fetched = 0
+        upserts, removed = [], []
+        for page in pages:
+            fetched += 1
+            edited = page.get("last_edited_time", "")
+            if not new_cursor or edited > new_cursor:
+                new_cursor = edited
+            if page.get("archived") or page.get("in_trash"):
+                removed.append((database_id, page["id"]))
+                continue
+            upserts.append((database_id, page["id"], edited,
+                            json.dumps(page["properties"], ensure_ascii=False)))
+        if full:
+            full_sync_at = datetime.now(timezone.utc).isoformat()
+
+        with self.conn:
+            if full:
+                self.conn.execute("DELETE FROM pages WHERE database_id = ?", (database_id,))
+            self.conn.executemany("DELETE FROM pages WHERE database_id = ? AND page_id = ?",
+                                  removed)
+            self.conn.executemany("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)", upserts)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)",
+                (database_id, new_cursor, full_sync_at, properties)
+            )
+
+        return ("full" if full else "incremental"), fetched
+
+    # ── Чтение ────────────────────────────────────────────────────────────────
+    def iter_pages(self, database_id, filter=None, properties=None):
+        """Отдаёт страницы снимка в формате ответа Notion (id + properties).
+        filter (notion_query) и проекция properties (имена свойств)
+        выполняются в SQLite — из JSON разбирается только нужное."""
+        where, where_params = notion_query.to_sql(filter)
+        columns, column_params = notion_query.project_sql(properties)
+        rows = self.conn.execute(
+            f"SELECT page_id, last_edited_time, {columns} FROM pages "
+            f"WHERE database_id = ? AND {where}",
+            (*column_params, database_id, *where_params)
+        )
+        for page_id, edited, properties in rows:
+            yield {
+                "id": page_id,
+                "last_edited_time": edited,
+                "properties": json.loads(properties),
+            }
+
+    def delete(self, database_id, page_id):
+        """Убирает страницу из снимка (например, после архивации из бота)."""
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM pages WHERE database_id = ? AND page_id = ?",
+                (database_id, page_id)
+            )
+
+
+def load_pages(notion, database_id, filter=None, properties=None):
+    """Синхронизирует снимок и отдаёт страницы базы по одной (генератор),
+    чтобы вызывающий мог разобрать страницу и сразу отпустить её JSON.
+    filter — фильтр notion_query, properties — имена нужных свойств.
+    Если снимок отключён (CONTACT_STORE_PATH=""), фильтр и проекция
+    уходят в запрос к Notion."""
+    if not CONTACT_STORE_PATH:
+        query = {}
+        ids = notion_query.property_ids(notion, database_id, properties) if properties else None
+        if ids:
+            query["filter_properties"] = ids
+        yield from iter_partitioned(notion, database_id, filter, **query)
+        return
+
+    store = ContactStore()
+    try:
+        mode, fetched = store.sync(notion, database_id)
+        print(f"  Снимок базы: {mode} синхронизация, из Notion получено {fetched} стр.")
+        yield from store.iter_pages(database_id, filter, properties)
+    finally:
+        store.close()
+
+
+def forget(database_id, page_id):
+    """Убирает архивированную страницу из снимка: инкрементальная
+    синхронизация архивированных страниц не видит, и без этого контакт
+    оставался бы в дайджесте до полной синхронизации."""
+    if not CONTACT_STORE_PATH:
+        return
+    store = ContactStore()
+    try:
+        store.delete(database_id, page_id)
+    finally:
+        store.close()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Social Capital Monitor — контакт и разбор страниц Notion
+Единый компактный тип Contact (__slots__, без __dict__) и экстрактор,
+который один раз компилируется из карты полей и дальше разбирает страницы
+без пересоздания вспомогательных функций. Сырой JSON страницы после
+разбора не хранится.
+"""
+from datetime import date, timedelta
+
+# ── Карта полей ───────────────────────────────────────────────────────────────
+# атрибут Contact -> (свойство Notion, тип свойства)
+FIELDS = {
+    "name":             ("Имя", "title"),
+    "circle":           ("Круг", "select"),
+    "priority":         ("Приоритет", "select"),
+    "last_contact":     ("Последний контакт", "date"),
+    "next_contact":     ("Следующий контакт", "date"),
+    "frequency":        ("Частота контактов дни", "number"),
+    "birthday":         ("ДР", "date"),
+    "tg_personal":      ("Личный TG", "url"),
+    "telegram_channel": ("Telegram канал", "url"),
+    "instagram":        ("Insta", "url"),
+    "youtube":          ("YouTube", "url"),
+    "notes":            ("Заметки", "rich_text"),
+    "news":             ("Новости", "rich_text"),
+    "occupation":       ("Чем занимается", "rich_text"),
+    "goals":            ("Цели", "rich_text"),
+    "manus_command":    ("Команда для Manus", "rich_text"),
+}
+
+
+def field_map(*attrs):
+    """Подмножество FIELDS — только поля, которые читает конкретный скрипт."""
+    return {a: FIELDS[a] for a in attrs}
+
+
+# ── Чтение значений свойств ───────────────────────────────────────────────────
+def _read_title(prop):
+    t = prop.get("title") if prop else None
+    return "".join(r.get("plain_text", "") for r in t) if t else "Без имени"
+
+
+def _read_rich_text(prop):
+    rich = prop.get("rich_text") if prop else None
+    return "".join(r.get("plain_text", "") for r in rich) if rich else ""
+
+
+def _read_select(prop):
+    sel = prop.get("select") if prop else None
+    return sel.get("name") if sel else None
+
+
+def _read_url(prop):
+    return (prop.get("url") or None) if prop else None
+
+
+def _read_date(prop):
+    d = prop.get("date") if prop else None
+    return d.get("start") if d else None
+
+
+def _read_number(prop):
+    return prop.get("number") if prop else None
+
+
+_READERS = {
+    "title": _read_title,
+    "rich_text": _read_rich_text,
+    "select": _read_select,
+    "url": _read_url,
+    "date": _read_date,
+    "number": _read_number,
+}
+
+
+# ── Производные значения ──────────────────────────────────────────────────────
+def compute_next_contact(next_contact, last_contact, frequency):
+    """Дата следующего контакта: явная или «последний контакт + частота»."""
+    if next_contact:
+        try:
+            return date.fromisoformat(next_contact)
+        except ValueError:
+            return None
+    if last_contact and frequency:
+        try:
+            return date.fromisoformat(last_contact) + timedelta(days=int(frequency))
+        except (ValueError, OverflowError):
+            return None
+    return None
+
+
+def tg_username_from_url(url):
+    """Telegram username из ссылки t.me/<username> (приватные +ссылки пропускаем)."""
+    if not url:
+        return None
+    username = None
+    parts = url.rstrip("/").split("/")
+    for i, p in enumerate(parts):
+        if p in ("t.me", "telegram.me") and i + 1 < len(parts):
+            u = parts[i + 1].lstrip("@")
+            if not u.startswith("+"):
+                username = u
+    return username
+
+
+# ── Contact ───────────────────────────────────────────────────────────────────
+class Contact:
+    """Контакт из базы Notion. Поля, не вошедшие в карту экстрактора, равны None."""
+
+    __slots__ = ("page_id",) + tuple(FIELDS) + ("computed_next", "tg_username")
+
+    def __init__(self, page_id):
+        for name in Contact.__slots__:
+            setattr(self, name, None)
+        self.page_id = page_id
+
+    @property
+    def notion_url(self):
+        return f"https://www.notion.so/{self.page_id.replace('-', '')}"
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in Contact.__slots__}
+
+    def __repr__(self):
+        return f"Contact({self.page_id!r}, {self.name!r})"
+
+
+def compile_extractor(fields=FIELDS):
+    """Компилирует карту полей в функцию page -> Contact."""
+    plan = tuple((attr, prop_name, _READERS[kind]) for attr, (prop_name, kind) in fields.items())
+
+    def extract(page):
+        props = page["properties"]
+        c = Contact(page["id"])
+        for attr, prop_name, read in plan:
+            setattr(c, attr, read(props.get(prop_name)))
+        c.computed_next = compute_next_contact(c.next_contact, c.last_contact, c.frequency)
+        c.tg_username = tg_username_from_url(c.tg_personal)
+        return c
+
+    return extract
@@ -10,22 +10,24 @@ Social Capital Monitor — Скрипт 2: Дайджест
   4. ❓ Обновление базы (контакты без данных, высокий приоритет, до 3 в день)
 """
 
-import os
 import json
-import time
-import requests
+import http_client
+import metrics
+import profiling
+import tracing
+import tenants
 from datetime import datetime, timedelta, date
-from notion_client import Client
+from notion_writer import date_value
+from contact_store import load_pages, forget
+from notion_query import select_in, is_not_empty, any_of, property_names
+from contacts import compile_extractor, field_map
+from prioritize import select_digest
 
 # ── Конфигурация ──────────────────────────────────────────────────────────────
-NOTION_TOKEN       = os.environ["NOTION_TOKEN"]
-NOTION_DATABASE_ID = os.environ["NOTION_DATABASE_ID"]
-TELEGRAM_BOT_TOKEN = os.environ["TELEGRAM_BOT_TOKEN"]
-TELEGRAM_CHAT_ID   = os.environ["TELEGRAM_CHAT_ID"]
+# База, чат и токены — у арендатора (tenants.py): по умолчанию один,
+# из NOTION_TOKEN, NOTION_DATABASE_ID, TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID
 
-TG_API = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
-
-# Категории, которые включаем в дайджест
+# Категории, которые включаем в дайджест (арендатор может задать свои)
 ACTIVE_CIRCLES = {
     "Клиент активный",
     "Клиент бывший",
@@ -35,36 +37,38 @@ ACTIVE_CIRCLES = {
     "Зона развития",
 }
 
-MAX_DUE_CONTACTS   = 5   # Максимум в блоке «Пора связаться»
-MAX_EMPTY_PER_DAY  = 3   # Максимум в блоке «Обновление базы»
+MAX_DUE_CONTACTS   = 5   # Максимум в блоке «Пора связаться» (limits.max_due_contacts)
+MAX_EMPTY_PER_DAY  = 3   # Максимум в блоке «Обновление базы» (limits.max_empty_per_day)
 DIGEST_DAYS_BEFORE = 6   # За сколько дней до срока показываем
 
 
 # ── Telegram helpers ──────────────────────────────────────────────────────────
 def tg_send(text, reply_markup=None, parse_mode="HTML"):
-    payload = {
-        "chat_id": TELEGRAM_CHAT_ID,
-        "text": text,
-        "parse_mode": parse_mode,
-        "disable_web_page_preview": True,
-    }
-    if reply_markup:
-        payload["reply_markup"] = json.dumps(reply_markup)
-    resp = requests.post(f"{TG_API}/sendMessage", json=payload, timeout=15)
-    return resp.json()
+    """Ставит сообщение в очередь доставки; уходит оно при flush_outbox()."""
+    tenant = tenants.current()
+    return tenant.outbox.send_message(tenant.chat_id, text, reply_markup, parse_mode)
+
+
+def flush_outbox():
+    """Отправляет очередь с темпом по лимитам Telegram и печатает отчёт."""
+    report = tenants.current().outbox.flush()
+    print(f"  Telegram: {report.summary()}")
+    for d in report.failed:
+        print(f"  ✗ не доставлено: {d.error}")
+    return report
 
 
 def tg_get_updates(offset=None):
     params = {"timeout": 5, "limit": 100}
     if offset:
         params["offset"] = offset
-    resp = requests.get(f"{TG_API}/getUpdates", params=params, timeout=15)
+    resp = http_client.get(f"{tenants.current().tg_api}/getUpdates", params=params, timeout=15)
     return resp.json().get("result", [])
 
 
 def tg_answer_callback(callback_query_id, text="", show_alert=False):
     """Показывает toast-уведомление при нажатии кнопки."""
-    requests.post(f"{TG_API}/answerCallbackQuery", json={
+    http_client.post(f"{tenants.current().tg_api}/answerCallbackQuery", json={
         "callback_query_id": callback_query_id,
         "text": text,
         "show_alert": show_alert,
@@ -73,13 +77,14 @@ def tg_answer_callback(callback_query_id, text="", show_alert=False):
 
 def tg_edit_message(chat_id, message_id, text, parse_mode="HTML", remove_keyboard=True):
     """Редактирует сообщение и опционально убирает кнопки."""
+    tg_api = tenants.current().tg_api
     if remove_keyboard:
-        requests.post(f"{TG_API}/editMessageReplyMarkup", json={
+        http_client.post(f"{tg_api}/editMessageReplyMarkup", json={
             "chat_id": chat_id,
             "message_id": message_id,
             "reply_markup": json.dumps({"inline_keyboard": []})
         }, timeout=10)
-    requests.post(f"{TG_API}/editMessageText", json={
+    http_client.post(f"{tg_api}/editMessageText", json={
         "chat_id": chat_id,
         "message_id": message_id,
         "text": text,
@@ -89,124 +94,48 @@ def tg_edit_message(chat_id, message_id, text, parse_mode="HTML", remove_keyboar
 
 
 # ── Notion helpers ─────────────────────────────────────────────────────────────
-notion = Client(auth=NOTION_TOKEN)
+DIGEST_FIELDS = field_map(
+    "name", "circle", "priority", "last_contact", "next_contact", "frequency",
+    "birthday", "tg_personal", "telegram_channel", "instagram", "notes", "news",
+    "occupation",
+)
+
+
+def contacts_filter(circles):
+    """Активные круги — для сроков и «Обновления базы»; дни рождения — из любого круга."""
+    return any_of(select_in("circle", circles), is_not_empty("birthday"))
 
 
 def get_all_contacts():
-    """Читает все контакты из Notion."""
-    all_pages = []
-    cursor = None
-    while True:
-        kwargs = {"database_id": NOTION_DATABASE_ID, "page_size": 100}
-        if cursor:
-            kwargs["start_cursor"] = cursor
-        resp = notion.databases.query(**kwargs)
-        all_pages.extend(resp["results"])
-        if not resp.get("has_more"):
-            break
-        cursor = resp["next_cursor"]
-    return all_pages
+    """Читает контакты для дайджеста из Notion (через локальный снимок базы)."""
+    tenant = tenants.current()
+    query = contacts_filter(tenant.circles_or(ACTIVE_CIRCLES))
+    return load_pages(tenant.notion, tenant.database_id, query, property_names(DIGEST_FIELDS))
 
 
-def parse_contact(page):
-    """Парсит страницу Notion в словарь контакта."""
-    props = page["properties"]
-
-    def get_url(field):
-        v = props.get(field, {}).get("url")
-        return v if v else None
-
-    def get_text(field):
-        rich = props.get(field, {}).get("rich_text", [])
-        return "".join(r.get("plain_text", "") for r in rich) if rich else ""
-
-    def get_title():
-        t = props.get("Имя", {}).get("title", [])
-        return "".join(r.get("plain_text", "") for r in t) if t else "Без имени"
-
-    def get_date_val(field):
-        d = props.get(field, {}).get("date")
-        return d.get("start") if d else None
-
-    def get_select(field):
-        sel = props.get(field, {}).get("select")
-        return sel.get("name") if sel else None
-
-    circle = get_select("Круг")
-    priority = get_select("Приоритет")
-    last_contact_str = get_date_val("Последний контакт")
-    next_contact_str = get_date_val("Следующий контакт")
-    frequency = props.get("Частота контактов дни", {}).get("number")
-
-    # Вычисляем дату следующего контакта
-    computed_next = None
-    if next_contact_str:
-        try:
-            computed_next = date.fromisoformat(next_contact_str)
-        except Exception:
-            pass
-    elif last_contact_str and frequency:
-        try:
-            last_dt = date.fromisoformat(last_contact_str)
-            computed_next = last_dt + timedelta(days=int(frequency))
-        except Exception:
-            pass
-
-    # Telegram username из поля «Личный TG»
-    tg_personal = get_url("Личный TG")
-    tg_username = None
-    if tg_personal:
-        parts = tg_personal.rstrip("/").split("/")
-        for i, p in enumerate(parts):
-            if p in ("t.me", "telegram.me") and i + 1 < len(parts):
-                u = parts[i + 1].lstrip("@")
-                if not u.startswith("+"):
-                    tg_username = u
-
-    # Поле «Новости» (заполняется ботом из мониторинга)
-    news = get_text("Новости")
-    # Поле «Чем занимается»
-    occupation = get_text("Чем занимается")
+_extract_contact = compile_extractor(DIGEST_FIELDS)
 
-    return {
-        "page_id": page["id"],
-        "name": get_title(),
-        "circle": circle,
-        "priority": priority,
-        "last_contact": last_contact_str,
-        "next_contact": next_contact_str,
-        "computed_next": computed_next,
-        "frequency": frequency,
-        "tg_personal": tg_personal,
-        "tg_username": tg_username,
-        "telegram_channel": get_url("Telegram канал"),
-        "instagram": get_url("Insta"),
-        "birthday": get_date_val("ДР"),
-        "notes": get_text("Заметки"),
-        "news": news,
-        "occupation": occupation,
-        "notion_url": f"https://www.notion.so/{page['id'].replace('-', '')}",
-    }
+
+@profiling.hot
+def parse_contact(page):
+    """Парсит страницу Notion в Contact (computed_next и tg_username вычисляются сразу)."""
+    return _extract_contact(page)
 
 
 def update_last_contact(page_id, contact_date=None):
     if not contact_date:
         contact_date = date.today().isoformat()
-    notion.pages.update(
-        page_id=page_id,
-        properties={"Последний контакт": {"date": {"start": contact_date}}}
-    )
+    tenants.current().writer.write(page_id, {"Последний контакт": date_value(contact_date)})
 
 
 def update_next_contact(page_id, next_date):
-    notion.pages.update(
-        page_id=page_id,
-        properties={"Следующий контакт": {"date": {"start": next_date}}}
-    )
+    tenants.current().writer.write(page_id, {"Следующий контакт": date_value(next_date)})
 
 
 def delete_contact(page_id):
-    notion.pages.update(page_id=page_id, archived=True)
+    tenant = tenants.current()
+    tenant.writer.archive(page_id)
+    forget(tenant.database_id, page_id)
 
 
 def update_last_contact_approx(page_id, when):
@@ -225,19 +154,19 @@ def build_contact_card(c):
     """Формирует текст карточки контакта для блока «Пора связаться»."""
     today = date.today()
 
-    priority_emoji = {"Высокий": "🔴", "Средний": "🟡", "Низкий": "🟢"}.get(c["priority"], "⚪")
+    priority_emoji = {"Высокий": "🔴", "Средний": "🟡", "Низкий": "🟢"}.get(c.priority, "⚪")
 
     # Имя — активная ссылка на личный TG если есть
-    if c["tg_username"]:
-        name_link = f'<a href="https://t.me/{c["tg_username"]}">{c["name"]}</a>'
+    if c.tg_username:
+        name_link = f'<a href="https://t.me/{c.tg_username}">{c.name}</a>'
     else:
-        name_link = f'<b>{c["name"]}</b>'
+        name_link = f'<b>{c.name}</b>'
 
-    lines = [f'{priority_emoji} {name_link} · {c["circle"]}']
+    lines = [f'{priority_emoji} {name_link} · {c.circle}']
 
     # Срок
-    if c["computed_next"]:
-        delta = (today - c["computed_next"]).days
+    if c.computed_next:
+        delta = (today - c.computed_next).days
         if delta > 0:
             lines.append(f"📅 Просрочено на {delta} дн.")
         elif delta == 0:
@@ -248,12 +177,12 @@ def build_contact_card(c):
         lines.append("📅 Дата неизвестна")
 
     # Чем занимается
-    if c["occupation"]:
-        lines.append(f"💼 {c['occupation']}")
+    if c.occupation:
+        lines.append(f"💼 {c.occupation}")
 
     # Новости из мониторинга (до 3 строк)
-    if c["news"]:
-        news_lines = [l.strip() for l in c["news"].split("\n") if l.strip()]
+    if c.news:
+        news_lines = [l.strip() for l in c.news.split("\n") if l.strip()]
         if news_lines:
             lines.append("")
             lines.append("📌 <b>Последнее:</b>")
@@ -261,10 +190,10 @@ def build_contact_card(c):
 
     # Контакты
     lines.append("")
-    if c["tg_username"]:
-        lines.append(f'✈️ <a href="https://t.me/{c["tg_username"]}">Написать в Telegram</a>')
-    if c["instagram"]:
-        ig_url = c["instagram"]
+    if c.tg_username:
+        lines.append(f'✈️ <a href="https://t.me/{c.tg_username}">Написать в Telegram</a>')
+    if c.instagram:
+        ig_url = c.instagram
         ig_handle = ig_url.rstrip("/").split("/")[-1].lstrip("@")
         lines.append(f'📸 <a href="{ig_url}">@{ig_handle}</a> в Instagram')
 
@@ -273,7 +202,7 @@ def build_contact_card(c):
 
 def build_keyboard_normal(c):
     """Клавиатура для блока «Пора связаться»."""
-    page_id = c["page_id"]
+    page_id = c.page_id
     notion_url = f"https://www.notion.so/{page_id.replace('-', '')}"
     row1 = [{"text": "✅ Связался", "callback_data": f"done|{page_id}"}]
     row2 = [
@@ -286,7 +215,7 @@ def build_keyboard_normal(c):
 
 def build_keyboard_empty(c):
     """Клавиатура для блока «Обновление базы»."""
-    page_id = c["page_id"]
+    page_id = c.page_id
     return {
         "inline_keyboard": [
             [
@@ -375,7 +304,7 @@ def process_callbacks():
 
     # Подтверждаем обработку обновлений
     if last_update_id:
-        requests.get(f"{TG_API}/getUpdates",
+        http_client.get(f"{tenants.current().tg_api}/getUpdates",
                      params={"offset": last_update_id + 1, "limit": 1}, timeout=10)
 
 
@@ -387,81 +316,58 @@ def build_news_feed(due_contacts):
     """
     news_items = []
     for c in due_contacts:
-        if not c["news"]:
+        if not c.news:
             continue
-        lines = [l.strip() for l in c["news"].split("\n") if l.strip()]
+        lines = [l.strip() for l in c.news.split("\n") if l.strip()]
         if not lines:
             continue
         # Берём первую строку как самое свежее событие
         first_line = lines[0]
         # Имя — ссылка на TG если есть
-        if c["tg_username"]:
-            name_link = f'<a href="https://t.me/{c["tg_username"]}">{c["name"]}</a>'
+        if c.tg_username:
+            name_link = f'<a href="https://t.me/{c.tg_username}">{c.name}</a>'
         else:
-            name_link = f'<b>{c["name"]}</b>'
+            name_link = f'<b>{c.name}</b>'
         news_items.append(f"• {name_link} — {first_line}")
 
     return news_items
 
 
 # ── Главная функция ───────────────────────────────────────────────────────────
-def main():
-    print(f"[{datetime.now().isoformat()}] Запуск дайджеста...")
+def send_digest(tenant):
+    """Дайджест одного арендатора: его база, круги, лимиты и чат."""
+    circles = tenant.circles_or(ACTIVE_CIRCLES)
+    max_due = tenant.limit("max_due_contacts", MAX_DUE_CONTACTS)
+    max_empty = tenant.limit("max_empty_per_day", MAX_EMPTY_PER_DAY)
 
     # Читаем базу
-    print("  Читаем базу Notion...")
+    print(f"  Читаем базу Notion ({tenant.name})...")
     all_pages = get_all_contacts()
     contacts = [parse_contact(p) for p in all_pages]
     print(f"  Всего контактов: {len(contacts)}")
+    metrics.incr("contacts.total", len(contacts))
 
     today = date.today()
-    cutoff = today + timedelta(days=DIGEST_DAYS_BEFORE)
-
-    # Фильтруем контакты
-    due_contacts   = []  # Срок подошёл
-    empty_contacts = []  # Нет данных, высокий приоритет
 
-    for c in contacts:
-        if c["circle"] not in ACTIVE_CIRCLES:
-            continue
-        if c["computed_next"] and c["computed_next"] <= cutoff:
-            due_contacts.append(c)
-        elif not c["last_contact"] and not c["next_contact"] and c["priority"] == "Высокий":
-            empty_contacts.append(c)
-
-    # Сортируем: сначала самые просроченные, потом по приоритету
-    priority_order = {"Высокий": 0, "Средний": 1, "Низкий": 2}
-    due_contacts.sort(key=lambda x: (
-        x["computed_next"] or date.max,
-        priority_order.get(x["priority"], 9)
-    ))
-
-    # Ограничиваем до MAX_DUE_CONTACTS
-    due_contacts_display = due_contacts[:MAX_DUE_CONTACTS]
-    due_total = len(due_contacts)
+    # Отбор векторно (prioritize.py): срок подошёл — топ max_due
+    # самых просроченных (при равенстве — по приоритету); нет данных при
+    # высоком приоритете — блок «Обновление базы»; ДР в ближайшие 14 дней
+    with metrics.stage("select"):
+        due_contacts_display, due_total, empty_contacts, birthdays = select_digest(
+            contacts, today, circles, DIGEST_DAYS_BEFORE, max_due)
 
     print(f"  Контактов в дайджесте: {due_total} (показываем {len(due_contacts_display)})")
     print(f"  Контактов без данных (высокий приоритет): {len(empty_contacts)}")
+    metrics.incr("contacts.due", due_total)
+    metrics.incr("contacts.empty", len(empty_contacts))
 
-    # Проверяем дни рождения
-    birthday_alerts = []
-    for c in contacts:
-        if not c["birthday"]:
-            continue
-        try:
-            bday = date.fromisoformat(c["birthday"])
-            bday_this_year = bday.replace(year=today.year)
-            if bday_this_year < today:
-                bday_this_year = bday_this_year.replace(year=today.year + 1)
-            days_until = (bday_this_year - today).days
-            if 0 <= days_until <= 14:
-                birthday_alerts.append((c["name"], days_until, bday_this_year, c.get("tg_username")))
-        except Exception:
-            pass
+    birthday_alerts = [(c.name, days, bday, c.tg_username) for c, days, bday in birthdays]
+    metrics.incr("contacts.birthdays", len(birthday_alerts))
 
     # Если нечего отправлять
-    if not due_contacts and not empty_contacts and not birthday_alerts:
+    if not due_total and not empty_contacts and not birthday_alerts:
         tg_send("☀️ <b>Доброе утро!</b>\n\nСегодня нет контактов, требующих внимания. Хороший день!")
+        flush_outbox()
         print("  Нет контактов для дайджеста")
         return
 
@@ -488,42 +394,48 @@ def main():
         header_lines.extend(news_items)
 
     # ── Блок 3: Сводка «Пора связаться» ───────────────────────────────────────
-    if due_contacts:
+    if due_total:
         header_lines.append("")
         header_lines.append("━━━ 📞 <b>ПОРА СВЯЗАТЬСЯ</b> ━━━")
-        if due_total > MAX_DUE_CONTACTS:
-            header_lines.append(f"<i>Показываю {MAX_DUE_CONTACTS} из {due_total} — самые горячие</i>")
+        if due_total > max_due:
+            header_lines.append(f"<i>Показываю {max_due} из {due_total} — самые горячие</i>")
 
     tg_send("\n".join(header_lines))
-    time.sleep(0.5)
 
     # Карточки контактов
     for c in due_contacts_display:
         card_text = build_contact_card(c)
         keyboard  = build_keyboard_normal(c)
         tg_send(card_text, reply_markup=keyboard)
-        time.sleep(0.3)
 
     # ── Блок 4: Обновление базы ────────────────────────────────────────────────
     if empty_contacts:
-        time.sleep(0.5)
         tg_send(
             f"━━━ ❓ <b>ОБНОВЛЕНИЕ БАЗЫ</b> ━━━\n"
             f"Нет данных по {len(empty_contacts)} контактам с высоким приоритетом.\n"
             f"<i>Когда последний раз общались?</i>"
         )
-        for c in empty_contacts[:MAX_EMPTY_PER_DAY]:
-            if c["tg_username"]:
-                name_link = f'<a href="https://t.me/{c["tg_username"]}">{c["name"]}</a>'
+        for c in empty_contacts[:max_empty]:
+            if c.tg_username:
+                name_link = f'<a href="https://t.me/{c.tg_username}">{c.name}</a>'
             else:
-                name_link = f'<b>{c["name"]}</b>'
-            card_text = f"👤 {name_link} · {c['circle']}\n📅 Дата последнего контакта неизвестна"
+                name_link = f'<b>{c.name}</b>'
+            card_text = f"👤 {name_link} · {c.circle}\n📅 Дата последнего контакта неизвестна"
             keyboard  = build_keyboard_empty(c)
             tg_send(card_text, reply_markup=keyboard)
-            time.sleep(0.3)
 
-    print(f"[{datetime.now().isoformat()}] Дайджест отправлен")
+    flush_outbox()
+    print(f"[{datetime.now().isoformat()}] Дайджест отправлен ({tenant.name})")
+
+
+def main():
+    print(f"[{datetime.now().isoformat()}] Запуск дайджеста...")
+    # Арендаторы — параллельно: у каждого своя база, чат и темп Telegram.
+    # Упавший арендатор не мешает остальным, но запуск завершается с ошибкой
+    _, failed = tenants.run_all(send_digest)
+    tenants.check(failed)
 
 
 if __name__ == "__main__":
-    main()
+    with metrics.run("digest"), profiling.session("digest"), tracing.session("digest"):
+        main()
@@ -4,20 +4,30 @@ Social Capital Monitor — Скрипт 3: Обогащение контакто
 Однократно заполняет поле «Чем занимается» для контактов с пустым полем,
 используя bio из Telegram-профиля и/или описание канала.
 Запускается вручную или раз в месяц через GitHub Actions.
+Контакты всех арендаторов (tenants.py) обрабатываются вперемешку, по кругу.
+С --resume продолжает прерванный запуск по журналу прогресса (journal.py).
 """
-import os
 import re
-import time
-import requests
+import argparse
+import http_client
+import metrics
+import profiling
+import tracing
+import tenants
+import journal
 from datetime import datetime
-from notion_client import Client
+from notion_writer import rich_text
+from contact_store import load_pages
+from notion_query import select_in, is_not_empty, all_of, any_of, property_names
+from contacts import compile_extractor, field_map
+from html_extract import Select, extract, select_first_text
 from gemini import generate_with_retry
 
 # ── Конфигурация ──────────────────────────────────────────────────────────────
-NOTION_TOKEN       = os.environ["NOTION_TOKEN"]
-NOTION_DATABASE_ID = os.environ["NOTION_DATABASE_ID"]
+# База и токен — у арендатора (tenants.py); limits.max_contacts — сколько
+# контактов арендатора обогащать за запуск
 
-# Категории, которые обогащаем
+# Категории, которые обогащаем (арендатор может задать свои)
 ENRICHED_CIRCLES = {
     "Клиент активный",
     "Клиент бывший",
@@ -29,78 +39,47 @@ ENRICHED_CIRCLES = {
 
 
 # ── Notion helpers ─────────────────────────────────────────────────────────────
-def get_contacts_to_enrich():
-    """Возвращает контакты с пустым полем «Чем занимается»."""
-    notion = Client(auth=NOTION_TOKEN)
-
-    all_pages = []
-    cursor = None
-    while True:
-        kwargs = {"database_id": NOTION_DATABASE_ID, "page_size": 100}
-        if cursor:
-            kwargs["start_cursor"] = cursor
-        resp = notion.databases.query(**kwargs)
-        all_pages.extend(resp["results"])
-        if not resp.get("has_more"):
-            break
-        cursor = resp["next_cursor"]
-
-    contacts = []
-    for page in all_pages:
-        props = page["properties"]
-
-        # Фильтр по кругу
-        circle_sel = props.get("Круг", {}).get("select")
-        if not circle_sel or circle_sel.get("name") not in ENRICHED_CIRCLES:
-            continue
-
-        def get_url(field):
-            v = props.get(field, {}).get("url")
-            return v if v else None
-
-        def get_text(field):
-            rich = props.get(field, {}).get("rich_text", [])
-            return "".join(r.get("plain_text", "") for r in rich) if rich else ""
-
-        def get_title():
-            t = props.get("Имя", {}).get("title", [])
-            return "".join(r.get("plain_text", "") for r in t) if t else "Без имени"
+_FIELDS = field_map(
+    "name", "circle", "occupation", "tg_personal", "telegram_channel",
+)
+_extract_contact = compile_extractor(_FIELDS)
+
+
+def contacts_filter(circles):
+    """Нужный круг и хотя бы один Telegram-источник. Пустоту «Чем занимается»
+    проверяет get_contacts_to_enrich: поле из одних пробелов для Notion
+    (и для is_empty) не пустое, а обогащать его нужно."""
+    return all_of(
+        select_in("circle", circles),
+        any_of(is_not_empty("tg_personal"), is_not_empty("telegram_channel")),
+    )
 
-        name = get_title()
-        occupation = get_text("Чем занимается")
 
-        # Пропускаем если поле уже заполнено
-        if occupation.strip():
-            continue
+def get_contacts_to_enrich(tenant):
+    """Возвращает контакты арендатора с пустым полем «Чем занимается»."""
+    query = contacts_filter(tenant.circles_or(ENRICHED_CIRCLES))
+    limit = tenant.limit("max_contacts", None)
 
-        tg_personal = get_url("Личный TG")
-        tg_channel = get_url("Telegram канал")
+    contacts = []
+    pages = load_pages(tenant.notion, tenant.database_id, query, property_names(_FIELDS))
+    for page in pages:
+        c = _extract_contact(page)
 
-        # Нужен хотя бы один Telegram-источник
-        if not tg_personal and not tg_channel:
+        # Поле из одних пробелов для Notion не пустое — считаем его пустым
+        if c.occupation.strip():
             continue
 
-        contacts.append({
-            "page_id": page["id"],
-            "name": name,
-            "tg_personal": tg_personal,
-            "tg_channel": tg_channel,
-        })
+        tenant.own(c.page_id)
+        contacts.append(c)
+        if limit and len(contacts) >= limit:
+            break
 
     return contacts
 
 
 def update_occupation(page_id, occupation):
-    """Обновляет поле «Чем занимается» в Notion."""
-    notion = Client(auth=NOTION_TOKEN)
-    notion.pages.update(
-        page_id=page_id,
-        properties={
-            "Чем занимается": {
-                "rich_text": [{"type": "text", "text": {"content": occupation[:2000]}}]
-            }
-        }
-    )
+    """Обновляет поле «Чем занимается» в Notion (в базе арендатора контакта)."""
+    tenants.owner(page_id).writer.write(page_id, {"Чем занимается": rich_text(occupation)})
 
 
 # ── Парсинг Telegram ──────────────────────────────────────────────────────────
@@ -118,6 +97,7 @@ def extract_tg_username(url):
     return None
 
 
+@profiling.hot
 def get_telegram_bio(username):
     """Получает bio из публичного Telegram-профиля через t.me."""
     if not username:
@@ -127,23 +107,18 @@ def get_telegram_bio(username):
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
             "Accept-Language": "ru-RU,ru;q=0.9,en;q=0.8",
         }
-        url = f"https://t.me/{username}"
-        resp = requests.get(url, headers=headers, timeout=15)
+        url = f"{http_client.TELEGRAM_WEB_BASE}/{username}"
+        resp = http_client.get(url, headers=headers, timeout=15)
         if resp.status_code != 200:
             return ""
-        from bs4 import BeautifulSoup
-        soup = BeautifulSoup(resp.text, "html.parser")
-
         # Bio в профиле
-        bio_tag = soup.select_one(".tgme_page_description")
-        if bio_tag:
-            return bio_tag.get_text(separator=" ", strip=True)
-        return ""
+        return select_first_text(resp.text, "tgme_page_description", " ")
     except Exception as e:
         print(f"  Telegram bio error @{username}: {e}")
         return ""
 
 
+@profiling.hot
 def get_telegram_channel_description(channel):
     """Получает описание и последние посты из публичного Telegram-канала."""
     if not channel:
@@ -152,21 +127,19 @@ def get_telegram_channel_description(channel):
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
         }
-        url = f"https://t.me/s/{channel}"
-        resp = requests.get(url, headers=headers, timeout=15)
+        url = f"{http_client.TELEGRAM_WEB_BASE}/s/{channel}"
+        resp = http_client.get(url, headers=headers, timeout=15)
         if resp.status_code != 200:
             return "", []
-        from bs4 import BeautifulSoup
-        soup = BeautifulSoup(resp.text, "html.parser")
-
-        # Описание канала
-        desc_tag = soup.select_one(".tgme_channel_info_description")
-        description = desc_tag.get_text(separator=" ", strip=True) if desc_tag else ""
+        # Описание канала и последние 3 поста для контекста — за один проход
+        found = extract(resp.text, {
+            "description": Select("tgme_channel_info_description", " ", limit=1),
+            "posts": Select("tgme_widget_message_text", " ", limit=3),
+        })
+        description = found["description"][0] if found["description"] else ""
 
-        # Последние 3 поста для контекста
         posts = []
-        for msg in soup.select(".tgme_widget_message_text")[:3]:
-            text = msg.get_text(separator=" ", strip=True)
+        for text in found["posts"]:
             if text and len(text) > 20:
                 posts.append(text[:400])
 
@@ -193,6 +166,7 @@ def clean_bio_regex(bio_text):
 
 
 # ── AI-обогащение через Gemini ────────────────────────────────────────────────
+@profiling.hot
 def generate_occupation(name, bio, channel_desc, sample_posts):
     """Генерирует описание «Чем занимается» через Gemini."""
     context_parts = []
@@ -231,63 +205,118 @@ def generate_occupation(name, bio, channel_desc, sample_posts):
     return result
 
 
-# ── Главная функция ───────────────────────────────────────────────────────────
-def main():
-    print(f"[{datetime.now().isoformat()}] Запуск обогащения контактов...")
-
-    contacts = get_contacts_to_enrich()
-    print(f"  Контактов с пустым «Чем занимается»: {len(contacts)}")
-
-    if not contacts:
-        print("  Все контакты уже заполнены, выходим.")
-        return
-
-    enriched = 0
-    for c in contacts:
-        name = c["name"]
-        print(f"\n  → {name}")
-
-        bio = ""
-        channel_desc = ""
-        sample_posts = []
+# ── Обработка контакта ────────────────────────────────────────────────────────
+def scrape_contact(c):
+    """Bio личного профиля и описание с постами канала."""
+    bio = ""
+    channel_desc = ""
+    sample_posts = []
 
+    with metrics.stage("scrape"):
         # Парсим личный профиль
-        tg_username = extract_tg_username(c.get("tg_personal"))
+        tg_username = extract_tg_username(c.tg_personal)
         if tg_username:
-            bio = get_telegram_bio(tg_username)
+            with tracing.span("telegram bio", cat="source", account=tg_username):
+                bio = get_telegram_bio(tg_username)
             if bio:
                 print(f"    Bio: {bio[:80]}...")
             else:
                 print(f"    Bio: не найдено")
 
         # Парсим канал
-        tg_channel = extract_tg_username(c.get("tg_channel"))
+        tg_channel = extract_tg_username(c.telegram_channel)
         if tg_channel:
-            channel_desc, sample_posts = get_telegram_channel_description(tg_channel)
+            with tracing.span("telegram channel", cat="source", channel=tg_channel):
+                channel_desc, sample_posts = get_telegram_channel_description(tg_channel)
             if channel_desc:
                 print(f"    Описание канала: {channel_desc[:80]}...")
 
-        # Пробуем AI
-        occupation = generate_occupation(name, bio, channel_desc, sample_posts)
+    return {"bio": bio, "channel_desc": channel_desc, "sample_posts": sample_posts}
 
-        # Fallback: regex-очистка bio
-        if not occupation and bio:
-            occupation = clean_bio_regex(bio)
-            if occupation:
-                print(f"    Использован regex-fallback")
 
+def determine_occupation(c, progress):
+    """Занятие контакта или None. Пройденные стадии берутся из журнала
+    прерванного запуска, новые — записываются в него."""
+    occupation = progress.payload(c.page_id, "generate")
+    if occupation is not None:
+        print(f"    Занятие из прерванного запуска")
+        metrics.incr("contacts.resumed")
+        return occupation
+
+    scraped = progress.payload(c.page_id, "scrape")
+    if scraped is None:
+        scraped = scrape_contact(c)
+        progress.record(c.page_id, "scrape", scraped)
+    bio = scraped["bio"]
+
+    # Пробуем AI
+    occupation = generate_occupation(c.name, bio, scraped["channel_desc"], scraped["sample_posts"])
+
+    # Fallback: regex-очистка bio
+    if not occupation and bio:
+        occupation = clean_bio_regex(bio)
         if occupation:
-            update_occupation(c["page_id"], occupation)
-            print(f"    ✓ Записано: {occupation}")
-            enriched += 1
-        else:
-            print(f"    ✗ Не удалось определить занятие")
+            print(f"    Использован regex-fallback")
+            metrics.incr("contacts.regex_fallback")
+
+    if occupation:
+        progress.record(c.page_id, "generate", occupation)
+    return occupation
+
+
+# ── Главная функция ───────────────────────────────────────────────────────────
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Обогащение контактов: «Чем занимается»")
+    parser.add_argument("--resume", action="store_true",
+                        help="продолжить последний запуск: пропустить обработанные контакты")
+    args = parser.parse_args(argv)
+
+    print(f"[{datetime.now().isoformat()}] Запуск обогащения контактов...")
 
-        # Пауза между запросами (rate limiting)
-        time.sleep(3)
+    # Контакты арендаторов — по кругу, чтобы все продвигались одновременно
+    # Упавший арендатор не останавливает остальных; запуск — с ошибкой в конце
+    per_tenant, failed = tenants.run_all(get_contacts_to_enrich)
+    contacts = list(tenants.interleave(per_tenant.values()))
+    print(f"  Контактов с пустым «Чем занимается»: {len(contacts)}")
+
+    progress = journal.start("enrich_contacts", resume=args.resume)
+    if progress.resumed:
+        remaining = progress.pending(contacts)
+        print(f"  Уже обработано: {len(contacts) - len(remaining)}, осталось: {len(remaining)}")
+        metrics.incr("contacts.already_done", len(contacts) - len(remaining))
+        contacts = remaining
+    metrics.incr("contacts.total", len(contacts))
+
+    if not contacts:
+        print("  Все контакты уже заполнены, выходим.")
+        tenants.check(failed)
+        return
+
+    enriched = 0
+    for c in contacts:
+        name = c.name
+        print(f"\n  → {name}")
+
+        with tracing.span("contact", contact=name):
+            occupation = determine_occupation(c, progress)
+
+            if occupation:
+                update_occupation(c.page_id, occupation)
+                progress.finish(c.page_id, "enriched")
+                print(f"    ✓ Записано: {occupation}")
+                enriched += 1
+                metrics.incr("contacts.enriched")
+            else:
+                # Провал: при --resume контакт пробуем заново, с нуля
+                progress.fail(c.page_id, "generate", "занятие не определено")
+                print(f"    ✗ Не удалось определить занятие")
+                metrics.incr("contacts.failed")
 
     print(f"\n[{datetime.now().isoformat()}] Обогащение завершено. Обновлено: {enriched}/{len(contacts)}")
+    tenants.check(failed)
 
 
 if __name__ == "__main__":
-    main()
+    with metrics.run("enrich_contacts"), profiling.session("enrich_contacts"), \
+            tracing.session("enrich_contacts"):
+        main()
@@ -1,51 +1,341 @@
 #!/usr/bin/env python3
 """
-Gemini API client with exponential backoff and fallback.
+Gemini API client with quota-aware pacing and model fallback.
+Requests are paced by a process-wide token bucket (requests and tokens per
+minute) and follow server retry hints. When the primary model is throttled
+or slow, the next model from GEMINI_MODELS takes over.
+Responses are kept in a disk-backed cache, so reruns of the same prompts
+(failed workflows, manual dispatches) don't spend quota again.
 """
 import os
+import json
 import time
+import sqlite3
+import hashlib
+import threading
 import requests
+import http_client
+import metrics
+import tracing
+from ratelimit import RateLimiter, TokenBucket, parse_retry_after
 
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
 
-def generate_with_retry(prompt, max_retries=5, initial_delay=2):
-    """Generates content using Gemini with exponential backoff for rate limiting."""
+# Ordered by preference: the first model is used unless it is throttled or slow
+MODELS = [m.strip() for m in os.environ.get(
+    "GEMINI_MODELS", "gemini-flash-latest,gemini-flash-lite-latest").split(",") if m.strip()]
+GENERATION_CONFIG = {"maxOutputTokens": 500, "temperature": 0.3}
+
+# Per-model quota (free tier defaults) and pacing
+RPM             = float(os.environ.get("GEMINI_RPM", "10"))
+TPM             = float(os.environ.get("GEMINI_TPM", "250000"))
+REQUEST_TIMEOUT = 45
+SWITCH_AFTER    = 5.0    # seconds of expected wait before trying the next model
+SLOW_COOLDOWN   = 60.0   # a model that timed out is skipped for this long
+MAX_WAIT        = float(os.environ.get("GEMINI_MAX_WAIT", "120"))  # per-prompt budget for waits and timeouts
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Empty path disables the cache
+CACHE_PATH      = os.environ.get("GEMINI_CACHE_PATH", ".cache/gemini.sqlite")
+CACHE_TTL       = float(os.environ.get("GEMINI_CACHE_TTL_HOURS", "20")) * 3600
+CACHE_MAX_BYTES = int(float(os.environ.get("GEMINI_CACHE_MAX_MB", "50")) * 1024 * 1024)
+
+
+def cache_key(model, generation_config, prompt):
+    """Key of a cached response: model, generation config and prompt."""
+    config = json.dumps(generation_config, sort_keys=True)
+    return hashlib.sha256(f"{model}\n{config}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite cache of Gemini responses with TTL and size-based LRU eviction."""
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key         TEXT PRIMARY KEY,
+                response    TEXT NOT NULL,
+                size        INTEGER NOT NULL,
+                created_at  REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+            response, created_at = row
+            if now - created_at > self.ttl:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            return response
+
+    def put(self, key, response):
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now)
+            )
+            self.conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            self._evict()
+
+    def _evict(self):
+        """Drops least recently used entries until the cache fits into max_bytes."""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.conn.execute("SELECT key, size FROM responses ORDER BY accessed_at")
+        victims = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            victims.append((key,))
+            total -= size
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _get_cache():
+    global _cache
+    if not CACHE_PATH:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+
+class _InFlight:
+    """A request already being made by another thread; others wait for its result."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = ("", None)
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _cached(cache, generation_config, prompt):
+    """(response, model) from the cache. Entries are keyed by the model that
+    answered; any configured model's answer will do, preferred models first."""
+    for model in MODELS:
+        cached = cache.get(cache_key(model, generation_config, prompt))
+        if cached is not None:
+            return cached, model
+    return None, None
+
+
+def cache_lookup(prompt, generation_config=None):
+    """Returns a cached response for the prompt, or None."""
+    cache = _get_cache()
+    if not cache:
+        return None
+    cached, _ = _cached(cache, generation_config or GENERATION_CONFIG, prompt)
+    metrics.incr("gemini.cache_hits" if cached is not None else "gemini.cache_misses")
+    return cached
+
+
+def cache_store(prompt, response, model, generation_config=None):
+    """Stores a response obtained some other way (e.g. split out of a batch answer
+    that `model` gave)."""
+    cache = _get_cache()
+    if cache and response and model:
+        cache.put(cache_key(model, generation_config or GENERATION_CONFIG, prompt), response)
+
+
+def generate_with_retry(prompt, max_retries=5, initial_delay=2, generation_config=None):
+    """Generates content using Gemini, answering from the cache when possible.
+    Concurrent callers with the same prompt share a single request."""
+    return generate_with_model(prompt, max_retries, initial_delay, generation_config)[0]
+
+
+def generate_with_model(prompt, max_retries=5, initial_delay=2, generation_config=None):
+    """Like generate_with_retry, but returns (text, model that answered);
+    the model is None when nothing was generated."""
     if not GEMINI_API_KEY:
         print("  GEMINI_API_KEY not set, skipping generation.")
-        return ""
+        return "", None
+
+    generation_config = generation_config or GENERATION_CONFIG
+    cache = _get_cache()
+    if cache:
+        cached, model = _cached(cache, generation_config, prompt)
+        if cached is not None:
+            metrics.incr("gemini.cache_hits")
+            return cached, model
+        metrics.incr("gemini.cache_misses")
+
+    # Same prompt and config -> one request, whichever model ends up answering
+    key = cache_key("", generation_config, prompt)
+    with _inflight_lock:
+        call = _inflight.get(key)
+        owner = call is None
+        if owner:
+            call = _inflight[key] = _InFlight()
+    if not owner:
+        metrics.incr("gemini.deduplicated")
+        with tracing.span("gemini dedup wait", cat="wait"):
+            call.done.wait()
+        return call.result
+
+    try:
+        # Another thread may have finished the same prompt between the lookups
+        cached, model = _cached(cache, generation_config, prompt) if cache else (None, None)
+        if cached is not None:
+            call.result = cached, model
+        else:
+            with metrics.stage("gemini"):
+                call.result = _generate(prompt, generation_config, max_retries, initial_delay)
+            text, model = call.result
+            if text and cache:
+                cache.put(cache_key(model, generation_config, prompt), text)
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+        call.done.set()
+    return call.result
+
+
+# ── Quota pacing ──────────────────────────────────────────────────────────────
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _limiter(model):
+    """Process-wide limiter for a model: requests and tokens per minute."""
+    with _limiters_lock:
+        if model not in _limiters:
+            _limiters[model] = RateLimiter(
+                requests=TokenBucket(RPM / 60, max(1.0, RPM / 6)),
+                tokens=TokenBucket(TPM / 60, TPM / 6),
+            )
+        return _limiters[model]
+
+
+def estimate_tokens(text):
+    """Rough token count (~3 characters per token for mixed Cyrillic/Latin text)."""
+    return len(text) // 3 + 1
+
 
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-flash-latest:generateContent?key={GEMINI_API_KEY}"
+def _pick_model(cost):
+    """First model that can be called within SWITCH_AFTER, otherwise the least busy one.
+    Returns (model, expected wait)."""
+    delays = [(_limiter(m).delay(requests=1, tokens=cost), m) for m in MODELS]
+    for delay, model in delays:
+        if delay <= SWITCH_AFTER:
+            return model, delay
+    delay, model = min(delays)
+    return model, delay
+
+
+def _retry_hint(resp):
+    """Server-provided wait: the Retry-After header or google.rpc.RetryInfo in the body."""
+    hint = parse_retry_after(resp.headers.get("Retry-After"))
+    if hint is not None:
+        return hint
+    try:
+        details = resp.json().get("error", {}).get("details", [])
+    except ValueError:
+        return None
+    for d in details:
+        if d.get("@type", "").endswith("google.rpc.RetryInfo"):
+            return parse_retry_after(d.get("retryDelay"))
+    return None
+
+
+def _generate(prompt, generation_config, max_retries, initial_delay):
+    """Calls Gemini, pacing requests ahead of time and falling back between models.
+    Returns (text, model); gives up once waits would exceed MAX_WAIT."""
     payload = {
         "contents": [{"parts": [{"text": prompt}]}],
-        "generationConfig": {"maxOutputTokens": 500, "temperature": 0.3}
+        "generationConfig": generation_config,
     }
+    cost = estimate_tokens(prompt)
+    deadline = time.monotonic() + MAX_WAIT
 
     delay = initial_delay
     for i in range(max_retries):
+        model, expected = _pick_model(cost)
+        if time.monotonic() + expected > deadline:
+            print(f"  Gemini: no model available within {MAX_WAIT:.0f}s, giving up")
+            metrics.incr("gemini.gave_up")
+            return "", None
+        limiter = _limiter(model)
+        with tracing.span("gemini quota wait", cat="wait", model=model, tokens=cost):
+            limiter.acquire(requests=1, tokens=cost)
+        if i:
+            metrics.incr("gemini.retries")
+        metrics.incr("gemini.requests")
+        url = f"{http_client.GEMINI_API_BASE}/v1beta/models/{model}:generateContent?key={GEMINI_API_KEY}"
+        try:
+            resp = http_client.post(url, json=payload, timeout=REQUEST_TIMEOUT)
+        except requests.exceptions.Timeout:
+            metrics.incr("gemini.timeouts")
+            if len(MODELS) == 1:
+                # No fallback: waiting out a cooldown and retrying would block a
+                # worker for minutes; drop this prompt, the next run retries it
+                print(f"  Gemini {model} timed out, no fallback model, giving up")
+                return "", None
+            print(f"  Gemini {model} timed out, switching model for {SLOW_COOLDOWN:.0f}s")
+            limiter.pause(SLOW_COOLDOWN)
+            continue
+        except requests.exceptions.ConnectionError as e:
+            if time.monotonic() + delay > deadline:
+                print(f"  Connection error calling Gemini: {e}. Giving up")
+                return "", None
+            print(f"  Connection error calling Gemini: {e}. Retrying in {delay} seconds...")
+            with tracing.span("gemini backoff", cat="wait", seconds=delay):
+                time.sleep(delay)
+            delay *= 2
+            continue
+
+        if resp.status_code in RETRYABLE_STATUSES:
+            if resp.status_code == 429:
+                metrics.incr("gemini.429")
+            hint = _retry_hint(resp)
+            wait = hint if hint is not None else delay
+            if hint is None:
+                delay *= 2  # Exponential backoff when the server gives no hint
+            # The pause applies to every thread using this model; the next
+            # attempt goes to a fallback model if one is free
+            limiter.pause(wait)
+            print(f"  Gemini {model} returned {resp.status_code}, paused for {wait:.1f}s")
+            continue
+
+        if not resp.ok:
+            print(f"  HTTP error calling Gemini {model}: {resp.status_code} {resp.text[:200]}")
+            return "", None
+
         try:
-            resp = requests.post(url, json=payload, timeout=45)
-            resp.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
             data = resp.json()
             if "candidates" in data and data["candidates"]:
                 text = data["candidates"][0]["content"]["parts"][0]["text"]
-                return text.strip()
-            else:
-                print(f"  Gemini response is empty or malformed: {data}")
-                return ""
-
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 429:  # Rate limit exceeded
-                print(f"  Rate limit exceeded. Retrying in {delay} seconds...")
-                time.sleep(delay)
-                delay *= 2  # Exponential backoff
-            else:
-                print(f"  HTTP error calling Gemini: {e}")
-                return ""
-        except Exception as e:
-            print(f"  Error calling Gemini: {e}")
-            # On other errors, retry with backoff as well
-            time.sleep(delay)
-            delay *= 2
+                return text.strip(), model
+            print(f"  Gemini response is empty or malformed: {data}")
+        except (ValueError, KeyError, IndexError) as e:
+            print(f"  Gemini response is malformed: {e}")
+        return "", None
 
     print("  Max retries reached. Failed to get response from Gemini.")
-    return ""
+    return "", None
@@ -1,84 +1,105 @@
 #!/usr/bin/env python3
 """
 Social Capital Monitor — Скрипт 3: Обработчик нажатий кнопок
-Запускается каждые 5 минут через GitHub Actions.
-Читает накопившиеся callback_query от Telegram,
-обновляет Notion и отвечает toast-уведомлением.
-Лёгкий скрипт: ~5 сек работы, не тратит лишних минут Actions.
+Читает callback_query от Telegram, обновляет Notion и отвечает
+toast-уведомлением.
+Без флагов — один проход по накопившимся нажатиям.
+С --daemon — long poll getUpdates: кнопки отвечают сразу, offset
+подтверждается после каждой пачки, выход по SIGTERM/SIGINT, после
+простоя --idle-timeout или по истечении --max-runtime.
+Несколько арендаторов (tenants.py): обновления читаются по одному разу
+на бота, нажатие применяется к базе арендатора, чей это чат; в режиме
+демона каждый бот опрашивается своим потоком.
 """
 
 import os
-import json
 import time
-import requests
+import signal
+import argparse
+import threading
+import http_client
+import metrics
+import profiling
+import tracing
+import tenants
 from datetime import datetime, timedelta, date
-from notion_client import Client
+from notion_writer import date_value
+from contact_store import forget
 
 # ── Конфигурация ──────────────────────────────────────────────────────────────
-NOTION_TOKEN       = os.environ["NOTION_TOKEN"]
-NOTION_DATABASE_ID = os.environ["NOTION_DATABASE_ID"]
-TELEGRAM_BOT_TOKEN = os.environ["TELEGRAM_BOT_TOKEN"]
-TELEGRAM_CHAT_ID   = os.environ["TELEGRAM_CHAT_ID"]
 
-TG_API = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
-notion = Client(auth=NOTION_TOKEN)
+# Режим демона (--daemon): long poll и условия выхода
+POLL_TIMEOUT = int(os.environ.get("CALLBACK_POLL_TIMEOUT", "50"))           # секунд на getUpdates
+IDLE_TIMEOUT = float(os.environ.get("CALLBACK_IDLE_TIMEOUT", "1800"))       # выход после простоя
+MAX_RUNTIME  = float(os.environ.get("CALLBACK_MAX_RUNTIME", "7200"))        # жёсткий предел работы
+
+SHUTDOWN_GRACE = 10.0   # сколько ждать потоки ботов после сигнала, с
 
 
 # ── Telegram helpers ──────────────────────────────────────────────────────────
-def tg_get_updates(offset=None):
-    params = {"timeout": 3, "limit": 100}
+def tg_get_updates(offset=None, timeout=3):
+    params = {"timeout": timeout, "limit": 100}
     if offset:
         params["offset"] = offset
-    resp = requests.get(f"{TG_API}/getUpdates", params=params, timeout=10)
+    # HTTP-таймаут с запасом поверх long poll
+    resp = http_client.get(f"{tenants.current().tg_api}/getUpdates", params=params,
+                           timeout=timeout + 10)
     return resp.json().get("result", [])
 
 
-def tg_answer_callback(callback_query_id, text="", show_alert=False):
-    """Показывает toast-уведомление при нажатии кнопки."""
-    requests.post(f"{TG_API}/answerCallbackQuery", json={
+def tg_commit_offset(offset):
+    """Подтверждает обработку всех обновлений до offset (не включая)."""
+    http_client.get(f"{tenants.current().tg_api}/getUpdates",
+                    params={"offset": offset, "limit": 1, "timeout": 0}, timeout=10)
+
+
+def answer_callback_payload(callback_query_id, text="", show_alert=False):
+    return {
         "callback_query_id": callback_query_id,
         "text": text,
         "show_alert": show_alert,
-    }, timeout=10)
+    }
 
 
-def tg_edit_message(chat_id, message_id, text, parse_mode="HTML"):
-    """Убирает кнопки и добавляет подтверждение в текст."""
-    # Сначала убираем кнопки
-    requests.post(f"{TG_API}/editMessageReplyMarkup", json={
-        "chat_id": chat_id,
-        "message_id": message_id,
-        "reply_markup": json.dumps({"inline_keyboard": []})
-    }, timeout=10)
-    # Затем обновляем текст
-    requests.post(f"{TG_API}/editMessageText", json={
+def edit_message_payload(chat_id, message_id, text, parse_mode="HTML"):
+    # Без reply_markup editMessageText сам убирает inline-кнопки —
+    # отдельный editMessageReplyMarkup не нужен
+    return {
         "chat_id": chat_id,
         "message_id": message_id,
         "text": text,
         "parse_mode": parse_mode,
         "disable_web_page_preview": True,
-    }, timeout=10)
+    }
+
+
+def tg_answer_callback(callback_query_id, text="", show_alert=False):
+    """Показывает toast-уведомление при нажатии кнопки."""
+    http_client.post(f"{tenants.current().tg_api}/answerCallbackQuery",
+                     json=answer_callback_payload(callback_query_id, text, show_alert), timeout=10)
+
+
+def tg_edit_message(chat_id, message_id, text, parse_mode="HTML"):
+    """Убирает кнопки и добавляет подтверждение в текст — одним запросом."""
+    http_client.post(f"{tenants.current().tg_api}/editMessageText",
+                     json=edit_message_payload(chat_id, message_id, text, parse_mode), timeout=10)
 
 
 # ── Notion helpers ─────────────────────────────────────────────────────────────
 def update_last_contact(page_id, contact_date=None):
     if not contact_date:
         contact_date = date.today().isoformat()
-    notion.pages.update(
-        page_id=page_id,
-        properties={"Последний контакт": {"date": {"start": contact_date}}}
-    )
+    tenants.current().writer.write(page_id, {"Последний контакт": date_value(contact_date)})
 
 
 def update_next_contact(page_id, next_date):
-    notion.pages.update(
-        page_id=page_id,
-        properties={"Следующий контакт": {"date": {"start": next_date}}}
-    )
+    tenants.current().writer.write(page_id, {"Следующий контакт": date_value(next_date)})
 
 
 def delete_contact(page_id):
-    notion.pages.update(page_id=page_id, archived=True)
+    tenant = tenants.current()
+    tenant.writer.archive(page_id)
+    forget(tenant.database_id, page_id)
 
 
 def update_last_contact_approx(page_id, when):
@@ -92,90 +113,236 @@ def update_last_contact_approx(page_id, when):
     update_last_contact(page_id, contact_date)
 
 
-# ── Главная функция ───────────────────────────────────────────────────────────
-def main():
-    print(f"[{datetime.now().isoformat()}] Проверка нажатий кнопок...")
+def snooze_contact(page_id):
+    update_next_contact(page_id, (date.today() + timedelta(days=7)).isoformat())
+
+
+# action -> (запись в Notion, toast, приписка к сообщению)
+ACTIONS = {
+    "done":     (update_last_contact, "✅ Отмечено! Дата обновлена",
+                 "✅ Связался сегодня — дата обновлена"),
+    "snooze":   (snooze_contact, "⏭ Перенесено на неделю", "⏭ Перенесено на 7 дней"),
+    "recent":   (lambda p: update_last_contact_approx(p, "recent"), "✅ Записано",
+                 "✅ 📅 Недавно (в течение 2 недель)"),
+    "medium":   (lambda p: update_last_contact_approx(p, "medium"), "✅ Записано",
+                 "✅ 🕐 1-3 месяца назад"),
+    "long_ago": (lambda p: update_last_contact_approx(p, "long_ago"), "✅ Записано",
+                 "✅ ⏳ Давно (3+ месяца)"),
+    "delete":   (delete_contact, "🗑 Контакт архивирован", "🗑 Удалён из базы"),
+}
+
+
+# ── Обработка нажатий ─────────────────────────────────────────────────────────
+def parse_callback(callback):
+    """callback_query -> (action, page_id, chat_id, message_id, исходный текст)."""
+    parts = callback.get("data", "").split("|")
+    action = parts[0]
+    page_id = parts[1] if len(parts) > 1 else None
+    message = callback.get("message") or {}
+    return (action, page_id, (message.get("chat") or {}).get("id"),
+            message.get("message_id"), message.get("text", ""))
+
+
+def notion_link(page_id):
+    return f"https://www.notion.so/{page_id.replace('-', '')}"
+
+
+def handle_callback(callback):
+    """Обрабатывает одно нажатие. Возвращает True, если контакт обновлён."""
+    action, page_id, chat_id, msg_id, orig_text = parse_callback(callback)
+    if not page_id:
+        return False
+
+    print(f"  Обрабатываю: {action} для {page_id}")
+
+    try:
+        if action == "notion":
+            tg_answer_callback(callback["id"], notion_link(page_id), show_alert=True)
+            # Кнопки не убираем — пользователь просто смотрит ссылку
+            return False
+        if action not in ACTIONS:
+            return False
+
+        apply, toast, note = ACTIONS[action]
+        apply(page_id)
+        tg_answer_callback(callback["id"], toast)
+        tg_edit_message(chat_id, msg_id, orig_text + f"\n\n<i>{note}</i>")
+        return True
+
+    except Exception as e:
+        print(f"  Ошибка обработки {action}: {e}")
+        metrics.incr("callbacks.failed")
+        try:
+            tg_answer_callback(callback["id"], "⚠️ Ошибка, попробуй ещё раз")
+        except Exception:
+            pass
+        return False
 
-    updates = tg_get_updates()
-    if not updates:
-        print("  Нет новых обновлений")
-        return
 
-    last_update_id = None
-    processed = 0
+def bot_groups():
+    """Арендаторы, сгруппированные по боту: обновления бота читаются одним
+    getUpdates, поэтому чаты одного бота обслуживаются вместе."""
+    groups = {}
+    for tenant in tenants.load_tenants():
+        groups.setdefault(tenant.bot_token, []).append(tenant)
+    return list(groups.values())
+
+
+def tenant_for_chat(group, chat_id):
+    """Арендатор, которому принадлежит чат, или None — чат не из конфигурации
+    (даже у бота одного арендатора: нажатие из чужого чата не применяем)."""
+    for tenant in group:
+        if str(tenant.chat_id) == str(chat_id):
+            return tenant
+    return None
+
 
+def process_updates(updates, group):
+    """Обрабатывает пачку обновлений бота. Возвращает число обработанных нажатий."""
+    processed = 0
     for update in updates:
-        last_update_id = update["update_id"]
         callback = update.get("callback_query")
         if not callback:
             continue
+        metrics.incr("callbacks.received")
+        chat_id = ((callback.get("message") or {}).get("chat") or {}).get("id")
+        tenant = tenant_for_chat(group, chat_id)
+        if tenant is None:
+            print(f"  Нажатие из чужого чата {chat_id} — пропускаю")
+            continue
+        with tenants.use(tenant):
+            if handle_callback(callback):
+                processed += 1
+                metrics.incr("callbacks.processed")
+    return processed
 
-        data = callback.get("data", "")
-        parts = data.split("|")
-        action = parts[0]
-        page_id = parts[1] if len(parts) > 1 else None
-
-        msg_id   = callback["message"]["message_id"]
-        chat_id  = callback["message"]["chat"]["id"]
-        orig_text = callback["message"].get("text", "")
 
-        print(f"  Обрабатываю: {action} для {page_id}")
+# ── Режим демона ──────────────────────────────────────────────────────────────
+class _Shutdown:
+    """SIGTERM/SIGINT: обработчик только ставит флаг. Потоки ботов проверяют
+    его между опросами — пачку в обработке доводят до конца и подтверждают."""
 
-        try:
-            if action == "done" and page_id:
-                update_last_contact(page_id)
-                tg_answer_callback(callback["id"], "✅ Отмечено! Дата обновлена")
-                tg_edit_message(chat_id, msg_id,
-                    orig_text + "\n\n<i>✅ Связался сегодня — дата обновлена</i>")
-                processed += 1
+    def __init__(self):
+        self.requested = False
+        signal.signal(signal.SIGTERM, self._handle)
+        signal.signal(signal.SIGINT, self._handle)
 
-            elif action == "snooze" and page_id:
-                new_date = (date.today() + timedelta(days=7)).isoformat()
-                update_next_contact(page_id, new_date)
-                tg_answer_callback(callback["id"], "⏭ Перенесено на неделю")
-                tg_edit_message(chat_id, msg_id,
-                    orig_text + "\n\n<i>⏭ Перенесено на 7 дней</i>")
-                processed += 1
+    def _handle(self, signum, frame):
+        self.requested = True
+        print(f"  Получен сигнал {signal.Signals(signum).name}, завершаю работу...")
 
-            elif action in ("recent", "medium", "long_ago") and page_id:
-                update_last_contact_approx(page_id, action)
-                labels = {
-                    "recent":   "📅 Недавно (в течение 2 недель)",
-                    "medium":   "🕐 1-3 месяца назад",
-                    "long_ago": "⏳ Давно (3+ месяца)"
-                }
-                label = labels[action]
-                tg_answer_callback(callback["id"], "✅ Записано")
-                tg_edit_message(chat_id, msg_id,
-                    orig_text + f"\n\n<i>✅ {label}</i>")
-                processed += 1
 
-            elif action == "delete" and page_id:
-                delete_contact(page_id)
-                tg_answer_callback(callback["id"], "🗑 Контакт архивирован")
-                tg_edit_message(chat_id, msg_id,
-                    orig_text + "\n\n<i>🗑 Удалён из базы</i>")
-                processed += 1
+def _poll_loop(group, shutdown, poll_timeout, idle_timeout, max_runtime):
+    """Long poll одного бота; выход — после очередного getUpdates."""
+    started = last_activity = time.monotonic()
+    offset = None
+    processed = 0
 
-            elif action == "notion" and page_id:
-                notion_url = f"https://www.notion.so/{page_id.replace('-', '')}"
-                tg_answer_callback(callback["id"], notion_url, show_alert=True)
-                # Кнопки не убираем — пользователь просто смотрит ссылку
+    while not shutdown.requested:
+        now = time.monotonic()
+        if now - last_activity >= idle_timeout:
+            print(f"  Нет нажатий {idle_timeout:.0f} с — выхожу")
+            break
+        remaining = min(max_runtime - (now - started), idle_timeout - (now - last_activity))
+        if remaining <= 0:
+            print("  Достигнут лимит времени работы — выхожу")
+            break
 
+        try:
+            updates = tg_get_updates(offset, timeout=max(1, int(min(poll_timeout, remaining))))
         except Exception as e:
-            print(f"  Ошибка обработки {action}: {e}")
-            try:
-                tg_answer_callback(callback["id"], "⚠️ Ошибка, попробуй ещё раз")
-            except Exception:
-                pass
+            print(f"  Ошибка getUpdates: {e}")
+            time.sleep(5)
+            continue
+
+        if not updates:
+            continue
+        last_activity = time.monotonic()
+        processed += process_updates(updates, group)
+        offset = updates[-1]["update_id"] + 1
+        tg_commit_offset(offset)
+
+    names = ", ".join(t.name for t in group)
+    print(f"  Обработано: {processed} нажатий за {time.monotonic() - started:.0f} с ({names})")
+
+
+def run_daemon(poll_timeout=POLL_TIMEOUT, idle_timeout=IDLE_TIMEOUT, max_runtime=MAX_RUNTIME):
+    """Long poll getUpdates до сигнала, простоя idle_timeout или max_runtime секунд.
+    Каждый бот опрашивается своим потоком; главный поток ждёт их и сигнал."""
+    shutdown = _Shutdown()
+
+    def poll(group):
+        with tenants.use(group[0]):
+            _poll_loop(group, shutdown, poll_timeout, idle_timeout, max_runtime)
+
+    threads = [threading.Thread(target=poll, args=(g,), name=f"bot-{g[0].name}", daemon=True)
+               for g in bot_groups()]
+    for t in threads:
+        t.start()
+    while not shutdown.requested and any(t.is_alive() for t in threads):
+        for t in threads:
+            t.join(0.5)
+    # После сигнала: пачки в обработке доводим до конца, long poll не ждём —
+    # неподтверждённые обновления бот отдаст в следующий запуск
+    deadline = time.monotonic() + SHUTDOWN_GRACE
+    for t in threads:
+        t.join(max(0.0, deadline - time.monotonic()))
+
+
+def _poll_once(group):
+    updates = tg_get_updates()
+    if not updates:
+        print(f"  Нет новых обновлений ({', '.join(t.name for t in group)})")
+        return
 
+    processed = process_updates(updates, group)
     print(f"  Обработано: {processed} нажатий")
 
     # Подтверждаем обработку всех обновлений
-    if last_update_id:
-        requests.get(f"{TG_API}/getUpdates",
-                     params={"offset": last_update_id + 1, "limit": 1}, timeout=10)
+    tg_commit_offset(updates[-1]["update_id"] + 1)
+
+
+def run_once():
+    """Один проход: забрать накопившиеся нажатия, обработать, подтвердить.
+    Ошибка одного бота не останавливает остальных (как tenants.run_all):
+    упавшие перечисляются в конце, запуск завершается с ошибкой."""
+    groups = bot_groups()
+    failed = []
+    for group in groups:
+        with tenants.use(group[0]):
+            if len(groups) == 1:
+                _poll_once(group)
+                continue
+            try:
+                _poll_once(group)
+            except Exception as e:
+                print(f"  [{group[0].name}] ошибка: {e}")
+                metrics.incr("tenants.failed")
+                failed.extend(t.name for t in group)
+    tenants.check(failed)
+
+
+# ── Главная функция ───────────────────────────────────────────────────────────
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Обработчик нажатий кнопок дайджеста")
+    parser.add_argument("--daemon", action="store_true",
+                        help="работать в режиме long poll, а не одним проходом")
+    parser.add_argument("--poll-timeout", type=int, default=POLL_TIMEOUT,
+                        help="таймаут одного getUpdates, с")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                        help="выйти, если столько секунд не было нажатий")
+    parser.add_argument("--max-runtime", type=float, default=MAX_RUNTIME,
+                        help="максимальное время работы демона, с")
+    args = parser.parse_args(argv)
+
+    print(f"[{datetime.now().isoformat()}] Проверка нажатий кнопок...")
+    if args.daemon:
+        run_daemon(args.poll_timeout, args.idle_timeout, args.max_runtime)
+    else:
+        run_once()
 
 
 if __name__ == "__main__":
-    main()
+    with metrics.run("handle_callbacks"), profiling.session("handle_callbacks"), \
+            tracing.session("handle_callbacks"):
+        main()
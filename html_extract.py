@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Social Capital Monitor — быстрое извлечение текста из HTML
+Вместо полного дерева BeautifulSoup страница разбирается потоково через
+lxml.etree.iterparse: сохраняются только поддеревья нужных классов
+(.tgme_widget_message_text, .photo-description, ...), остальное сразу
+освобождается, а разбор прекращается, как только набрано нужное число узлов.
+telegram_messages отдаёт сообщения ленты t.me/s вместе с их ID (data-post).
+Парсер ограничен: без сети, без комментариев и processing instructions.
+Текст собирается так же, как BeautifulSoup.get_text(separator, strip=True) —
+эталон и сравнение лежат в bench/bench_html_extract.py.
+"""
+import io
+
+from lxml import etree
+
+_PARSER_OPTIONS = {
+    "html": True,
+    "encoding": "utf-8",
+    "no_network": True,
+    "remove_comments": True,
+    "remove_pis": True,
+    "huge_tree": False,
+    "recover": True,
+}
+
+
+class Select:
+    """Что извлекать: узлы с CSS-классом class_name (не больше limit),
+    текст каждого — через separator."""
+
+    __slots__ = ("class_name", "separator", "limit")
+
+    def __init__(self, class_name, separator="", limit=None):
+        self.class_name = class_name
+        self.separator = separator
+        self.limit = limit
+
+
+def _text(el, separator):
+    return separator.join(s for s in (t.strip() for t in el.itertext()) if s)
+
+
+def extract(html, selects):
+    """Один проход по странице. selects — {имя: Select}; возвращает {имя: [тексты]}."""
+    results = {name: [] for name in selects}
+    pending = dict(selects)
+    # Узлы, внутри которых мы сейчас находимся: [имя, элемент]
+    open_targets = []
+    inside = 0
+
+    try:
+        for event, el in _iterparse(html):
+            if event == "start":
+                if inside:
+                    inside += 1
+                classes = (el.get("class") or "").split()
+                if not classes:
+                    continue
+                for name, sel in pending.items():
+                    if sel.class_name in classes:
+                        open_targets.append((name, el))
+                        if not inside:
+                            inside = 1
+                continue
+
+            # event == "end"
+            if open_targets and open_targets[-1][1] is el:
+                while open_targets and open_targets[-1][1] is el:
+                    name, _ = open_targets.pop()
+                    sel = pending.get(name)
+                    if sel is None:
+                        continue
+                    results[name].append(_text(el, sel.separator))
+                    if sel.limit and len(results[name]) >= sel.limit:
+                        del pending[name]
+                if not pending:
+                    break
+            if inside:
+                inside -= 1
+            if not inside:
+                # Вне нужных узлов дерево не храним: чистим узел и уже пройденных соседей
+                el.clear(keep_tail=True)
+                parent = el.getparent()
+                if parent is not None:
+                    while el.getprevious() is not None:
+                        del parent[0]
+    except etree.XMLSyntaxError:
+        # Пустая или битая страница — отдаём то, что успели собрать
+        pass
+    return results
+
+
+def _iterparse(html):
+    return etree.iterparse(io.BytesIO(html.encode("utf-8")), events=("start", "end"),
+                           **_PARSER_OPTIONS)
+
+
+def telegram_messages(html):
+    """Сообщения страницы t.me/s/<channel> в порядке документа (от старых к новым):
+    список (message_id, текст). Текст цитаты при ответе (reply) не включается;
+    у сообщений без подписи (фото, видео) текст пустой."""
+    messages = []
+    current = None
+    try:
+        for event, el in _iterparse(html):
+            classes = (el.get("class") or "").split()
+            if event == "start":
+                if "tgme_widget_message" in classes and el.get("data-post"):
+                    current = el
+                continue
+
+            if el is current:
+                post = el.get("data-post", "")
+                try:
+                    message_id = int(post.rsplit("/", 1)[-1])
+                except ValueError:
+                    message_id = None
+                if message_id is not None:
+                    texts = [
+                        _text(t, " ") for t in el.iter()
+                        if t is not el
+                        and "tgme_widget_message_text" in (t.get("class") or "").split()
+                        and "js-message_reply_text" not in (t.get("class") or "").split()
+                    ]
+                    messages.append((message_id, " ".join(t for t in texts if t)))
+                current = None
+            if current is None:
+                el.clear(keep_tail=True)
+                parent = el.getparent()
+                if parent is not None:
+                    while el.getprevious() is not None:
+                        del parent[0]
+    except etree.XMLSyntaxError:
+        pass
+    return messages
+
+
+def select_texts(html, class_name, separator="", limit=None):
+    """Тексты узлов с классом class_name в порядке документа."""
+    return extract(html, {"_": Select(class_name, separator, limit)})["_"]
+
+
+def select_first_text(html, class_name, separator=""):
+    """Текст первого узла с классом class_name или пустая строка."""
+    texts = select_texts(html, class_name, separator, limit=1)
+    return texts[0] if texts else ""
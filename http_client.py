@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Social Capital Monitor — общий HTTP-клиент
+Одна requests.Session на процесс: пулы keep-alive соединений по хостам
+(t.me, api.telegram.org, generativelanguage.googleapis.com, ...), таймаут
+по умолчанию, сжатие ответов и учёт времени каждого запроса по хостам.
+Все скрипты ходят в сеть только через get/post этого модуля.
+"""
+import os
+import re
+import math
+import time
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import tracing
+
+# ── Конфигурация ──────────────────────────────────────────────────────────────
+DEFAULT_TIMEOUT  = (5, 15)   # (connect, read) секунд, если вызывающий не задал свой
+POOL_CONNECTIONS = 16        # сколько хостов держим в пуле одновременно
+POOL_MAXSIZE     = 32        # соединений на хост — с запасом на воркеры конвейера
+
+# ── Адреса сервисов ───────────────────────────────────────────────────────────
+# Переопределяются, чтобы гонять скрипты против локальных заглушек (bench/stubs.py)
+NOTION_BASE_URL   = os.environ.get("NOTION_BASE_URL", "https://api.notion.com")
+TELEGRAM_API_BASE = os.environ.get("TELEGRAM_API_BASE", "https://api.telegram.org")
+TELEGRAM_WEB_BASE = os.environ.get("TELEGRAM_WEB_BASE", "https://t.me")
+GEMINI_API_BASE   = os.environ.get("GEMINI_API_BASE", "https://generativelanguage.googleapis.com")
+PICUKI_BASE       = os.environ.get("PICUKI_BASE", "https://www.picuki.com")
+YOUTUBE_API_BASE  = os.environ.get("YOUTUBE_API_BASE", "https://www.googleapis.com")
+
+try:
+    import brotli  # noqa: F401 — если установлен, urllib3 сам распакует br
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+
+def _make_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    return session
+
+
+session = _make_session()
+
+# host -> список (секунды, статус); статус None — запрос упал с исключением
+_latencies = {}
+_latencies_lock = threading.Lock()
+
+
+def record(url, elapsed, status):
+    """Учитывает запрос, сделанный в обход session (например, клиентом Notion на httpx)."""
+    host = urlsplit(url).hostname or ""
+    with _latencies_lock:
+        _latencies.setdefault(host, []).append((elapsed, status))
+
+
+def request(method, url, **kwargs):
+    """requests.request через общую сессию с таймаутом по умолчанию и замером времени."""
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    parts = urlsplit(url)
+    # В трассу — без query (Gemini ?key=) и без токена бота в пути
+    path = re.sub(r"^/bot[^/]+", "/bot…", parts.path)
+    with tracing.span(f"{method} {parts.hostname}", cat="http", path=path) as sp:
+        started = time.perf_counter()
+        try:
+            resp = session.request(method, url, **kwargs)
+        except Exception:
+            record(url, time.perf_counter() - started, None)
+            raise
+        record(url, time.perf_counter() - started, resp.status_code)
+        sp.set(status=resp.status_code)
+    return resp
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def _percentile(sorted_times, q):
+    # Ближайший ранг: значение, не меньше которого q-я доля выборки
+    index = max(0, min(len(sorted_times) - 1, math.ceil(q * len(sorted_times)) - 1))
+    return sorted_times[index]
+
+
+def latency_stats():
+    """Сводка по хостам: число запросов, ошибок, статусы и перцентили времени (мс)."""
+    with _latencies_lock:
+        snapshot = {host: list(samples) for host, samples in _latencies.items()}
+    stats = {}
+    for host, samples in snapshot.items():
+        times = sorted(t for t, _ in samples)
+        statuses = {}
+        for _, status in samples:
+            key = str(status) if status is not None else "exception"
+            statuses[key] = statuses.get(key, 0) + 1
+        stats[host] = {
+            "requests": len(samples),
+            "errors": sum(1 for _, status in samples if status is None or status >= 400),
+            "statuses": statuses,
+            "avg_ms": round(1000 * sum(times) / len(times), 1),
+            "p50_ms": round(1000 * _percentile(times, 0.50), 1),
+            "p90_ms": round(1000 * _percentile(times, 0.90), 1),
+            "p99_ms": round(1000 * _percentile(times, 0.99), 1),
+            "max_ms": round(1000 * times[-1], 1),
+        }
+    return stats
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Social Capital Monitor — журнал прогресса долгих запусков
+Для каждого контакта запуска хранится, какие стадии он прошёл (скрапинг,
+Gemini, запись в Notion) и их результат, с датой запуска. Запись — сразу
+в SQLite, поэтому журнал переживает падение процесса и таймаут job-а.
+С --resume скрипт продолжает последний запуск: завершённые контакты
+пропускаются, у начатых берутся сохранённые результаты стадий (например,
+готовая сводка Gemini — повторять скрапинг и запрос не нужно), а
+упавшие и не начатые обрабатываются заново.
+Без --resume запуск начинается с чистого листа (журнал за сегодня
+этого скрипта очищается) и ведёт журнал для следующего --resume.
+"""
+import os
+import json
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta, timezone
+
+# ── Конфигурация ──────────────────────────────────────────────────────────────
+PROGRESS_JOURNAL_PATH = os.environ.get("PROGRESS_JOURNAL_PATH", ".cache/progress.sqlite")
+JOURNAL_KEEP_DAYS     = int(os.environ.get("JOURNAL_KEEP_DAYS", "14"))   # старые запуски удаляются
+
+FINISHED = "finished"   # стадия-отметка: контакт обработан до конца
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS progress (
+    run_date   TEXT NOT NULL,
+    job        TEXT NOT NULL,
+    page_id    TEXT NOT NULL,
+    stage      TEXT NOT NULL,
+    status     TEXT NOT NULL,
+    payload    TEXT,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (run_date, job, page_id, stage)
+);
+"""
+
+
+class ProgressJournal:
+    """Журнал одного запуска скрипта job. Потокобезопасно — вызывается из воркеров конвейера."""
+
+    def __init__(self, job, resume=False, path=PROGRESS_JOURNAL_PATH, today=None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.job = job
+        self.lock = threading.Lock()
+        # Шарды на одной машине пишут в один файл — ждём блокировку
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.executescript(_SCHEMA)
+        today = today or date.today()
+
+        with self.conn:
+            keep_from = (today - timedelta(days=JOURNAL_KEEP_DAYS)).isoformat()
+            self.conn.execute("DELETE FROM progress WHERE run_date < ?", (keep_from,))
+        last = self.conn.execute(
+            "SELECT MAX(run_date) FROM progress WHERE job = ?", (job,)
+        ).fetchone()[0]
+        if resume and last:
+            self.run_date = last
+        else:
+            self.run_date = today.isoformat()
+            with self.conn:
+                self.conn.execute("DELETE FROM progress WHERE run_date = ? AND job = ?",
+                                  (self.run_date, job))
+        self.resumed = bool(resume and last)
+
+    def _put(self, page_id, stage, status, payload):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO progress (run_date, job, page_id, stage, status, "
+                "payload, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.run_date, self.job, page_id, stage, status,
+                 json.dumps(payload, ensure_ascii=False) if payload is not None else None,
+                 datetime.now(timezone.utc).isoformat())
+            )
+
+    def record(self, page_id, stage, payload=None):
+        """Стадия контакта пройдена; payload (JSON) — её результат для --resume."""
+        self._put(page_id, stage, "done", payload)
+
+    def payload(self, page_id, stage):
+        """Сохранённый результат пройденной стадии или None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT payload FROM progress WHERE run_date = ? AND job = ? AND page_id = ? "
+                "AND stage = ? AND status = 'done'",
+                (self.run_date, self.job, page_id, stage)
+            ).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def fail(self, page_id, stage, error=None):
+        """Стадия не удалась: результаты прежних стадий отбрасываются —
+        при --resume контакт обрабатывается с начала."""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM progress WHERE run_date = ? AND job = ? AND page_id = ?",
+                (self.run_date, self.job, page_id)
+            )
+        self._put(page_id, stage, "failed", {"error": str(error)} if error else None)
+
+    def finish(self, page_id, outcome):
+        """Контакт обработан до конца (outcome — чем закончилось: updated, skipped, ...)."""
+        self._put(page_id, FINISHED, "done", outcome)
+
+    def pending(self, contacts):
+        """Контакты (Contact), ещё не обработанные до конца в этом запуске."""
+        with self.lock:
+            finished = {row[0] for row in self.conn.execute(
+                "SELECT page_id FROM progress WHERE run_date = ? AND job = ? AND stage = ?",
+                (self.run_date, self.job, FINISHED)
+            )}
+        return [c for c in contacts if c.page_id not in finished]
+
+    def close(self):
+        self.conn.close()
+
+
+_default = None
+
+
+def start(job, resume=False):
+    """Открывает журнал запуска скрипта; дальше он доступен через current()."""
+    global _default
+    _default = ProgressJournal(job, resume)
+    if _default.resumed:
+        print(f"  Продолжаем запуск от {_default.run_date} (журнал прогресса)")
+    return _default
+
+
+def current():
+    if _default is None:
+        raise RuntimeError("Журнал прогресса не открыт: сначала journal.start()")
+    return _default
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Social Capital Monitor — метрики запуска
+Счётчики (повторы, 429, попадания в кэш, обработанные и пропущенные
+контакты) и время стадий (чтение Notion, скрапинг, Gemini, запись в Notion,
+отправка в Telegram) собираются по всему процессу. В конце запуска
+пишется JSON-отчёт в SCM_REPORTS_DIR вместе со статистикой запросов по
+хостам из http_client (число, статусы, перцентили задержки).
+В Actions папка отчётов сохраняется как артефакт.
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import http_client
+import tracing
+
+# ── Конфигурация ──────────────────────────────────────────────────────────────
+# Пустая строка отключает запись отчёта
+REPORTS_DIR = os.environ.get("SCM_REPORTS_DIR", "reports")
+
+_lock = threading.Lock()
+_counters = {}
+_stages = {}   # стадия -> [вызовов, суммарно секунд, первый старт, последний конец]
+_labels = {}   # метки запуска (например, шард) — в отчёт и в имя файла
+
+
+def label(name, value):
+    """Помечает запуск: метка попадает в отчёт ("labels") и в имя его файла."""
+    with _lock:
+        _labels[name] = str(value)
+
+
+def incr(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+@contextmanager
+def stage(name):
+    """Замер стадии. Стадии выполняются в нескольких потоках, поэтому в отчёте
+    два числа: busy — сумма по всем вызовам, wall — от первого старта до
+    последнего завершения. При SCM_TRACE стадия — ещё и спан трассы."""
+    started = time.perf_counter()
+    try:
+        with tracing.span(name, cat="stage"):
+            yield
+    finally:
+        ended = time.perf_counter()
+        with _lock:
+            entry = _stages.get(name)
+            if entry is None:
+                _stages[name] = [1, ended - started, started, ended]
+            else:
+                entry[0] += 1
+                entry[1] += ended - started
+                entry[2] = min(entry[2], started)
+                entry[3] = max(entry[3], ended)
+
+
+def snapshot():
+    with _lock:
+        counters = dict(sorted(_counters.items()))
+        stages = {
+            name: {
+                "calls": calls,
+                "busy_seconds": round(busy, 3),
+                "wall_seconds": round(last - first, 3),
+            }
+            for name, (calls, busy, first, last) in sorted(_stages.items())
+        }
+    return {"stages": stages, "counters": counters, "http": http_client.latency_stats()}
+
+
+def write_report(script, status, started_at, duration):
+    """Пишет отчёт <script>-<время>.json в REPORTS_DIR и возвращает путь (или None)."""
+    if not REPORTS_DIR:
+        return None
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    with _lock:
+        labels = dict(sorted(_labels.items()))
+    report = {
+        "script": script,
+        "started_at": started_at.isoformat(),
+        "duration_seconds": round(duration, 3),
+        "status": status,
+        **({"labels": labels} if labels else {}),
+        **snapshot(),
+    }
+    # Шарды одного запуска стартуют в одну секунду — метки различают их файлы
+    suffix = "".join(f"-{name}{value.replace('/', 'of')}" for name, value in labels.items())
+    path = os.path.join(REPORTS_DIR, f"{script}{suffix}-{started_at.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return path
+
+
+@contextmanager
+def run(script):
+    """Оборачивает main(): по завершению (в том числе с ошибкой) пишет отчёт."""
+    started_at = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            status = f"exit {e.code}"
+        raise
+    except BaseException as e:
+        status = f"error: {type(e).__name__}: {e}"
+        raise
+    finally:
+        try:
+            path = write_report(script, status, started_at, time.perf_counter() - started)
+            if path:
+                print(f"  Отчёт о запуске: {path}")
+        except OSError as e:
+            print(f"  Не удалось записать отчёт о запуске: {e}")
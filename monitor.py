@@ -8,15 +8,20 @@ Social Capital Monitor
 
 import os
 import json
-import requests
+import http_client
+import metrics
+import profiling
+import tracing
+import tenants
 from datetime import datetime, timedelta, date
-from notion_client import Client
+from contacts import compile_extractor, field_map
+from contact_store import load_pages
+from notion_query import select_in, on_or_before, all_of, property_names
+from html_extract import select_texts
 
 # ── Конфигурация ──────────────────────────────────────────────────────────────
-NOTION_TOKEN       = os.environ["NOTION_TOKEN"]
-NOTION_DATABASE_ID = os.environ["NOTION_DATABASE_ID"]   # b03e121d-30da-4657-b092-27bfcb449f23
-TELEGRAM_BOT_TOKEN = os.environ["TELEGRAM_BOT_TOKEN"]
-TELEGRAM_CHAT_ID   = os.environ["TELEGRAM_CHAT_ID"]
+# База, чат и токены — у арендатора (tenants.py): без TENANTS_FILE/TENANTS_JSON
+# это NOTION_TOKEN, NOTION_DATABASE_ID, TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID
 YOUTUBE_API_KEY    = os.environ.get("YOUTUBE_API_KEY", "")
 
 # Категории, которые мониторим (исключаем врагов/конкурентов и "Не помню")
@@ -33,82 +38,24 @@ MONITORED_CIRCLES = {
 MONITOR_DAYS_BEFORE = 6  # начинаем за 5-7 дней (берём 6 как середину)
 
 # ── Notion ────────────────────────────────────────────────────────────────────
+_FIELDS = field_map(
+    "name", "circle", "instagram", "telegram_channel", "youtube", "birthday",
+    "next_contact", "last_contact", "frequency", "notes", "goals", "manus_command",
+)
+_extract_contact = compile_extractor(_FIELDS)
+
+
 def get_contacts_to_monitor():
     """Возвращает контакты, у которых срок касания наступает через MONITOR_DAYS_BEFORE дней или уже прошёл."""
-    notion = Client(auth=NOTION_TOKEN)
+    tenant = tenants.current()
     today = date.today()
     cutoff = today + timedelta(days=MONITOR_DAYS_BEFORE)
 
-    results = []
-    cursor = None
-
-    while True:
-        kwargs = {
-            "database_id": NOTION_DATABASE_ID,
-            "filter": {
-                "and": [
-                    {
-                        "property": "Круг",
-                        "select": {"is_not_empty": True}
-                    },
-                    {
-                        "property": "Следующий контакт",
-                        "date": {"on_or_before": cutoff.isoformat()}
-                    }
-                ]
-            }
-        }
-        if cursor:
-            kwargs["start_cursor"] = cursor
-
-        response = notion.databases.query(**kwargs)
-        results.extend(response["results"])
-
-        if not response.get("has_more"):
-            break
-        cursor = response["next_cursor"]
-
-    # Фильтруем по нужным категориям
-    contacts = []
-    for page in results:
-        props = page["properties"]
-        circle = props.get("Круг", {}).get("select")
-        if not circle or circle.get("name") not in MONITORED_CIRCLES:
-            continue
-
-        def get_url(field):
-            v = props.get(field, {}).get("url")
-            return v if v else None
-
-        def get_text(field):
-            rich = props.get(field, {}).get("rich_text", [])
-            return "".join(r.get("plain_text", "") for r in rich) if rich else None
-
-        def get_date(field):
-            d = props.get(field, {}).get("date")
-            return d.get("start") if d else None
-
-        def get_title():
-            t = props.get("Имя", {}).get("title", [])
-            return "".join(r.get("plain_text", "") for r in t) if t else "Без имени"
-
-        contacts.append({
-            "page_id": page["id"],
-            "name": get_title(),
-            "circle": circle.get("name"),
-            "instagram": get_url("Insta"),
-            "telegram_channel": get_url("Telegram канал"),
-            "youtube": get_url("YouTube"),
-            "birthday": get_date("ДР"),
-            "next_contact": get_date("Следующий контакт"),
-            "last_contact": get_date("Последний контакт"),
-            "frequency": props.get("Частота контактов дни", {}).get("number"),
-            "notes": get_text("Заметки"),
-            "goals": get_text("Цели"),
-            "manus_command": get_text("Команда для Manus"),
-        })
-
-    return contacts
+    # Нужные круги и срок до cutoff — фильтр исполняет Notion (или снимок);
+    # сырые страницы не накапливаем
+    query = all_of(select_in("circle", MONITORED_CIRCLES), on_or_before("next_contact", cutoff))
+    pages = load_pages(tenant.notion, tenant.database_id, query, property_names(_FIELDS))
+    return [_extract_contact(page) for page in pages]
 
 
 # ── Instagram (без авторизации, публичные профили) ────────────────────────────
@@ -123,6 +70,7 @@ def extract_instagram_username(url):
     return None
 
 
+@profiling.hot
 def get_instagram_posts(username, max_posts=3):
     """Получаем последние посты через публичный веб-интерфейс Instagram."""
     if not username:
@@ -134,18 +82,15 @@ def get_instagram_posts(username, max_posts=3):
             "Accept-Language": "ru-RU,ru;q=0.9,en;q=0.8",
         }
         # Используем Picuki как зеркало для публичных профилей
-        url = f"https://www.picuki.com/profile/{username}"
-        resp = requests.get(url, headers=headers, timeout=15)
+        url = f"{http_client.PICUKI_BASE}/profile/{username}"
+        resp = http_client.get(url, headers=headers, timeout=15)
         if resp.status_code != 200:
             return []
 
-        from bs4 import BeautifulSoup
-        soup = BeautifulSoup(resp.text, "html.parser")
         posts = []
 
         # Ищем посты в разметке Picuki
-        for item in soup.select(".photo-description")[:max_posts]:
-            text = item.get_text(strip=True)
+        for text in select_texts(resp.text, "photo-description", limit=max_posts):
             if text:
                 posts.append({"text": text[:300], "source": "instagram"})
 
@@ -170,6 +115,7 @@ def extract_telegram_channel(url):
     return None
 
 
+@profiling.hot
 def get_telegram_posts(channel, max_posts=3):
     """Получаем последние посты из публичного Telegram-канала через t.me/s/."""
     if not channel:
@@ -178,17 +124,14 @@ def get_telegram_posts(channel, max_posts=3):
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
         }
-        url = f"https://t.me/s/{channel}"
-        resp = requests.get(url, headers=headers, timeout=15)
+        url = f"{http_client.TELEGRAM_WEB_BASE}/s/{channel}"
+        resp = http_client.get(url, headers=headers, timeout=15)
         if resp.status_code != 200:
             return []
 
-        from bs4 import BeautifulSoup
-        soup = BeautifulSoup(resp.text, "html.parser")
         posts = []
 
-        for msg in soup.select(".tgme_widget_message_text")[:max_posts]:
-            text = msg.get_text(separator=" ", strip=True)
+        for text in select_texts(resp.text, "tgme_widget_message_text", " ", limit=max_posts):
             if text and len(text) > 10:
                 posts.append({"text": text[:400], "source": "telegram"})
 
@@ -213,6 +156,7 @@ def extract_youtube_channel_id(url):
     return None
 
 
+@profiling.hot
 def get_youtube_videos(channel_url, max_videos=2):
     """Получаем последние видео через YouTube Data API v3."""
     if not channel_url or not YOUTUBE_API_KEY:
@@ -223,7 +167,7 @@ def get_youtube_videos(channel_url, max_videos=2):
             return []
 
         # Сначала получаем channel ID по handle
-        search_url = "https://www.googleapis.com/youtube/v3/search"
+        search_url = f"{http_client.YOUTUBE_API_BASE}/youtube/v3/search"
         params = {
             "part": "snippet",
             "q": handle,
@@ -231,7 +175,7 @@ def get_youtube_videos(channel_url, max_videos=2):
             "maxResults": 1,
             "key": YOUTUBE_API_KEY,
         }
-        resp = requests.get(search_url, params=params, timeout=10)
+        resp = http_client.get(search_url, params=params, timeout=10)
         data = resp.json()
         items = data.get("items", [])
         if not items:
@@ -248,7 +192,7 @@ def get_youtube_videos(channel_url, max_videos=2):
             "type": "video",
             "key": YOUTUBE_API_KEY,
         }
-        resp2 = requests.get(search_url, params=params2, timeout=10)
+        resp2 = http_client.get(search_url, params=params2, timeout=10)
         data2 = resp2.json()
 
         videos = []
@@ -274,17 +218,17 @@ def check_birthdays(contacts):
     today = date.today()
     upcoming = []
     for c in contacts:
-        if not c.get("birthday"):
+        if not c.birthday:
             continue
         try:
-            bday = date.fromisoformat(c["birthday"])
+            bday = date.fromisoformat(c.birthday)
             this_year = bday.replace(year=today.year)
             if this_year < today:
                 this_year = bday.replace(year=today.year + 1)
             days_left = (this_year - today).days
             if 0 <= days_left <= 14:
                 upcoming.append({
-                    "name": c["name"],
+                    "name": c.name,
                     "days_left": days_left,
                     "date": this_year.strftime("%d.%m"),
                 })
@@ -346,13 +290,14 @@ def format_digest(contacts_data, birthdays):
 
 # ── Отправка в Telegram ───────────────────────────────────────────────────────
 def send_telegram(text):
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
+    tenant = tenants.current()
+    url = f"{tenant.tg_api}/sendMessage"
     # Разбиваем на части если текст длинный (лимит 4096 символов)
     max_len = 4000
     parts = [text[i:i+max_len] for i in range(0, len(text), max_len)]
     for part in parts:
-        resp = requests.post(url, json={
-            "chat_id": TELEGRAM_CHAT_ID,
+        resp = http_client.post(url, json={
+            "chat_id": tenant.chat_id,
             "text": part,
             "parse_mode": "Markdown",
         }, timeout=15)
@@ -368,6 +313,7 @@ def main():
     print("Читаем базу Notion...")
     contacts = get_contacts_to_monitor()
     print(f"  Найдено контактов для мониторинга: {len(contacts)}")
+    metrics.incr("contacts.total", len(contacts))
 
     if not contacts:
         send_telegram("✅ *Дайджест:* Сегодня нет контактов для касания. Хорошего дня!")
@@ -380,43 +326,47 @@ def main():
     today = date.today()
     contacts_data = []
     for c in contacts:
-        print(f"  Мониторинг: {c['name']}...")
+        print(f"  Мониторинг: {c.name}...")
         news = []
 
-        # Instagram
-        ig_user = extract_instagram_username(c.get("instagram"))
-        if ig_user:
-            posts = get_instagram_posts(ig_user)
-            news.extend(posts)
-
-        # Telegram
-        tg_channel = extract_telegram_channel(c.get("telegram_channel"))
-        if tg_channel:
-            posts = get_telegram_posts(tg_channel)
-            news.extend(posts)
-
-        # YouTube
-        if c.get("youtube"):
-            videos = get_youtube_videos(c["youtube"])
-            news.extend(videos)
+        with metrics.stage("scrape"):
+            # Instagram
+            ig_user = extract_instagram_username(c.instagram)
+            if ig_user:
+                posts = get_instagram_posts(ig_user)
+                news.extend(posts)
+
+            # Telegram
+            tg_channel = extract_telegram_channel(c.telegram_channel)
+            if tg_channel:
+                posts = get_telegram_posts(tg_channel)
+                news.extend(posts)
+
+            # YouTube
+            if c.youtube:
+                videos = get_youtube_videos(c.youtube)
+                news.extend(videos)
+        metrics.incr("contacts.with_news" if news else "contacts.without_news")
 
         # Определяем просрочен ли контакт
         overdue = False
-        if c.get("next_contact"):
+        if c.next_contact:
             try:
-                next_dt = date.fromisoformat(c["next_contact"])
+                next_dt = date.fromisoformat(c.next_contact)
                 overdue = next_dt <= today
             except Exception:
                 pass
 
-        contacts_data.append({**c, "news": news, "overdue": overdue})
+        contacts_data.append({**c.as_dict(), "news": news, "overdue": overdue})
 
     # 4. Формируем и отправляем дайджест
     digest = format_digest(contacts_data, birthdays)
     print("Отправляем дайджест в Telegram...")
-    send_telegram(digest)
+    with metrics.stage("telegram_send"):
+        send_telegram(digest)
     print("Готово!")
 
 
 if __name__ == "__main__":
-    main()
+    with metrics.run("monitor"), profiling.session("monitor"), tracing.session("monitor"):
+        main()
@@ -4,17 +4,38 @@ Social Capital Monitor — Скрипт 1: Мониторинг соцсетей
 Собирает посты из Instagram и Telegram, анализирует через Gemini AI,
 записывает ключевые события в поле «Новости» в Notion.
 Запускается ежедневно через GitHub Actions.
+Контакты всех арендаторов (tenants.py) идут через один конвейер
+вперемешку, по кругу; источник, на который подписаны несколько
+контактов, за запуск скачивается один раз.
+С --shard i/N обрабатывается только i-я из N долей контактов (shards.py).
+С --resume продолжает прерванный запуск по журналу прогресса (journal.py).
 """
 import os
+import argparse
+import json
 import time
-import requests
+import threading
+import http_client
+import metrics
+import profiling
+import tracing
+import tenants
+import shards
+import journal
 from datetime import datetime, timedelta, date
-from notion_client import Client
-from gemini import generate_with_retry # Импортируем новую функцию
+from notion_writer import rich_text
+from contact_store import load_pages
+from notion_query import select_in, is_not_empty, all_of, any_of, property_names
+from contacts import compile_extractor, field_map
+from gemini import generate_with_retry, generate_with_model
+from gemini import cache_lookup as gemini_cache_lookup, cache_store as gemini_cache_store
+from html_extract import select_texts, telegram_messages
+from pipeline import Stage, run_pipeline
+from source_state import default_state, conditional_headers, fingerprint
 
 # ── Конфигурация ──────────────────────────────────────────────────────────────
-NOTION_TOKEN       = os.environ["NOTION_TOKEN"]
-NOTION_DATABASE_ID = os.environ["NOTION_DATABASE_ID"]
+# База и токен — у арендатора (tenants.py); круги арендатора, если заданы,
+# дополнительно ограничивают выборку, limits.max_contacts — её размер
 
 # За сколько дней до срока начинаем мониторинг
 MONITOR_DAYS_BEFORE = 7
@@ -32,75 +53,135 @@ MONITORED_CIRCLES = {
 # Приоритеты для сбора новостей
 HIGH_PRIORITY_NEWS = {"Высокий", "Средний"}
 
-# ── Notion helpers ─────────────────────────────────────────────────────────────
-def get_contacts_to_monitor():
-    """Возвращает контакты с приоритетом Высокий/Средний у которых есть Telegram-канал.
-    Новости собираются независимо от дат — для всех приоритетных контактов ежедневно."""
-    notion = Client(auth=NOTION_TOKEN)
-
-    all_pages = []
-    cursor = None
-    while True:
-        kwargs = {"database_id": NOTION_DATABASE_ID, "page_size": 100}
-        if cursor:
-            kwargs["start_cursor"] = cursor
-        resp = notion.databases.query(**kwargs)
-        all_pages.extend(resp["results"])
-        if not resp.get("has_more"):
-            break
-        cursor = resp["next_cursor"]
+# Воркеры стадий конвейера: скрапинг, Gemini, запись в Notion.
+# Gemini и Notion ограничены по rate limit, скрапинг — только сетью
+SCRAPE_WORKERS = 8
+GEMINI_WORKERS = 2
+NOTION_WORKERS = 2
 
-    contacts = []
-    for page in all_pages:
-        props = page["properties"]
+# Пакетный анализ: сколько контактов в одном запросе к Gemini,
+# бюджет входных токенов на запрос и сколько ждать добора пачки
+GEMINI_BATCH_MAX_CONTACTS  = 8
+GEMINI_BATCH_TOKEN_BUDGET  = 12000
+GEMINI_BATCH_OUTPUT_TOKENS = 400   # на один контакт в ответе
+GEMINI_BATCH_WAIT          = 3.0
 
-        def get_url(field):
-            v = props.get(field, {}).get("url")
-            return v if v else None
+# Telegram: сколько страниц ленты t.me/s (по ~20 сообщений) листать назад,
+# догоняя пропущенное, и сколько новых постов максимум отдавать в анализ
+TG_MAX_PAGES     = int(os.environ.get("TG_MAX_PAGES", "3"))
+TG_MAX_NEW_POSTS = int(os.environ.get("TG_MAX_NEW_POSTS", "15"))
 
-        def get_title():
-            t = props.get("Имя", {}).get("title", [])
-            return "".join(r.get("plain_text", "") for r in t) if t else "Без имени"
+# ── Notion helpers ─────────────────────────────────────────────────────────────
+_FIELDS = field_map(
+    "name", "priority", "instagram", "telegram_channel", "tg_personal", "news",
+)
+_extract_contact = compile_extractor(_FIELDS)
 
-        name = get_title()
-        priority = (props.get("Приоритет", {}).get("select") or {}).get("name", "")
-        instagram = get_url("Insta")
-        # Проверяем оба поля: публичный канал и личный TG
-        tg_channel = get_url("Telegram канал") or get_url("Личный TG")
+# Высокий/Средний приоритет и хотя бы один источник: публичный канал,
+# личный TG или Instagram. Фильтр исполняет Notion (или снимок в SQLite)
+CONTACTS_FILTER = all_of(
+    select_in("priority", HIGH_PRIORITY_NEWS),
+    any_of(is_not_empty("telegram_channel"), is_not_empty("tg_personal"), is_not_empty("instagram")),
+)
 
-        # Только Высокий и Средний приоритет
-        if priority not in HIGH_PRIORITY_NEWS:
-            continue
 
-        # Нужен хотя бы один источник для мониторинга
-        # Предпочитаем Telegram, Instagram как запасной
-        if not tg_channel and not instagram:
-            continue
+def get_contacts_to_monitor(tenant):
+    """Возвращает контакты с приоритетом Высокий/Средний у которых есть Telegram-канал.
+    Новости собираются независимо от дат — для всех приоритетных контактов ежедневно."""
+    query = CONTACTS_FILTER
+    if tenant.circles:
+        query = all_of(query, select_in("circle", tenant.circles))
+    limit = tenant.limit("max_contacts", None)
 
-        contacts.append({
-            "page_id": page["id"],
-            "name": name,
-            "priority": priority,
-            "instagram": instagram,
-            "telegram_channel": tg_channel,
-        })
+    contacts = []
+    pages = load_pages(tenant.notion, tenant.database_id, query, property_names(_FIELDS))
+    for page in pages:
+        c = _extract_contact(page)
+
+        # Текущее значение «Новостей» — запись того же текста не уйдёт в Notion
+        tenant.writer.remember(c.page_id, {"Новости": rich_text(c.news)})
+        tenant.own(c.page_id)
+        contacts.append(c)
+        if limit and len(contacts) >= limit:
+            break
 
     return contacts
 
 
 def update_notion_field(page_id, field_name, content):
-    """Обновляет указанное текстовое поле в Notion."""
-    notion = Client(auth=NOTION_TOKEN)
-    notion.pages.update(
-        page_id=page_id,
-        properties={
-            field_name: {
-                "rich_text": [{"type": "text", "text": {"content": content[:2000]}}]
-            }
-        }
-    )
+    """Обновляет указанное текстовое поле в Notion. Возвращает False, если значение не изменилось."""
+    return tenants.owner(page_id).writer.write(page_id, {field_name: rich_text(content)})
 
 # ── Парсинг соцсетей ──────────────────────────────────────────────────────────
+# Источник за запуск скачивается один раз: остальные контакты (в том числе
+# других арендаторов) с тем же каналом получают тот же результат
+_shared_sources = {}   # ключ источника -> [Event, результат]
+_shared_lock = threading.Lock()
+
+
+def shared_source(key, fetch):
+    """fetch() для источника key — один раз на запуск; параллельные
+    вызовы с тем же ключом ждут первый."""
+    with _shared_lock:
+        entry = _shared_sources.get(key)
+        first = entry is None
+        if first:
+            entry = _shared_sources[key] = [threading.Event(), None]
+    if first:
+        try:
+            entry[1] = fetch()
+        finally:
+            entry[0].set()
+        return entry[1]
+    entry[0].wait()
+    metrics.incr("sources.shared")
+    return entry[1] if entry[1] is not None else fetch()
+
+class SourceRecords:
+    """Новые записи состояния источников, общих для нескольких контактов.
+    Запись источника сохраняется, когда все контакты запуска с этим
+    источником дошли до конца и ни один не упал: иначе упавший контакт
+    на следующем запуске увидел бы источник «без изменений» и не получил
+    бы его посты. Источник, которого нет в expect, сохраняется сразу."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}   # ключ источника -> page_id контактов, ещё не дошедших до конца
+        self.failed = set()
+        self.records = {}
+
+    def expect(self, contacts):
+        with self.lock:
+            for c in contacts:
+                for key in source_keys(c):
+                    self.pending.setdefault(key, set()).add(c.page_id)
+
+    def done(self, page_id, records, ok=True):
+        """Контакт дошёл до конца; records — его [(ключ, запись)], ok — без сбоя."""
+        state = default_state()
+        with self.lock:
+            ready = []
+            for key, record in records:
+                if key not in self.pending:
+                    if ok:
+                        state.put(key, record)
+                    continue
+                self.records[key] = record
+            for key, users in self.pending.items():
+                if page_id not in users:
+                    continue
+                users.discard(page_id)
+                if not ok:
+                    self.failed.add(key)
+                if not users and key not in self.failed and key in self.records:
+                    ready.append(key)
+            for key in ready:
+                state.put(key, self.records.pop(key))
+
+
+_source_records = SourceRecords()
+
+
 def extract_instagram_username(url):
     if not url:
         return None
@@ -111,29 +192,64 @@ def extract_instagram_username(url):
             return parts[i + 1].lstrip("@")
     return None
 
+def fetch_source(key, url, headers, parse):
+    """Скачивает страницу источника с условными заголовками и извлекает посты.
+    Возвращает {"key", "posts", "changed", "record"}. record — новая запись
+    состояния; её сохраняют только после успешной записи в Notion всех
+    контактов с этим источником (SourceRecords), чтобы сбой Gemini не привёл
+    к пропуску источника на следующий день."""
+    state = default_state()
+    record = state.get(key)
+    resp = http_client.get(url, headers={**headers, **conditional_headers(record)}, timeout=15)
+    if resp.status_code == 304 and record:
+        return {"key": key, "posts": record["posts"], "changed": False, "record": None}
+    if resp.status_code != 200:
+        # Источник недоступен — берём посты прошлого запуска, если они есть
+        posts = record["posts"] if record else []
+        return {"key": key, "posts": posts, "changed": False, "record": None}
+
+    posts = parse(resp.text)
+    new_record = {
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        "fingerprint": fingerprint(posts),
+        "posts": posts,
+    }
+    changed = record is None or record["fingerprint"] != new_record["fingerprint"]
+    if not changed:
+        # Посты те же — сразу обновляем валидаторы, в Notion писать нечего
+        state.put(key, new_record)
+        new_record = None
+    return {"key": key, "posts": posts, "changed": changed, "record": new_record}
+
+
+def _no_source(key=None):
+    return {"key": key, "posts": [], "changed": False, "record": None}
+
+
+@profiling.hot
 def get_instagram_posts(username, max_posts=5):
     if not username:
-        return []
+        return _no_source()
+    key = f"instagram:{username.lower()}"
     try:
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
             "Accept-Language": "ru-RU,ru;q=0.9,en;q=0.8",
         }
-        url = f"https://www.picuki.com/profile/{username}"
-        resp = requests.get(url, headers=headers, timeout=15)
-        if resp.status_code != 200:
-            return []
-        from bs4 import BeautifulSoup
-        soup = BeautifulSoup(resp.text, "html.parser")
-        posts = []
-        for item in soup.select(".photo-description")[:max_posts]:
-            text = item.get_text(strip=True)
-            if text and len(text) > 10:
-                posts.append(text[:500])
-        return posts
+        url = f"{http_client.PICUKI_BASE}/profile/{username}"
+
+        def parse(html):
+            posts = []
+            for text in select_texts(html, "photo-description", limit=max_posts):
+                if text and len(text) > 10:
+                    posts.append(text[:500])
+            return posts
+
+        return fetch_source(key, url, headers, parse)
     except Exception as e:
         print(f"  Instagram error @{username}: {e}")
-        return []
+        return _no_source(key)
 
 def extract_telegram_channel(url):
     if not url:
@@ -156,42 +272,91 @@ def extract_telegram_channel(url):
         return url.lstrip("@").strip()
     return None
 
+def source_keys(c):
+    """Ключи источников контакта — те же, что у shared_source в scrape_contact."""
+    keys = []
+    ig_user = extract_instagram_username(c.instagram)
+    if ig_user:
+        keys.append(f"instagram:{ig_user.lower()}")
+    tg_ch = extract_telegram_channel(c.telegram_channel or c.tg_personal)
+    if tg_ch:
+        keys.append(f"telegram:{tg_ch.lower()}")
+    return keys
+
+@profiling.hot
 def get_telegram_posts(channel, max_posts=5):
+    """Новые посты канала — с ID больше последнего обработанного.
+    Лента t.me/s отдаёт ~20 сообщений от старых к новым; если все они новее
+    сохранённого ID, листаем назад через ?before=<самый старый ID>, но не
+    дальше TG_MAX_PAGES страниц и пока не набрано TG_MAX_NEW_POSTS.
+    При первом запуске берём max_posts свежих.
+    Посты возвращаются от новых к старым. Если новых нет, changed=False, а
+    posts — последние виденные: канал остаётся в анализе, когда изменился
+    другой источник контакта."""
     if not channel:
-        return []
+        return _no_source()
+    key = f"telegram:{channel.lower()}"
     try:
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
         }
-        url = f"https://t.me/s/{channel}"
-        resp = requests.get(url, headers=headers, timeout=15)
+        url = f"{http_client.TELEGRAM_WEB_BASE}/s/{channel}"
+        state = default_state()
+        record = state.get(key)
+        last_id = record.get("last_message_id") if record else None
+
+        seen = record["posts"] if record else []
+        unchanged = {"key": key, "posts": seen, "changed": False, "record": None}
+
+        resp = http_client.get(url, headers={**headers, **conditional_headers(record)}, timeout=15)
         if resp.status_code != 200:
-            return []
-        from bs4 import BeautifulSoup
-        soup = BeautifulSoup(resp.text, "html.parser")
+            # 304 или канал недоступен — новых постов нет
+            return unchanged
+
+        validators = {"etag": resp.headers.get("ETag"),
+                      "last_modified": resp.headers.get("Last-Modified")}
+        messages = telegram_messages(resp.text)
+        if not messages:
+            return unchanged
+        newest_id = messages[-1][0]
+        new = [m for m in messages if last_id is None or m[0] > last_id]
+
+        pages = 1
+        while (last_id is not None and messages and messages[0][0] > last_id + 1
+               and len(new) < TG_MAX_NEW_POSTS and pages < TG_MAX_PAGES):
+            before = messages[0][0]
+            resp = http_client.get(url, params={"before": before}, headers=headers, timeout=15)
+            if resp.status_code != 200:
+                break
+            messages = [m for m in telegram_messages(resp.text) if m[0] < before]
+            new = [m for m in messages if m[0] > last_id] + new
+            pages += 1
+
         posts = []
-        for msg in soup.select(".tgme_widget_message_text")[:max_posts]:
-            text = msg.get_text(separator=" ", strip=True)
+        for _, text in reversed(new):
             if text and len(text) > 10:
                 posts.append(text[:500])
-        return posts
+        posts = posts[:max_posts if last_id is None else TG_MAX_NEW_POSTS]
+
+        if not posts:
+            # Новых текстовых постов нет (или только фото) — сдвигаем ID сразу,
+            # последние виденные посты сохраняем
+            state.put(key, {**validators, "fingerprint": fingerprint(seen), "posts": seen,
+                            "last_message_id": max(newest_id, last_id or 0)})
+            return unchanged
+        new_record = {
+            **validators,
+            "fingerprint": fingerprint(posts),
+            "posts": posts,
+            "last_message_id": max(newest_id, last_id or 0),
+        }
+        return {"key": key, "posts": posts, "changed": True, "record": new_record}
     except Exception as e:
         print(f"  Telegram error @{channel}: {e}")
-        return []
+        return _no_source(key)
 
 # ── AI-анализ через Gemini ────────────────────────────────────────────────────
-def analyze_posts_with_gemini(name, posts):
-    """Извлекает ключевые события из постов через Gemini AI."""
-    if not posts:
-        return ""
-
-    posts_text = "\n---\n".join(posts)
-    prompt = f"""Ты анализируешь публикации человека по имени {name} в соцсетях.
-
-Вот его последние посты:
-{posts_text}
-
-Извлеки ТОЛЬКО ключевые факты и события, которые полезны для личного общения:
+ANALYSIS_RULES = """Извлеки ТОЛЬКО ключевые факты и события, которые полезны для личного общения:
 - Текущие проекты (с названием и ссылкой если есть)
 - Ключевые события (конференции, запуски, достижения)
 - Важные изменения в жизни или бизнесе
@@ -201,51 +366,304 @@ def analyze_posts_with_gemini(name, posts):
 Максимум 4-5 пунктов. Только факты, без воды. Если ничего важного нет — напиши "• Нет значимых событий"
 Отвечай на русском языке."""
 
-    return generate_with_retry(prompt)
+# Структурированный ответ пакетного анализа: [{"page_id": ..., "summary": ...}, ...]
+BATCH_RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "page_id": {"type": "STRING"},
+            "summary": {"type": "STRING"},
+        },
+        "required": ["page_id", "summary"],
+    },
+}
 
-# ── Главная функция ───────────────────────────────────────────────────────────
-def main():
-    print(f"[{datetime.now().isoformat()}] Запуск мониторинга соцсетей...")
 
-    contacts = get_contacts_to_monitor()
-    print(f"  Контактов для мониторинга: {len(contacts)}")
+def build_analysis_prompt(name, posts):
+    posts_text = "\n---\n".join(posts)
+    return f"""Ты анализируешь публикации человека по имени {name} в соцсетях.
 
-    for c in contacts:
-        name = c["name"]
-        print(f"\n  → {name}")
+Вот его последние посты:
+{posts_text}
 
-        posts = []
+{ANALYSIS_RULES}"""
+
+
+@profiling.hot
+def analyze_posts_with_gemini(name, posts):
+    """Извлекает ключевые события из постов через Gemini AI."""
+    if not posts:
+        return ""
+    return generate_with_retry(build_analysis_prompt(name, posts))
+
+
+def estimate_tokens(text):
+    """Грубая оценка числа токенов: для смеси кириллицы и латиницы ~3 символа на токен."""
+    return len(text) // 3 + 1
+
+
+def plan_batches(items, token_budget=GEMINI_BATCH_TOKEN_BUDGET, max_contacts=GEMINI_BATCH_MAX_CONTACTS):
+    """Раскладывает контакты по пачкам, чтобы каждая укладывалась в бюджет токенов."""
+    batches = []
+    current, used = [], 0
+    for item in items:
+        cost = estimate_tokens(item["name"]) + sum(estimate_tokens(p) for p in item["posts"])
+        if current and (used + cost > token_budget or len(current) >= max_contacts):
+            batches.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
 
+
+def _parse_batch_response(text, page_ids):
+    """Разбирает JSON-ответ пакетного анализа в {page_id: summary}. Лишнее и пустое отбрасывает."""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return {}
+    if not isinstance(data, list):
+        return {}
+    summaries = {}
+    for entry in data:
+        if not isinstance(entry, dict):
+            continue
+        page_id = entry.get("page_id")
+        summary = entry.get("summary")
+        if page_id in page_ids and isinstance(summary, str) and summary.strip():
+            summaries[page_id] = summary.strip()
+    return summaries
+
+
+@profiling.hot
+def analyze_posts_batch(items):
+    """Анализирует посты нескольких контактов одним запросом к Gemini.
+    items — словари с page_id, name, posts. Возвращает {page_id: анализ}.
+    Контакты, для которых ответ некорректен или отсутствует, анализируются поштучно."""
+    results = {}
+    pending = []
+    # Ответы прошлых запусков лежат в кэше под ключом одиночного промпта
+    for item in items:
+        cached = gemini_cache_lookup(build_analysis_prompt(item["name"], item["posts"]))
+        if cached:
+            results[item["page_id"]] = cached
+        else:
+            pending.append(item)
+
+    for batch in plan_batches(pending):
+        with tracing.span("gemini batch", contacts=len(batch)):
+            for item in batch:
+                tracing.step(item["page_id"])
+            results.update(_analyze_batch(batch))
+
+    return results
+
+
+def _analyze_batch(batch):
+    """Один пакетный запрос; недостающие ответы — поштучно."""
+    results = {}
+    summaries = {}
+    model = None    # модель, ответившая на пакет, — под ней кэшируются ответы
+    if len(batch) > 1:
+        blocks = []
+        for item in batch:
+            posts_text = "\n---\n".join(item["posts"])
+            blocks.append(f"### page_id: {item['page_id']}\nИмя: {item['name']}\nПосты:\n{posts_text}")
+        prompt = f"""Ты анализируешь публикации нескольких людей в соцсетях.
+Для каждого человека ниже отдельно выполни задачу:
+
+{ANALYSIS_RULES}
+
+Верни JSON-массив: по одному объекту на каждого человека с полями
+"page_id" (ровно как указан в заголовке) и "summary" (пункты списка через перевод строки).
+
+""" + "\n\n".join(blocks)
+        config = {
+            "maxOutputTokens": GEMINI_BATCH_OUTPUT_TOKENS * len(batch),
+            "temperature": 0.3,
+            "responseMimeType": "application/json",
+            "responseSchema": BATCH_RESPONSE_SCHEMA,
+        }
+        text, model = generate_with_model(prompt, generation_config=config)
+        summaries = _parse_batch_response(text, {item["page_id"] for item in batch})
+        if len(summaries) < len(batch):
+            print(f"  Пакетный ответ Gemini неполный ({len(summaries)}/{len(batch)}), "
+                  f"остальные анализируем по одному")
+
+    for item in batch:
+        summary = summaries.get(item["page_id"])
+        if summary:
+            gemini_cache_store(build_analysis_prompt(item["name"], item["posts"]), summary, model)
+        else:
+            summary = analyze_posts_with_gemini(item["name"], item["posts"])
+        results[item["page_id"]] = summary
+
+    return results
+
+# ── Стадии конвейера ──────────────────────────────────────────────────────────
+def scrape_contact(c):
+    """Стадия 1: собирает посты из Instagram и Telegram.
+    Если ни один источник не изменился с прошлого запуска — контакт пропускается."""
+    name = c.name
+    sources = []
+
+    # Прерванный запуск уже получил сводку Gemini — сразу к записи
+    saved = journal.current().payload(c.page_id, "analyze")
+    if saved is not None:
+        print(f"  → {name}: сводка из прерванного запуска")
+        metrics.incr("contacts.resumed")
+        return saved
+
+    with metrics.stage("scrape"), tracing.span("contact", flow=c.page_id, contact=name):
         # Instagram
-        ig_user = extract_instagram_username(c.get("instagram"))
+        ig_user = extract_instagram_username(c.instagram)
         if ig_user:
-            ig_posts = get_instagram_posts(ig_user)
-            posts.extend(ig_posts)
-            print(f"    Instagram @{ig_user}: {len(ig_posts)} постов")
+            with tracing.span("instagram", cat="source", account=ig_user) as sp:
+                ig = shared_source(f"instagram:{ig_user.lower()}",
+                                   lambda: get_instagram_posts(ig_user))
+                sp.set(posts=len(ig["posts"]), changed=ig["changed"])
+            sources.append(ig)
+            note = "" if ig["changed"] else " (без изменений)"
+            print(f"  → {name}: Instagram @{ig_user}: {len(ig['posts'])} постов{note}")
 
         # Telegram
-        tg_ch = extract_telegram_channel(c.get("telegram_channel"))
+        # Предпочитаем публичный канал, личный TG как запасной
+        tg_ch = extract_telegram_channel(c.telegram_channel or c.tg_personal)
         if tg_ch:
-            tg_posts = get_telegram_posts(tg_ch)
-            posts.extend(tg_posts)
-            print(f"    Telegram @{tg_ch}: {len(tg_posts)} постов")
+            with tracing.span("telegram", cat="source", channel=tg_ch) as sp:
+                tg = shared_source(f"telegram:{tg_ch.lower()}",
+                                   lambda: get_telegram_posts(tg_ch))
+                sp.set(posts=len(tg["posts"]), changed=tg["changed"])
+            sources.append(tg)
+            note = "" if tg["changed"] else " (без изменений)"
+            print(f"  → {name}: Telegram @{tg_ch}: {len(tg['posts'])} постов{note}")
+
+    for src in sources:
+        metrics.incr("sources.changed" if src["changed"] else "sources.unchanged")
+    # Сначала — изменилось ли что-то: источник без новых постов (304, нет ID
+    # новее сохранённого) — «без изменений», а не «постов нет»
+    posts = [p for src in sources for p in src["posts"]]
+    if sources and not any(src["changed"] for src in sources):
+        print(f"  → {name}: новых постов нет, пропускаем")
+        metrics.incr("contacts.skipped_unchanged")
+        tracing.instant("skip", contact=name, reason="unchanged")
+        journal.current().finish(c.page_id, "skipped_unchanged")
+        _source_records.done(c.page_id, [])
+        return None
+    if not posts:
+        print(f"  → {name}: постов не найдено, пропускаем")
+        metrics.incr("contacts.skipped_no_posts")
+        tracing.instant("skip", contact=name, reason="no posts")
+        journal.current().finish(c.page_id, "skipped_no_posts")
+        _source_records.done(c.page_id, [])
+        return None
 
-        if not posts:
-            print(f"    Постов не найдено, пропускаем")
+    records = [(src["key"], src["record"]) for src in sources if src["record"]]
+    return {"page_id": c.page_id, "name": name, "posts": posts, "source_records": records,
+            "news": c.news}
+
+
+def analyze_contacts(items):
+    """Стадия 2: AI-анализ постов пачкой контактов."""
+    progress = journal.current()
+    # Сводки из прерванного запуска (см. scrape_contact) проходят без Gemini
+    out = [item for item in items if "analysis" in item]
+    fresh = [item for item in items if "analysis" not in item]
+    analyses = analyze_posts_batch(fresh) if fresh else {}
+    for item in fresh:
+        analysis = analyses.get(item["page_id"])
+        if not analysis:
+            print(f"  → {item['name']}: AI не вернул результат")
+            metrics.incr("contacts.no_analysis")
+            progress.fail(item["page_id"], "analyze", "AI не вернул результат")
+            _source_records.done(item["page_id"], item["source_records"], ok=False)
             continue
+        item = {**item, "analysis": analysis}
+        progress.record(item["page_id"], "analyze", item)
+        out.append(item)
+    return out
+
+
+def write_contact(item):
+    """Стадия 3: запись новостей в Notion."""
+    with tracing.span("write", flow=item["page_id"], flow_end=True, contact=item["name"]):
+        try:
+            return _write_contact(item)
+        except Exception:
+            _source_records.done(item["page_id"], item["source_records"], ok=False)
+            raise
+
+
+def _write_contact(item):
+    # Сводка та же, что уже в Notion (отличается только дата) — не перезаписываем
+    previous = (item.get("news") or "").split("\n", 1)
+    unchanged = (len(previous) == 2 and previous[0].startswith("[Обновлено")
+                 and previous[1].strip() == item["analysis"].strip())
+    if not unchanged:
+        today_str = date.today().strftime("%d.%m.%Y")
+        news_content = f"[Обновлено {today_str}]\n{item['analysis']}"
+        update_notion_field(item["page_id"], "Новости", news_content)
+    _source_records.done(item["page_id"], item["source_records"])
+    if unchanged:
+        print(f"  → {item['name']}: сводка не изменилась, запись пропущена")
+        metrics.incr("contacts.summary_unchanged")
+    else:
+        print(f"  → {item['name']}: новости обновлены в Notion")
+        metrics.incr("contacts.updated")
+    journal.current().finish(item["page_id"], "summary_unchanged" if unchanged else "updated")
+    return item
 
-        # AI-анализ
-        analysis = analyze_posts_with_gemini(name, posts)
-        if analysis:
-            today_str = date.today().strftime("%d.%m.%Y")
-            news_content = f"[Обновлено {today_str}]\n{analysis}"
-            update_notion_field(c["page_id"], "Новости", news_content)
-            print(f"    Новости обновлены в Notion")
-        else:
-            print(f"    AI не вернул результат")
 
-    print(f"\n[{datetime.now().isoformat()}] Мониторинг завершён")
+# ── Главная функция ───────────────────────────────────────────────────────────
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Мониторинг соцсетей контактов")
+    parser.add_argument("--shard", type=shards.argument, default=None, metavar="i/N",
+                        help="обработать только i-ю из N долей контактов (с нуля)")
+    parser.add_argument("--resume", action="store_true",
+                        help="продолжить последний запуск: пропустить обработанные контакты")
+    args = parser.parse_args(argv)
+
+    print(f"[{datetime.now().isoformat()}] Запуск мониторинга соцсетей...")
+    if args.shard:
+        metrics.label("shard", "{}/{}".format(*args.shard))
+
+    # Контакты арендаторов — по кругу: конвейер берёт их по очереди,
+    # и большой арендатор не откладывает маленьких до конца своего списка.
+    # Шард выбирается после лимитов арендаторов — доли не пересекаются
+    # и вместе дают ровно тот же список, что и запуск без шардов
+    # Упавший арендатор не останавливает остальных; запуск — с ошибкой в конце
+    per_tenant, failed = tenants.run_all(get_contacts_to_monitor)
+    contacts = shards.select(list(tenants.interleave(per_tenant.values())), args.shard)
+    if args.shard:
+        print("  Шард {}/{}".format(*args.shard))
+    print(f"  Контактов для мониторинга: {len(contacts)}")
+
+    # У шарда свой журнал: шарды на одной машине не сбрасывают друг другу прогресс
+    job = "monitor_social" + ("-shard{}of{}".format(*args.shard) if args.shard else "")
+    progress = journal.start(job, resume=args.resume)
+    if progress.resumed:
+        remaining = progress.pending(contacts)
+        print(f"  Уже обработано: {len(contacts) - len(remaining)}, осталось: {len(remaining)}")
+        metrics.incr("contacts.already_done", len(contacts) - len(remaining))
+        contacts = remaining
+    metrics.incr("contacts.total", len(contacts))
+    _source_records.expect(contacts)
+
+    updated = run_pipeline(contacts, [
+        Stage("scrape", scrape_contact, workers=SCRAPE_WORKERS),
+        Stage("gemini", analyze_contacts, workers=GEMINI_WORKERS,
+              batch_size=GEMINI_BATCH_MAX_CONTACTS, batch_wait=GEMINI_BATCH_WAIT),
+        Stage("notion", write_contact, workers=NOTION_WORKERS),
+    ])
+
+    print(f"\n[{datetime.now().isoformat()}] Мониторинг завершён. Обновлено: {len(updated)}/{len(contacts)}")
+    tenants.check(failed)
 
 
 if __name__ == "__main__":
-    main()
+    with metrics.run("monitor_social"), profiling.session("monitor_social"), \
+            tracing.session("monitor_social"):
+        main()
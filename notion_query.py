@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Social Capital Monitor — фильтры и проекция запросов к базе Notion
+Фильтр описывается один раз через конструкторы ниже (по атрибутам Contact
+из contacts.FIELDS) и исполняется там, где дешевле:
+  • без снимка — уходит в Notion как filter запроса, вместе с
+    filter_properties: Notion отдаёт только подходящие страницы и только
+    нужные скрипту свойства;
+  • со снимком — снимок синхронизируется целиком, а фильтр и проекция
+    превращаются в SQL над JSON в SQLite (to_sql, project_sql): страницы,
+    не прошедшие фильтр, даже не разбираются из JSON.
+matches() — та же семантика на Python, для страницы в памяти.
+"""
+import threading
+from urllib.parse import unquote
+
+from contacts import FIELDS
+from notion_writer import call_with_retries
+
+
+# ── Конструкторы фильтров ─────────────────────────────────────────────────────
+# Формат — JSON фильтра Notion API; условия на свойство: {"property", <тип>: {...}}
+def select_in(attr, values):
+    """Select-свойство равно одному из values (в Notion нет «in» — это or из equals)."""
+    prop_name, kind = FIELDS[attr]
+    return any_of(*({"property": prop_name, kind: {"equals": v}} for v in sorted(values)))
+
+
+def is_empty(attr):
+    prop_name, kind = FIELDS[attr]
+    return {"property": prop_name, kind: {"is_empty": True}}
+
+
+def is_not_empty(attr):
+    prop_name, kind = FIELDS[attr]
+    return {"property": prop_name, kind: {"is_not_empty": True}}
+
+
+def on_or_before(attr, day):
+    """Дата свойства (начало диапазона) не позже day."""
+    prop_name, kind = FIELDS[attr]
+    return {"property": prop_name, kind: {"on_or_before": day.isoformat()}}
+
+
+def _compound(op, filters):
+    # Вложенные and/or того же вида раскрываются: Notion допускает
+    # только два уровня вложенности составных фильтров
+    flat = []
+    for f in filters:
+        flat.extend(f[op] if op in f else [f])
+    return flat[0] if len(flat) == 1 else {op: flat}
+
+
+def all_of(*filters):
+    return _compound("and", filters)
+
+
+def any_of(*filters):
+    return _compound("or", filters)
+
+
+# ── Исполнение на Python ──────────────────────────────────────────────────────
+def _value(prop, kind):
+    """Сырое значение свойства для сравнения; None — свойство пустое."""
+    raw = prop.get(kind) if prop else None
+    if kind in ("title", "rich_text"):
+        return raw or None
+    if kind == "select":
+        return raw.get("name") if raw else None
+    if kind == "date":
+        return raw.get("start") if raw else None
+    if kind == "url":
+        return raw or None
+    return raw
+
+
+def _condition(filter):
+    """{"property": имя, <тип>: {<условие>: операнд}} -> (имя, тип, условие, операнд)."""
+    kind = next(k for k in filter if k != "property")
+    (cond, operand), = filter[kind].items()
+    return filter["property"], kind, cond, operand
+
+
+def matches(filter, page):
+    """Проходит ли страница (ответ Notion: id, last_edited_time, properties) фильтр."""
+    if filter is None:
+        return True
+    if "and" in filter:
+        return all(matches(f, page) for f in filter["and"])
+    if "or" in filter:
+        return any(matches(f, page) for f in filter["or"])
+    if "timestamp" in filter:
+        edited = page.get(filter["timestamp"], "")
+        return edited >= filter[filter["timestamp"]]["on_or_after"]
+
+    prop_name, kind, cond, operand = _condition(filter)
+    value = _value(page["properties"].get(prop_name), kind)
+    if cond == "is_empty":
+        return value is None
+    if cond == "is_not_empty":
+        return value is not None
+    if cond == "equals":
+        return value == operand
+    if cond == "on_or_before":
+        return value is not None and value[:10] <= operand
+    if cond == "on_or_after":
+        return value is not None and value[:10] >= operand
+    raise ValueError(f"Условие фильтра не поддерживается: {kind}.{cond}")
+
+
+# ── Исполнение в SQLite (снимок) ──────────────────────────────────────────────
+def _json_path(prop_name, *keys):
+    if '"' in prop_name:
+        raise ValueError(f"Кавычки в имени свойства не поддерживаются: {prop_name}")
+    return ".".join([f'$."{prop_name}"', *keys])
+
+
+def _sql_value(prop_name, kind, column):
+    """SQL-выражение со значением свойства в той же семантике, что _value."""
+    if kind in ("title", "rich_text"):
+        return f"NULLIF(COALESCE(json_array_length({column}, ?), 0), 0)", [_json_path(prop_name, kind)]
+    if kind == "select":
+        return f"json_extract({column}, ?)", [_json_path(prop_name, "select", "name")]
+    if kind == "date":
+        return f"json_extract({column}, ?)", [_json_path(prop_name, "date", "start")]
+    if kind == "url":
+        return f"NULLIF(json_extract({column}, ?), '')", [_json_path(prop_name, "url")]
+    return f"json_extract({column}, ?)", [_json_path(prop_name, kind)]
+
+
+def to_sql(filter, column="properties"):
+    """Фильтр -> (условие WHERE, параметры) над JSON-колонкой свойств."""
+    if filter is None:
+        return "1", []
+    for op, joiner in (("and", " AND "), ("or", " OR ")):
+        if op in filter:
+            parts = [to_sql(f, column) for f in filter[op]]
+            return ("(" + joiner.join(sql for sql, _ in parts) + ")",
+                    [p for _, params in parts for p in params])
+
+    prop_name, kind, cond, operand = _condition(filter)
+    value, params = _sql_value(prop_name, kind, column)
+    if cond == "is_empty":
+        return f"{value} IS NULL", params
+    if cond == "is_not_empty":
+        return f"{value} IS NOT NULL", params
+    if cond == "equals":
+        return f"{value} = ?", params + [operand]
+    if cond == "on_or_before":
+        return f"substr({value}, 1, 10) <= ?", params + [operand]
+    if cond == "on_or_after":
+        return f"substr({value}, 1, 10) >= ?", params + [operand]
+    raise ValueError(f"Условие фильтра не поддерживается: {kind}.{cond}")
+
+
+def project_sql(properties, column="properties"):
+    """Проекция -> (выражение, параметры): JSON только с нужными свойствами."""
+    if not properties:
+        return column, []
+    args = ", ".join(f"?, json_extract({column}, ?)" for _ in properties)
+    return f"json_object({args})", [p for name in properties for p in (name, _json_path(name))]
+
+
+# ── Схема базы: проекция и разбиение ──────────────────────────────────────────
+def property_names(fields):
+    """Имена свойств Notion для карты полей (contacts.field_map)."""
+    return [prop_name for prop_name, _ in fields.values()]
+
+
+_schemas = {}    # database_id -> свойства из databases.retrieve
+_schemas_lock = threading.Lock()
+
+
+def database_schema(notion, database_id):
+    """Свойства базы (имя -> {id, type, ...}): схема читается один раз за процесс.
+    None — если прочитать её не удалось."""
+    with _schemas_lock:
+        schema = _schemas.get(database_id)
+        if schema is None:
+            try:
+                db = call_with_retries(notion.databases.retrieve, database_id=database_id)
+            except Exception as e:
+                print(f"  Схема базы недоступна: {e}")
+                return None
+            schema = _schemas[database_id] = db["properties"]
+        return schema
+
+
+def property_ids(notion, database_id, names):
+    """ID свойств для filter_properties. Свойства, которых нет в схеме,
+    пропускаются с предупреждением; без схемы — None (проекция не применяется)."""
+    schema = database_schema(notion, database_id)
+    if schema is None:
+        return None
+    missing = [name for name in names if name not in schema]
+    if missing:
+        print(f"  Свойств нет в схеме базы: {', '.join(missing)}")
+    # ID в схеме уже URL-кодированы, а клиент кодирует query-параметры сам
+    return [unquote(schema[name]["id"]) for name in names if name in schema]
+
+
+def select_options(notion, database_id, attr):
+    """Варианты select-свойства attr по схеме базы; None — если схема недоступна."""
+    schema = database_schema(notion, database_id)
+    prop_name, kind = FIELDS[attr]
+    if schema is None or prop_name not in schema:
+        return None
+    return [o["name"] for o in schema[prop_name].get(kind, {}).get("options", [])]
+
+
+def partitions(options, attr):
+    """Непересекающиеся фильтры, вместе покрывающие всю базу: по одному на
+    вариант select-свойства attr и ещё один — для страниц без значения."""
+    return [select_in(attr, {option}) for option in options] + [is_empty(attr)]
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Social Capital Monitor — очередь записи в Notion
+Один клиент Notion и один ограничитель частоты на процесс (~3 запроса/с,
+лимит Notion API). Значение свойства сравнивается с последним известным
+(прочитанным из базы или уже записанным) — запись без изменений не уходит.
+Несколько свойств одной страницы, поставленных в очередь до flush,
+отправляются одним PATCH. На 429 запись повторяется после Retry-After,
+пауза действует на все потоки сразу. call_with_retries — те же повторы
+для чтения (databases.query).
+"""
+import os
+import json
+import time
+import threading
+
+from notion_client import Client
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+
+import http_client
+import metrics
+import tracing
+from ratelimit import TokenBucket, parse_retry_after
+
+# ── Конфигурация ──────────────────────────────────────────────────────────────
+NOTION_WRITE_RPS   = float(os.environ.get("NOTION_WRITE_RPS", "3"))
+NOTION_MAX_RETRIES = 5
+RETRYABLE_STATUSES = {409, 429, 500, 502, 503, 504}
+
+
+# ── Значения свойств ──────────────────────────────────────────────────────────
+def rich_text(content):
+    return {"rich_text": [{"type": "text", "text": {"content": (content or "")[:2000]}}]}
+
+
+def date_value(start):
+    return {"date": {"start": start} if start else None}
+
+
+def _canonical(value):
+    """Значение свойства для сравнения: из ответа Notion и из нашего payload
+    получается одно и то же (только текст, без аннотаций и plain_text)."""
+    if "rich_text" in value:
+        return ("rich_text", "".join(
+            (r.get("text") or {}).get("content", r.get("plain_text", ""))
+            for r in value["rich_text"] or []
+        ))
+    if "date" in value:
+        return ("date", (value["date"] or {}).get("start"))
+    return json.dumps(value, sort_keys=True, ensure_ascii=False)
+
+
+# ── Очередь записи ────────────────────────────────────────────────────────────
+class NotionWriter:
+    """Потокобезопасная очередь изменений свойств страниц Notion."""
+
+    def __init__(self, notion=None, rps=NOTION_WRITE_RPS, max_retries=NOTION_MAX_RETRIES):
+        self.notion = notion or Client(auth=os.environ["NOTION_TOKEN"],
+                                       base_url=http_client.NOTION_BASE_URL)
+        self.bucket = TokenBucket(rps, max(1.0, rps))
+        self.max_retries = max_retries
+        self.lock = threading.Lock()
+        self.known = {}     # page_id -> {свойство: каноническое значение}
+        self.pending = {}   # page_id -> {свойство: payload}
+        self.sent = 0
+        self.skipped = 0
+
+    def remember(self, page_id, properties):
+        """Запоминает текущие значения свойств страницы (например, из прочитанной базы)."""
+        with self.lock:
+            known = self.known.setdefault(page_id, {})
+            for prop, value in properties.items():
+                known[prop] = _canonical(value)
+
+    def set(self, page_id, properties):
+        """Ставит изменения в очередь. Возвращает число свойств, которые реально изменятся."""
+        queued = 0
+        with self.lock:
+            known = self.known.get(page_id, {})
+            for prop, value in properties.items():
+                if prop in known and known[prop] == _canonical(value):
+                    self.pending.get(page_id, {}).pop(prop, None)
+                    self.skipped += 1
+                    metrics.incr("notion.writes_skipped")
+                    continue
+                self.pending.setdefault(page_id, {})[prop] = value
+                queued += 1
+        return queued
+
+    def flush(self, page_id=None):
+        """Отправляет очередь (одной страницы или всю) — по одному PATCH на страницу.
+        Возвращает число отправленных запросов."""
+        with self.lock:
+            if page_id is None:
+                batch, self.pending = self.pending, {}
+            else:
+                props = self.pending.pop(page_id, None)
+                batch = {page_id: props} if props else {}
+
+        sent = 0
+        error = None
+        for pid, props in batch.items():
+            try:
+                self._call(page_id=pid, properties=props)
+            except Exception as e:
+                # Неотправленное возвращаем в очередь, если его не перезаписали новым значением
+                with self.lock:
+                    pending = self.pending.setdefault(pid, {})
+                    for prop, value in props.items():
+                        pending.setdefault(prop, value)
+                error = error or e
+                continue
+            with self.lock:
+                known = self.known.setdefault(pid, {})
+                for prop, value in props.items():
+                    known[prop] = _canonical(value)
+            sent += 1
+        if error:
+            raise error
+        return sent
+
+    def write(self, page_id, properties):
+        """set + flush одной страницы. Возвращает True, если запрос ушёл в Notion."""
+        self.set(page_id, properties)
+        return self.flush(page_id) > 0
+
+    def archive(self, page_id):
+        with self.lock:
+            self.pending.pop(page_id, None)
+            self.known.pop(page_id, None)
+        self._call(page_id=page_id, archived=True)
+
+    def _call(self, **kwargs):
+        with metrics.stage("notion_write"):
+            call_with_retries(self.notion.pages.update, self.max_retries,
+                              before=self.bucket.acquire, wait=self.bucket.pause, **kwargs)
+        metrics.incr("notion.writes")
+        with self.lock:
+            self.sent += 1
+
+
+def call_with_retries(func, max_retries=NOTION_MAX_RETRIES, before=None, wait=time.sleep, **kwargs):
+    """Вызов Notion API с повторами на 409/429/5xx (по Retry-After) и таймаутах.
+    before — вызывается перед каждой попыткой (например, bucket.acquire),
+    wait — как выдержать паузу сервера (у NotionWriter — пауза общего bucket)."""
+    name = f"notion {getattr(func, '__qualname__', func.__name__)}"
+    delay = 1.0
+    for attempt in range(max_retries + 1):
+        if before:
+            with tracing.span("notion rate wait", cat="wait"):
+                before()
+        started = time.perf_counter()
+        try:
+            with tracing.span(name, cat="http", attempt=attempt + 1) as sp:
+                try:
+                    result = func(**kwargs)
+                except HTTPResponseError as e:
+                    sp.set(status=e.status)
+                    raise
+            http_client.record(http_client.NOTION_BASE_URL, time.perf_counter() - started, 200)
+            return result
+        except HTTPResponseError as e:
+            http_client.record(http_client.NOTION_BASE_URL, time.perf_counter() - started, e.status)
+            if e.status == 429:
+                metrics.incr("notion.429")
+            if e.status not in RETRYABLE_STATUSES or attempt == max_retries:
+                raise
+            seconds = parse_retry_after(e.headers.get("Retry-After")) or delay
+            print(f"  Notion {e.status}, повтор через {seconds:.1f} с")
+            metrics.incr("notion.retries")
+            with tracing.span("notion backoff", cat="wait", seconds=seconds):
+                wait(seconds)
+        except RequestTimeoutError:
+            http_client.record(http_client.NOTION_BASE_URL, time.perf_counter() - started, None)
+            if attempt == max_retries:
+                raise
+            metrics.incr("notion.retries")
+            with tracing.span("notion backoff", cat="wait", seconds=delay):
+                time.sleep(delay)
+        delay = min(delay * 2, 30.0)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_writer():
+    """Общий на процесс NotionWriter (создаётся при первом обращении)."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = NotionWriter()
+        return _default
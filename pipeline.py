@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Social Capital Monitor — конвейер с ограниченными очередями
+Каждая стадия — функция со своим числом потоков-воркеров и входной очередью
+ограниченного размера. Пока одни контакты скрапятся, другие уже анализируются
+Gemini или пишутся в Notion. Полная очередь блокирует предыдущую стадию
+(backpressure), поэтому быстрый скрапинг не накапливает сотни контактов в памяти.
+Стадия может работать пачками: воркер набирает до batch_size элементов
+(ждёт добора не дольше batch_wait секунд) и передаёт их в func списком.
+merge() и prefetch() — то же для генераторов: они читаются в фоновых
+потоках, вызывающий получает элементы через ограниченный буфер.
+"""
+import time
+import queue
+import threading
+
+import metrics
+
+_STOP = object()
+
+
+class Stage:
+    """Стадия конвейера.
+
+    func(item) возвращает элемент для следующей стадии или None, чтобы выбросить его.
+    При batch_size > 1 func получает список элементов и возвращает список результатов
+    (None в нём тоже выбрасываются).
+    workers — число потоков, queue_size — ёмкость входной очереди стадии.
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=None, batch_size=1, batch_wait=0.0):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.queue_size = queue_size or workers * batch_size * 2
+
+
+def _take_batch(inbox, stage):
+    """Набирает пачку из очереди. Возвращает (пачка, встречен ли стоп-сигнал)."""
+    first = inbox.get()
+    if first is _STOP:
+        return [], True
+    batch = [first]
+    deadline = time.monotonic() + stage.batch_wait
+    while len(batch) < stage.batch_size:
+        timeout = deadline - time.monotonic()
+        try:
+            item = inbox.get(timeout=timeout) if timeout > 0 else inbox.get_nowait()
+        except queue.Empty:
+            break
+        if item is _STOP:
+            return batch, True
+        batch.append(item)
+    return batch, False
+
+
+def run_pipeline(items, stages):
+    """Прогоняет items через стадии и возвращает результаты последней стадии."""
+    queues = [queue.Queue(maxsize=s.queue_size) for s in stages]
+    results = []
+    results_lock = threading.Lock()
+
+    def emit(outbox, out):
+        if out is None:
+            return
+        if outbox is not None:
+            outbox.put(out)
+        else:
+            with results_lock:
+                results.append(out)
+
+    def worker(index, stage):
+        inbox = queues[index]
+        outbox = queues[index + 1] if index + 1 < len(stages) else None
+        while True:
+            if stage.batch_size > 1:
+                batch, stop = _take_batch(inbox, stage)
+                if batch:
+                    try:
+                        outs = stage.func(batch)
+                    except Exception as e:
+                        print(f"  [{stage.name}] ошибка: {e}")
+                        metrics.incr(f"pipeline.{stage.name}.errors")
+                        outs = []
+                    for out in outs:
+                        emit(outbox, out)
+                if stop:
+                    return
+                continue
+
+            item = inbox.get()
+            if item is _STOP:
+                return
+            try:
+                out = stage.func(item)
+            except Exception as e:
+                print(f"  [{stage.name}] ошибка: {e}")
+                metrics.incr(f"pipeline.{stage.name}.errors")
+                continue
+            emit(outbox, out)
+
+    threads = []
+    for index, stage in enumerate(stages):
+        stage_threads = [
+            threading.Thread(target=worker, args=(index, stage),
+                             name=f"{stage.name}-{n}", daemon=True)
+            for n in range(stage.workers)
+        ]
+        for t in stage_threads:
+            t.start()
+        threads.append(stage_threads)
+
+    for item in items:
+        queues[0].put(item)
+
+    # Останавливаем стадии по порядку: следующая получает стоп только после того,
+    # как предыдущая отдала ей всё, что успела обработать
+    for index, stage in enumerate(stages):
+        for _ in range(stage.workers):
+            queues[index].put(_STOP)
+        for t in threads[index]:
+            t.join()
+
+    return results
+
+
+def merge(iterables, workers, depth=1, name="merge"):
+    """Читает несколько генераторов одновременно (до workers потоков) и отдаёт
+    их элементы одним потоком по мере готовности; порядок между источниками
+    не сохраняется. В буфере — не больше depth готовых элементов.
+    Исключение любого источника поднимается у вызывающего и останавливает
+    остальные; если вызывающий бросил генератор, потоки тоже останавливаются."""
+    buffer = queue.Queue(maxsize=depth)
+    closed = threading.Event()
+    sources = iter(iterables)
+    sources_lock = threading.Lock()
+
+    def put(entry):
+        # Ждём места в очереди, но не вечно: вызывающий мог уйти
+        while not closed.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            while not closed.is_set():
+                with sources_lock:
+                    source = next(sources, _STOP)
+                if source is _STOP:
+                    break
+                for item in source:
+                    if not put((item, None)):
+                        return
+        except BaseException as e:
+            put((_STOP, e))
+            return
+        put((_STOP, None))
+
+    threads = [threading.Thread(target=produce, name=f"{name}-{n}", daemon=True)
+               for n in range(workers)]
+    for t in threads:
+        t.start()
+    running = len(threads)
+    try:
+        while running:
+            item, error = buffer.get()
+            if item is _STOP:
+                if error is not None:
+                    raise error
+                running -= 1
+                continue
+            yield item
+    finally:
+        closed.set()
+
+
+def prefetch(iterable, depth=1, name="prefetch"):
+    """Генератор поверх iterable, который читается фоновым потоком на depth
+    элементов вперёд: пока вызывающий обрабатывает текущий элемент, следующий
+    уже готовится (например, запрос следующей страницы Notion)."""
+    return merge([iterable], workers=1, depth=depth, name=name)
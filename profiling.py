@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Social Capital Monitor — профилирование CPU и памяти
+Включается переменными окружения (или через CLI ниже) для любого скрипта:
+  SCM_PROFILE=cpu,mem         — профиль всего запуска:
+      cpu → <script>.pstats (cProfile по всем потокам) и
+            <script>.collapsed (сэмплы стеков для flamegraph.pl / speedscope);
+      mem → <script>-memory.txt (tracemalloc: топ аллокаций по строкам
+            и по файлам у пика памяти и на конец запуска).
+  SCM_PROFILE_FUNCS=parse_contact,get_telegram_posts — отдельный профиль
+      «горячих» функций, помеченных @hot: <script>-<func>.pstats и сводка
+      вызовов в <script>-functions.txt.
+  SCM_PROFILE_DIR — куда писать (по умолчанию profiles/).
+Без переменных @hot возвращает функцию как есть — накладных расходов нет.
+
+Запуск через CLI:  python profiling.py [--cpu] [--mem] [--funcs a,b] digest.py [аргументы скрипта]
+"""
+import os
+import re
+import sys
+import time
+import runpy
+import pstats
+import cProfile
+import argparse
+import threading
+import functools
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+# ── Конфигурация ──────────────────────────────────────────────────────────────
+PROFILE_MODES    = {m.strip() for m in os.environ.get("SCM_PROFILE", "").split(",") if m.strip()}
+PROFILE_FUNCS    = {f.strip() for f in os.environ.get("SCM_PROFILE_FUNCS", "").split(",") if f.strip()}
+PROFILE_DIR      = os.environ.get("SCM_PROFILE_DIR", "profiles")
+SAMPLE_INTERVAL  = float(os.environ.get("SCM_PROFILE_INTERVAL", "0.005"))   # сек между сэмплами
+MEMORY_FRAMES    = 25    # глубина трассировки tracemalloc
+MEMORY_TOP       = 30    # строк в отчёте о памяти
+MEMORY_INTERVAL  = float(os.environ.get("SCM_PROFILE_MEM_INTERVAL", "0.5"))   # сек между проверками
+
+if "all" in PROFILE_MODES or "1" in PROFILE_MODES:
+    PROFILE_MODES = {"cpu", "mem"}
+
+_lock = threading.Lock()
+_thread_profiles = []    # cProfile.Profile каждого потока запуска
+_hot = {}                # имя функции -> {"profiles": [...], "calls", "wall", "cpu"}
+
+
+# ── CPU: cProfile во всех потоках ─────────────────────────────────────────────
+def _start_thread_profile(*_):
+    # Срабатывает первым событием в новом потоке (threading.setprofile)
+    # и заменяет себя на cProfile этого потока
+    profile = cProfile.Profile()
+    with _lock:
+        _thread_profiles.append(profile)
+    profile.enable()
+
+
+class _Sampler(threading.Thread):
+    """Сэмплирует стеки всех потоков — файл collapsed-стеков для flame graph.
+    В отличие от cProfile, видит и время ожидания (сеть, очереди, лимитеры)."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        super().__init__(name="profiling-sampler", daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            # scrape-0, scrape-1… — один корень на пул, чтобы стеки склеивались
+            names = {t.ident: re.sub(r"-\d+$", "", t.name) for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+# ── Память: tracemalloc ───────────────────────────────────────────────────────
+# Собственные структуры профилировщика в отчёт не попадают
+_MEMORY_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, cProfile.__file__),
+    tracemalloc.Filter(False, pstats.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+]
+
+
+class _MemoryWatcher(threading.Thread):
+    """Снимает tracemalloc-снимок, когда занятая память выросла на 10% от
+    прошлого снимка. К концу запуска main() уже отпустил контакты, поэтому
+    главный отчёт — по снимку у пика: что именно держало память."""
+
+    def __init__(self, interval=MEMORY_INTERVAL):
+        super().__init__(name="profiling-memory", daemon=True)
+        self.interval = interval
+        self.snapshot = None
+        self.size = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            current, _ = tracemalloc.get_traced_memory()
+            if current > self.size * 1.1:
+                self.snapshot = tracemalloc.take_snapshot().filter_traces(_MEMORY_FILTERS)
+                self.size = current
+
+
+def _write_top(f, title, snapshot):
+    f.write(f"\n{title} — топ {MEMORY_TOP} по строкам:\n")
+    for stat in snapshot.statistics("lineno")[:MEMORY_TOP]:
+        f.write(f"  {stat}\n")
+    f.write(f"\n{title} — топ {MEMORY_TOP} по файлам:\n")
+    for stat in snapshot.statistics("filename")[:MEMORY_TOP]:
+        f.write(f"  {stat}\n")
+
+
+def _write_memory_report(path, watcher):
+    current, peak = tracemalloc.get_traced_memory()
+    final = tracemalloc.take_snapshot().filter_traces(_MEMORY_FILTERS)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"Пик: {peak / 1e6:.1f} MB, на конец запуска: {current / 1e6:.1f} MB\n")
+        if watcher.snapshot is not None:
+            title = f"У пика (снимок при {watcher.size / 1e6:.1f} MB)"
+            _write_top(f, title, watcher.snapshot)
+            for i, stat in enumerate(watcher.snapshot.statistics("traceback")[:3], 1):
+                f.write(f"\nКрупнейший блок у пика #{i}: {stat.count} объектов, {stat.size / 1e6:.1f} MB\n")
+                for line in stat.traceback.format():
+                    f.write(f"  {line}\n")
+        _write_top(f, "На конец запуска", final)
+
+
+# ── Горячие функции ───────────────────────────────────────────────────────────
+def hot(func):
+    """Помечает функцию для SCM_PROFILE_FUNCS (по имени или module.name).
+    Каждый вызов профилируется отдельным cProfile своего потока; если поток
+    уже под профилем всего запуска, считаются только число вызовов и время."""
+    qualified = f"{func.__module__}.{func.__name__}"
+    if func.__name__ not in PROFILE_FUNCS and qualified not in PROFILE_FUNCS:
+        return func
+    entry = _hot.setdefault(func.__name__, {"profiles": [], "calls": 0, "wall": 0.0, "cpu": 0.0})
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            if sys.getprofile() is not None:
+                return func(*args, **kwargs)
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(func, *args, **kwargs)
+            finally:
+                with _lock:
+                    entry["profiles"].append(profile)
+        finally:
+            with _lock:
+                entry["calls"] += 1
+                entry["wall"] += time.perf_counter() - wall
+                entry["cpu"] += time.thread_time() - cpu
+    return wrapper
+
+
+def _merge(profiles):
+    profiles = [p for p in profiles if p.getstats()]
+    if not profiles:
+        return None
+    stats = pstats.Stats(profiles[0])
+    for profile in profiles[1:]:
+        stats.add(profile)
+    return stats
+
+
+def _write_functions_report(script):
+    lines = []
+    for name, entry in sorted(_hot.items()):
+        if not entry["calls"]:
+            continue
+        stats = _merge(entry["profiles"])
+        if stats:
+            stats.dump_stats(os.path.join(PROFILE_DIR, f"{script}-{name}.pstats"))
+        lines.append(f"{name}: вызовов {entry['calls']}, всего {entry['wall']:.3f} с, "
+                     f"CPU {entry['cpu']:.3f} с, в среднем {entry['wall'] / entry['calls'] * 1000:.1f} мс")
+    if lines:
+        with open(os.path.join(PROFILE_DIR, f"{script}-functions.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+# ── Сессия ────────────────────────────────────────────────────────────────────
+@contextmanager
+def session(script):
+    """Оборачивает main(): включает профили из SCM_PROFILE и пишет файлы по завершению."""
+    cpu = "cpu" in PROFILE_MODES
+    mem = "mem" in PROFILE_MODES
+    if not (cpu or mem or _hot):
+        yield
+        return
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    sampler = watcher = None
+    if mem:
+        tracemalloc.start(MEMORY_FRAMES)
+        watcher = _MemoryWatcher()
+        watcher.start()
+    if cpu:
+        sampler = _Sampler()
+        sampler.start()
+        threading.setprofile(_start_thread_profile)
+        _start_thread_profile()
+    try:
+        yield
+    finally:
+        written = []
+        if mem:
+            watcher.stopped.set()
+            watcher.join()
+            path = os.path.join(PROFILE_DIR, f"{script}-memory.txt")
+            _write_memory_report(path, watcher)
+            tracemalloc.stop()
+            written.append(path)
+        if cpu:
+            threading.setprofile(None)
+            for profile in _thread_profiles:
+                profile.disable()
+            sampler.stopped.set()
+            sampler.join()
+            stats = _merge(_thread_profiles)
+            if stats:
+                path = os.path.join(PROFILE_DIR, f"{script}.pstats")
+                stats.dump_stats(path)
+                written.append(path)
+            path = os.path.join(PROFILE_DIR, f"{script}.collapsed")
+            sampler.write(path)
+            written.append(path)
+        if _hot:
+            _write_functions_report(script)
+            written.append(f"{PROFILE_DIR}/{script}-*.pstats")
+        print(f"  Профили: {', '.join(written)}")
+
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(
+        description="Запуск скрипта под профилировщиком",
+        usage="python profiling.py [--cpu] [--mem] [--funcs a,b] script.py [аргументы]")
+    parser.add_argument("--cpu", action="store_true", help="cProfile + сэмплы стеков")
+    parser.add_argument("--mem", action="store_true", help="tracemalloc")
+    parser.add_argument("--funcs", default="", help="горячие функции через запятую")
+    parser.add_argument("--out", default=PROFILE_DIR, help="папка для профилей")
+    parser.add_argument("script")
+    parser.add_argument("args", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    modes = [m for m, on in (("cpu", args.cpu), ("mem", args.mem)) if on]
+    if not modes and not args.funcs:
+        modes = ["cpu", "mem"]
+    # Настройки читаются при импорте — скрипт и его модули увидят их через окружение
+    os.environ["SCM_PROFILE"] = ",".join(modes)
+    os.environ["SCM_PROFILE_FUNCS"] = args.funcs
+    os.environ["SCM_PROFILE_DIR"] = args.out
+    sys.argv = [args.script, *args.args]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+    runpy.run_path(args.script, run_name="__main__")
+
+
+if __name__ == "__main__":
+    main()
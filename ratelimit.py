@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Social Capital Monitor — ограничитель частоты запросов
+Token bucket, общий для всех потоков процесса. Вызывающий резервирует
+токены заранее и ждёт ровно столько, сколько нужно до своей очереди,
+вместо того чтобы получать 429 и спать наугад. Подсказки сервера
+(Retry-After) ставят bucket на паузу для всех потоков сразу.
+"""
+import time
+import threading
+
+
+class TokenBucket:
+    """rate — токенов в секунду, capacity — максимальный запас (размер всплеска)."""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount=1):
+        """Сколько секунд пришлось бы ждать acquire(amount) прямо сейчас."""
+        amount = min(amount, self.capacity)
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = (amount - self.tokens) / self.rate if self.tokens < amount else 0.0
+            return max(wait, self.paused_until - now, 0.0)
+
+    def reserve(self, amount=1):
+        """Резервирует amount токенов и возвращает, сколько секунд ждать до их выдачи."""
+        amount = min(amount, self.capacity)
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Баланс может уйти в минус — следующие вызывающие встанут в очередь за нами
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.paused_until - now, 0.0)
+
+    def acquire(self, amount=1):
+        """Резервирует токены и ждёт их выдачи. Возвращает время ожидания."""
+        wait = self.reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds):
+        """Останавливает выдачу токенов на seconds (например, по Retry-After)."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """Несколько bucket'ов, которые должны пропустить запрос одновременно
+    (например, запросы в минуту и токены в минуту)."""
+
+    def __init__(self, **buckets):
+        self.buckets = buckets
+
+    def delay(self, **amounts):
+        return max(
+            (b.delay(amounts.get(name, 1)) for name, b in self.buckets.items()),
+            default=0.0,
+        )
+
+    def acquire(self, **amounts):
+        wait = max(
+            (b.reserve(amounts.get(name, 1)) for name, b in self.buckets.items()),
+            default=0.0,
+        )
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds):
+        for bucket in self.buckets.values():
+            bucket.pause(seconds)
+
+
+def parse_retry_after(value):
+    """Разбирает Retry-After (секунды) или retryDelay Google API ("17s", "1.5s")."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = str(value).strip()
+    if value.endswith("s"):
+        value = value[:-1]
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return None
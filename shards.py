@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Social Capital Monitor — шардирование запуска по нескольким процессам
+monitor_social.py --shard i/N обрабатывает только свою долю контактов:
+контакт попадает в шард по хэшу page_id, поэтому разбиение одинаково во
+всех процессах и между запусками, а шарды не пересекаются. Каждый шард —
+отдельный процесс или job матрицы GitHub Actions со своим отчётом
+(metrics.py, метка shard). Шаг слияния собирает отчёты шардов в один
+и завершается с ошибкой, если какой-то шард не дошёл до конца:
+
+  python shards.py merge reports/ --script monitor_social
+"""
+import os
+import sys
+import json
+import argparse
+import hashlib
+from datetime import datetime, timezone
+
+
+# ── Разбиение ─────────────────────────────────────────────────────────────────
+def parse(spec):
+    """"i/N" -> (i, N), шарды нумеруются с нуля: 0/3, 1/3, 2/3."""
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Шард задаётся как i/N, например 0/3: {spec!r}") from None
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Номер шарда вне диапазона 0..N-1: {spec!r}")
+    return index, count
+
+
+def argument(spec):
+    """parse для argparse: в ошибке — наше сообщение, а не «invalid value»."""
+    try:
+        return parse(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+
+def shard_of(page_id, count):
+    """Номер шарда страницы. hash() в Python солится на процесс — берём blake2b;
+    ID с дефисами и без (Notion отдаёт оба вида) попадают в один шард."""
+    key = page_id.replace("-", "").lower().encode()
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big") % count
+
+
+def select(contacts, shard):
+    """Контакты (Contact) шарда (i, N); без шарда — все."""
+    if shard is None:
+        return contacts
+    index, count = shard
+    return [c for c in contacts if shard_of(c.page_id, count) == index]
+
+
+# ── Слияние отчётов ───────────────────────────────────────────────────────────
+def _merge_http(stats):
+    # Перцентили из сводок шардов точно не сложить: берём худший шард —
+    # оценка сверху, для поиска медленного хоста этого достаточно
+    merged = {}
+    for host_stats in stats:
+        for host, s in host_stats.items():
+            m = merged.setdefault(host, {"requests": 0, "errors": 0, "statuses": {},
+                                         "avg_ms": 0.0, "p50_ms": 0.0, "p90_ms": 0.0,
+                                         "p99_ms": 0.0, "max_ms": 0.0})
+            total = m["requests"] + s["requests"]
+            m["avg_ms"] = round((m["avg_ms"] * m["requests"] + s["avg_ms"] * s["requests"]) / total, 1)
+            m["requests"] = total
+            m["errors"] += s["errors"]
+            for status, n in s["statuses"].items():
+                m["statuses"][status] = m["statuses"].get(status, 0) + n
+            for key in ("p50_ms", "p90_ms", "p99_ms", "max_ms"):
+                m[key] = max(m[key], s[key])
+    return merged
+
+
+def merge_reports(reports):
+    """Отчёты шардов одного запуска -> (сводный отчёт, список проблем).
+    Счётчики и время стадий складываются; wall стадии и длительность
+    запуска — максимум по шардам (шарды идут параллельно)."""
+    problems = []
+    by_index = {}
+    count = None
+    for report in reports:
+        index, n = parse(report["labels"]["shard"])
+        if count is not None and n != count:
+            problems.append(f"в отчётах разное число шардов: {count} и {n}")
+        count = n if count is None else max(count, n)
+        if index in by_index:
+            problems.append(f"шард {index}/{n}: несколько отчётов")
+        by_index[index] = report
+
+    if count is None:
+        return None, ["нет ни одного отчёта шарда"]
+    for index in range(count):
+        report = by_index.get(index)
+        if report is None:
+            problems.append(f"шард {index}/{count}: нет отчёта (не завершился)")
+        elif report["status"] != "ok":
+            problems.append(f"шард {index}/{count}: {report['status']}")
+
+    counters, stages = {}, {}
+    for report in by_index.values():
+        for name, value in report["counters"].items():
+            counters[name] = counters.get(name, 0) + value
+        for name, s in report["stages"].items():
+            m = stages.setdefault(name, {"calls": 0, "busy_seconds": 0.0, "wall_seconds": 0.0})
+            m["calls"] += s["calls"]
+            m["busy_seconds"] = round(m["busy_seconds"] + s["busy_seconds"], 3)
+            m["wall_seconds"] = max(m["wall_seconds"], s["wall_seconds"])
+
+    first = min(by_index.values(), key=lambda r: r["started_at"])
+    merged = {
+        "script": first["script"],
+        "started_at": first["started_at"],
+        "duration_seconds": max(r["duration_seconds"] for r in by_index.values()),
+        "status": "ok" if not problems else "error: " + "; ".join(problems),
+        "shards": {f"{i}/{count}": {"status": r["status"], "duration_seconds": r["duration_seconds"]}
+                   for i, r in sorted(by_index.items())},
+        "stages": dict(sorted(stages.items())),
+        "counters": dict(sorted(counters.items())),
+        "http": _merge_http(r["http"] for r in by_index.values()),
+    }
+    return merged, problems
+
+
+def load_reports(directory, script):
+    """Отчёты шардов скрипта из папки (рекурсивно: артефакты скачиваются в подпапки)."""
+    reports = []
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if not (name.startswith(f"{script}-shard") and name.endswith(".json")):
+                continue
+            with open(os.path.join(root, name), encoding="utf-8") as f:
+                report = json.load(f)
+            if report.get("script") == script and "shard" in report.get("labels", {}):
+                reports.append(report)
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Слияние отчётов шардов запуска")
+    sub = parser.add_subparsers(dest="command", required=True)
+    merge = sub.add_parser("merge", help="собрать отчёты шардов в один")
+    merge.add_argument("directory", help="папка с отчётами шардов")
+    merge.add_argument("--script", default="monitor_social", help="скрипт, чьи отчёты сливаем")
+    merge.add_argument("--output", default=None,
+                       help="куда записать сводный отчёт (по умолчанию — в ту же папку)")
+    args = parser.parse_args(argv)
+
+    merged, problems = merge_reports(load_reports(args.directory, args.script))
+    if merged is not None:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        path = args.output or os.path.join(args.directory, f"{args.script}-merged-{stamp}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(merged, f, ensure_ascii=False, indent=2)
+        print(f"  Сводный отчёт ({len(merged['shards'])} шард.): {path}")
+    for problem in problems:
+        print(f"  ✗ {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
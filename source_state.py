@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Social Capital Monitor — состояние источников (Telegram-каналы, Instagram)
+Для каждого источника хранит ETag/Last-Modified последнего ответа,
+хэш извлечённых постов и сами посты. По ним мониторинг делает условный
+запрос (304 Not Modified) и пропускает Gemini и запись в Notion,
+если посты не изменились со вчерашнего дня.
+Для Telegram-каналов дополнительно хранится ID последнего обработанного
+сообщения (data-post) — по нему скрейпер берёт только новые посты.
+"""
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime, timezone
+
+# ── Конфигурация ──────────────────────────────────────────────────────────────
+SOURCE_STATE_PATH = os.environ.get("SOURCE_STATE_PATH", ".cache/sources.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    source_key    TEXT PRIMARY KEY,
+    etag          TEXT,
+    last_modified TEXT,
+    fingerprint   TEXT NOT NULL,
+    posts         TEXT NOT NULL,
+    updated_at    TEXT NOT NULL,
+    last_message_id INTEGER
+);
+"""
+
+
+def fingerprint(posts):
+    """Хэш списка постов — не зависит от разметки страницы, только от текста."""
+    h = hashlib.sha256()
+    for p in posts:
+        h.update(p.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def conditional_headers(record):
+    """Заголовки If-None-Match / If-Modified-Since по сохранённой записи."""
+    headers = {}
+    if record:
+        if record.get("etag"):
+            headers["If-None-Match"] = record["etag"]
+        if record.get("last_modified"):
+            headers["If-Modified-Since"] = record["last_modified"]
+    return headers
+
+
+class SourceState:
+    """Персистентные записи по источникам. Потокобезопасно — вызывается из воркеров конвейера."""
+
+    def __init__(self, path=SOURCE_STATE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(_SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        # Базы из кэша прошлых запусков созданы без last_message_id
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(sources)")}
+        if "last_message_id" not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE sources ADD COLUMN last_message_id INTEGER")
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT etag, last_modified, fingerprint, posts, last_message_id "
+                "FROM sources WHERE source_key = ?",
+                (key,)
+            ).fetchone()
+        if not row:
+            return None
+        etag, last_modified, fp, posts, last_message_id = row
+        return {
+            "etag": etag,
+            "last_modified": last_modified,
+            "fingerprint": fp,
+            "posts": json.loads(posts),
+            "last_message_id": last_message_id,
+        }
+
+    def put(self, key, record):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sources (source_key, etag, last_modified, fingerprint, "
+                "posts, updated_at, last_message_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, record.get("etag"), record.get("last_modified"),
+                 record["fingerprint"], json.dumps(record["posts"], ensure_ascii=False),
+                 datetime.now(timezone.utc).isoformat(), record.get("last_message_id"))
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_state():
+    """Общий на процесс экземпляр SourceState (открывается при первом обращении)."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = SourceState()
+        return _default
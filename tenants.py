@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Social Capital Monitor — несколько баз и чатов в одном процессе
+Арендатор (tenant) — набор: база Notion, токен интеграции, бот и чат
+Telegram, свои круги и лимиты. Список берётся из TENANTS_FILE (или
+TENANTS_JSON — то же содержимое в переменной, например из секрета):
+
+  [{"name": "anna",
+    "database_id": "…", "notion_token_env": "ANNA_NOTION_TOKEN",
+    "chat_id": "…",     "bot_token_env": "ANNA_BOT_TOKEN",
+    "circles": ["Клиент активный", "Партнер"],
+    "limits": {"max_contacts": 200, "max_due_contacts": 5}}]
+
+Токены можно указать прямо ("notion_token", "bot_token") или именем
+переменной окружения (*_env), чтобы не класть секреты в файл.
+Без файла — один арендатор из NOTION_TOKEN, NOTION_DATABASE_ID,
+TELEGRAM_BOT_TOKEN и TELEGRAM_CHAT_ID, как раньше.
+
+Общее на процесс: пул соединений к Notion (один httpx-транспорт на всех
+клиентов) и к остальным сервисам (http_client.session), снимок баз
+(contact_store, по database_id), кэш Gemini и состояние источников.
+Своё у арендатора: клиент Notion и очередь записи со своим лимитом
+(лимит Notion — на интеграцию), очередь доставки в Telegram.
+
+Справедливость: работа разных арендаторов перемешивается по кругу
+(interleave), а run_all обрабатывает арендаторов параллельно — большой
+арендатор не задерживает маленьких до конца своей очереди.
+"""
+import os
+import json
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from notion_client import Client
+
+import http_client
+import metrics
+from notion_writer import NotionWriter
+from tg_delivery import TelegramDelivery
+
+# ── Конфигурация ──────────────────────────────────────────────────────────────
+TENANTS_FILE   = os.environ.get("TENANTS_FILE", "")
+TENANTS_JSON   = os.environ.get("TENANTS_JSON", "")
+TENANT_WORKERS = int(os.environ.get("TENANT_WORKERS", "4"))   # арендаторов одновременно в run_all
+
+_notion_transport = None
+_transport_lock = threading.Lock()
+
+
+def _shared_transport():
+    # Заголовки (Authorization) у каждого клиента свои, соединения — общие
+    global _notion_transport
+    with _transport_lock:
+        if _notion_transport is None:
+            _notion_transport = httpx.HTTPTransport(limits=httpx.Limits(
+                max_connections=http_client.POOL_MAXSIZE,
+                max_keepalive_connections=http_client.POOL_MAXSIZE))
+        return _notion_transport
+
+
+# ── Арендатор ─────────────────────────────────────────────────────────────────
+class Tenant:
+    """Одна база Notion и один чат Telegram со своими кругами и лимитами."""
+
+    __slots__ = ("name", "notion_token", "database_id", "bot_token", "chat_id",
+                 "circles", "limits", "_notion", "_writer", "_outbox", "_lock")
+
+    def __init__(self, name, notion_token, database_id, bot_token=None, chat_id=None,
+                 circles=None, limits=None):
+        self.name = name
+        self.notion_token = notion_token
+        self.database_id = database_id
+        self.bot_token = bot_token
+        self.chat_id = chat_id
+        self.circles = set(circles) if circles else None
+        self.limits = limits or {}
+        self._notion = self._writer = self._outbox = None
+        self._lock = threading.Lock()
+
+    @property
+    def notion(self):
+        if not self.notion_token:
+            # Ошибка этого арендатора, а не всего запуска (см. run_all)
+            raise ValueError(f"Арендатор {self.name!r}: не задан notion_token")
+        with self._lock:
+            if self._notion is None:
+                self._notion = Client(auth=self.notion_token, base_url=http_client.NOTION_BASE_URL,
+                                      client=httpx.Client(transport=_shared_transport()))
+            return self._notion
+
+    @property
+    def writer(self):
+        notion = self.notion
+        with self._lock:
+            if self._writer is None:
+                self._writer = NotionWriter(notion)
+            return self._writer
+
+    @property
+    def tg_api(self):
+        return f"{http_client.TELEGRAM_API_BASE}/bot{self.bot_token}"
+
+    @property
+    def outbox(self):
+        with self._lock:
+            if self._outbox is None:
+                self._outbox = TelegramDelivery(self.tg_api)
+            return self._outbox
+
+    def circles_or(self, default):
+        """Круги арендатора, если заданы, иначе круги скрипта по умолчанию."""
+        return self.circles or default
+
+    def limit(self, key, default):
+        return self.limits.get(key, default)
+
+    def own(self, page_id):
+        """Запоминает, что страница принадлежит этому арендатору (см. owner)."""
+        with _owners_lock:
+            _owners[page_id] = self
+
+    def __repr__(self):
+        return f"Tenant({self.name!r})"
+
+
+def _secret(spec, key):
+    if spec.get(key):
+        return spec[key]
+    env_name = spec.get(f"{key}_env")
+    if env_name:
+        value = os.environ.get(env_name)
+        if not value:
+            print(f"  Арендатор {spec.get('name')!r}: переменная {env_name} не задана")
+        return value or None
+    return None
+
+
+def _from_spec(spec):
+    for key in ("name", "database_id"):
+        if not spec.get(key):
+            raise ValueError(f"Арендатор без поля {key!r}: {spec}")
+    # Без токена арендатор загружается, а падает при работе с Notion —
+    # отдельно от остальных арендаторов
+    return Tenant(spec["name"], _secret(spec, "notion_token"), spec["database_id"],
+                  bot_token=_secret(spec, "bot_token"), chat_id=spec.get("chat_id"),
+                  circles=spec.get("circles"), limits=spec.get("limits"))
+
+
+def _from_env():
+    return Tenant("default", os.environ["NOTION_TOKEN"], os.environ["NOTION_DATABASE_ID"],
+                  bot_token=os.environ.get("TELEGRAM_BOT_TOKEN"),
+                  chat_id=os.environ.get("TELEGRAM_CHAT_ID"))
+
+
+_tenants = None
+_tenants_lock = threading.Lock()
+
+
+def load_tenants():
+    """Арендаторы из TENANTS_FILE / TENANTS_JSON или один из окружения (читается один раз)."""
+    global _tenants
+    with _tenants_lock:
+        if _tenants is None:
+            if TENANTS_FILE:
+                with open(TENANTS_FILE, encoding="utf-8") as f:
+                    specs = json.load(f)
+            elif TENANTS_JSON:
+                specs = json.loads(TENANTS_JSON)
+            else:
+                specs = None
+            _tenants = [_from_spec(s) for s in specs] if specs is not None else [_from_env()]
+            names = [t.name for t in _tenants]
+            if len(set(names)) != len(names):
+                raise ValueError(f"Имена арендаторов повторяются: {names}")
+        return _tenants
+
+
+# ── Текущий арендатор ─────────────────────────────────────────────────────────
+_current = contextvars.ContextVar("tenant", default=None)
+_owners = {}     # page_id -> Tenant
+_owners_lock = threading.Lock()
+
+
+def current():
+    """Арендатор, для которого сейчас идёт работа (use / run_all);
+    вне их — первый из списка (режим одного арендатора)."""
+    tenant = _current.get()
+    return tenant if tenant is not None else load_tenants()[0]
+
+
+@contextmanager
+def use(tenant):
+    token = _current.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current.reset(token)
+
+
+def owner(page_id):
+    """Арендатор страницы — для стадий, которые работают с контактами
+    всех арендаторов вперемешку (page_id в Notion уникален глобально)."""
+    with _owners_lock:
+        tenant = _owners.get(page_id)
+    return tenant if tenant is not None else current()
+
+
+# ── Планирование ──────────────────────────────────────────────────────────────
+def interleave(groups):
+    """По одному элементу от каждой группы по кругу: [a1, b1, c1, a2, b2, a3, ...]."""
+    iterators = [iter(g) for g in groups]
+    while iterators:
+        alive = []
+        for it in iterators:
+            for item in it:
+                yield item
+                alive.append(it)
+                break
+        iterators = alive
+
+
+def run_all(func, tenants=None, workers=TENANT_WORKERS):
+    """Вызывает func(tenant) для каждого арендатора — до workers одновременно,
+    внутри use(tenant). Ошибка одного арендатора не останавливает остальных.
+    Возвращает ({имя: результат} успешных, [имена упавших]); вызывающий
+    обрабатывает успешных и в конце вызывает check(failed). С одним
+    арендатором ошибка поднимается сразу, как раньше."""
+    tenants = load_tenants() if tenants is None else tenants
+    if len(tenants) == 1:
+        with use(tenants[0]):
+            return {tenants[0].name: func(tenants[0])}, []
+
+    def run_one(tenant):
+        with use(tenant), metrics.stage(f"tenant.{tenant.name}"):
+            try:
+                return func(tenant), None
+            except Exception as e:
+                print(f"  [{tenant.name}] ошибка: {e}")
+                metrics.incr("tenants.failed")
+                return None, e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(tenants))),
+                            thread_name_prefix="tenant") as pool:
+        outcomes = dict(zip((t.name for t in tenants), pool.map(run_one, tenants)))
+    results = {name: result for name, (result, error) in outcomes.items() if error is None}
+    failed = [name for name, (_, error) in outcomes.items() if error is not None]
+    return results, failed
+
+
+def check(failed):
+    """Завершает запуск с ошибкой (ненулевой код), если кто-то из арендаторов упал."""
+    if failed:
+        raise SystemExit(f"Арендаторы с ошибкой: {', '.join(failed)}")
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Social Capital Monitor — доставка сообщений в Telegram
+Очередь исходящих сообщений вместо tg_send + time.sleep. Темп задают
+лимиты Bot API: ~1 сообщение в секунду на чат (с коротким всплеском)
+и ~30 в секунду на бота в целом. Сообщения одного чата уходят строго
+по порядку, разные чаты — параллельно. На 429 сообщение повторяется
+через parameters.retry_after, чат ставится на паузу; на 5xx — с растущей
+паузой. Отправка не идемпотентна: после таймаута чтения или обрыва
+соединения запрос мог дойти, поэтому повторяем только ошибки соединения
+до отправки — иначе сообщение пришло бы дважды. По итогу — отчёт:
+что доставлено, что нет и сколько было повторов.
+"""
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+import http_client
+import metrics
+from ratelimit import TokenBucket
+
+# ── Конфигурация ──────────────────────────────────────────────────────────────
+TG_CHAT_RATE    = float(os.environ.get("TG_CHAT_RATE", "1"))     # сообщений/с в один чат
+TG_CHAT_BURST   = float(os.environ.get("TG_CHAT_BURST", "3"))    # всплеск в один чат
+TG_GLOBAL_RATE  = float(os.environ.get("TG_GLOBAL_RATE", "30"))  # сообщений/с на бота
+TG_MAX_RETRIES  = 5
+TG_CHAT_WORKERS = 4
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _not_sent(error):
+    """Исключение requests, после которого запрос точно не ушёл:
+    таймаут подключения или отказ в соединении (DNS, connection refused)."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if isinstance(error, requests.ConnectionError) and error.args:
+        return isinstance(getattr(error.args[0], "reason", None), NewConnectionError)
+    return False
+
+
+class Delivery:
+    """Результат отправки одного сообщения."""
+
+    __slots__ = ("chat_id", "method", "payload", "ok", "message_id", "error", "attempts")
+
+    def __init__(self, chat_id, method, payload):
+        self.chat_id = chat_id
+        self.method = method
+        self.payload = payload
+        self.ok = False
+        self.message_id = None
+        self.error = None
+        self.attempts = 0
+
+
+class DeliveryReport:
+    """Итог flush: результаты в порядке постановки в очередь."""
+
+    def __init__(self, results, elapsed):
+        self.results = results
+        self.elapsed = elapsed
+
+    @property
+    def delivered(self):
+        return sum(1 for r in self.results if r.ok)
+
+    @property
+    def failed(self):
+        return [r for r in self.results if not r.ok]
+
+    @property
+    def retries(self):
+        return sum(max(r.attempts - 1, 0) for r in self.results)
+
+    def summary(self):
+        return (f"доставлено {self.delivered}/{len(self.results)}, "
+                f"повторов {self.retries}, {self.elapsed:.1f} с")
+
+
+class TelegramDelivery:
+    """Очередь сообщений Bot API с темпом по лимитам Telegram."""
+
+    def __init__(self, api_base, chat_rate=TG_CHAT_RATE, chat_burst=TG_CHAT_BURST,
+                 global_rate=TG_GLOBAL_RATE, max_retries=TG_MAX_RETRIES):
+        self.api_base = api_base
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.max_retries = max_retries
+        self.lock = threading.Lock()
+        self.chat_buckets = {}
+        self.queues = {}   # chat_id -> [Delivery] в порядке постановки
+        self.order = []
+
+    # ── Очередь ───────────────────────────────────────────────────────────────
+    def enqueue(self, chat_id, method, payload):
+        delivery = Delivery(chat_id, method, payload)
+        with self.lock:
+            self.queues.setdefault(chat_id, []).append(delivery)
+            self.order.append(delivery)
+        return delivery
+
+    def send_message(self, chat_id, text, reply_markup=None, parse_mode="HTML"):
+        payload = {
+            "chat_id": chat_id,
+            "text": text,
+            "parse_mode": parse_mode,
+            "disable_web_page_preview": True,
+        }
+        if reply_markup:
+            payload["reply_markup"] = json.dumps(reply_markup)
+        return self.enqueue(chat_id, "sendMessage", payload)
+
+    def flush(self):
+        """Отправляет всё накопленное и возвращает DeliveryReport."""
+        with self.lock:
+            queues, self.queues = list(self.queues.values()), {}
+            order, self.order = self.order, []
+        started = time.monotonic()
+        if len(queues) == 1:
+            self._drain(queues[0])
+        elif queues:
+            with ThreadPoolExecutor(max_workers=min(TG_CHAT_WORKERS, len(queues))) as pool:
+                list(pool.map(self._drain, queues))
+        return DeliveryReport(order, time.monotonic() - started)
+
+    # ── Отправка ──────────────────────────────────────────────────────────────
+    def _chat_bucket(self, chat_id):
+        with self.lock:
+            bucket = self.chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            return bucket
+
+    def _drain(self, queue):
+        # Сообщения одного чата — строго по очереди, следующее только после ответа на предыдущее
+        with metrics.stage("telegram_send"):
+            for delivery in queue:
+                self.deliver(delivery)
+
+    def deliver(self, delivery):
+        """Отправляет одно сообщение с повторами. Возвращает последний ответ Bot API."""
+        chat_bucket = self._chat_bucket(delivery.chat_id)
+        delay = 1.0
+        while True:
+            delivery.attempts += 1
+            wait = max(chat_bucket.reserve(), self.global_bucket.reserve())
+            if wait > 0:
+                time.sleep(wait)
+            sent = True
+            try:
+                resp = http_client.post(f"{self.api_base}/{delivery.method}",
+                                        json=delivery.payload, timeout=15)
+                status = resp.status_code
+                data = resp.json()
+            except ValueError as e:
+                # Ответ не JSON (например, страница 502 прокси) — решаем по статусу
+                data = {"ok": False, "description": f"HTTP {status}: {e}"}
+            except requests.RequestException as e:
+                sent = not _not_sent(e)
+                data, status = {"ok": False, "description": str(e)}, None
+
+            if data.get("ok"):
+                metrics.incr("telegram.sent")
+                delivery.ok = True
+                result = data.get("result")
+                if isinstance(result, dict):
+                    delivery.message_id = result.get("message_id")
+                return data
+
+            delivery.error = data.get("description") or f"HTTP {status}"
+            code = data.get("error_code") or status
+            if code == 429:
+                metrics.incr("telegram.429")
+            # Таймаут чтения, обрыв после отправки: сообщение могло дойти
+            if (code is None and sent) \
+                    or (code is not None and code not in RETRYABLE_STATUSES) \
+                    or delivery.attempts > self.max_retries:
+                print(f"  Telegram {delivery.method}: {delivery.error}")
+                metrics.incr("telegram.failed")
+                return data
+
+            metrics.incr("telegram.retries")
+
+            retry_after = (data.get("parameters") or {}).get("retry_after")
+            if retry_after:
+                # Telegram просит подождать — пауза для всего чата, порядок сохраняется
+                chat_bucket.pause(float(retry_after))
+                print(f"  Telegram 429, повтор через {retry_after} с")
+            else:
+                time.sleep(delay)
+                delay = min(delay * 2, 30.0)
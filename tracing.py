@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Social Capital Monitor — трассировка запуска
+Спаны (начало, длительность, поток) по пути каждого контакта: запросы
+к источникам, вызовы Gemini с повторами и ожиданием квоты, запись в Notion.
+Экспорт — JSON в формате Chrome trace events: открывается в
+chrome://tracing или https://ui.perfetto.dev. На таймлайне видны
+перекрытия и простои — например, воркер, который держит один медленный
+запрос к picuki, пока остальные ждут.
+Шаги одного контакта в разных потоках связаны стрелками (flow events).
+
+Включение:  SCM_TRACE=1 python monitor_social.py  →  traces/monitor_social-<время>.json
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+# ── Конфигурация ──────────────────────────────────────────────────────────────
+TRACE_ENABLED    = os.environ.get("SCM_TRACE", "").lower() in ("1", "true", "yes")
+TRACE_DIR        = os.environ.get("SCM_TRACE_DIR", "traces")
+TRACE_MAX_EVENTS = int(os.environ.get("SCM_TRACE_MAX_EVENTS", "1000000"))   # защита памяти на 100k контактов
+
+_origin = time.perf_counter_ns()
+_pid = os.getpid()
+_lock = threading.Lock()
+_events = []
+_threads = set()     # потоки, для которых уже записано имя
+_flows = {}          # id контакта -> номер flow
+_dropped = 0
+
+
+def _now_us():
+    return (time.perf_counter_ns() - _origin) / 1000
+
+
+def _emit(event):
+    global _dropped
+    tid = threading.get_ident()
+    event["pid"] = _pid
+    event["tid"] = tid
+    with _lock:
+        if len(_events) >= TRACE_MAX_EVENTS:
+            _dropped += 1
+            return
+        if tid not in _threads:
+            _threads.add(tid)
+            _events.append({"ph": "M", "name": "thread_name", "pid": _pid, "tid": tid,
+                            "args": {"name": threading.current_thread().name}})
+        _events.append(event)
+
+
+def step(key, end=False, ts=None):
+    """Шаг контакта key внутри текущего спана: стрелка от его предыдущего шага.
+    Нужен там, где один спан обрабатывает сразу несколько контактов (пакет Gemini)."""
+    if not TRACE_ENABLED:
+        return
+    ts = _now_us() if ts is None else ts
+    with _lock:
+        flow_id = _flows.get(key)
+        first = flow_id is None
+        if first:
+            flow_id = _flows[key] = len(_flows) + 1
+    phase = "s" if first else ("f" if end else "t")
+    event = {"ph": phase, "name": "contact", "cat": "flow", "id": flow_id, "ts": ts}
+    if phase == "f":
+        event["bp"] = "e"
+    _emit(event)
+
+
+class _Span:
+    __slots__ = ("name", "cat", "args", "flow", "flow_end", "start")
+
+    def __init__(self, name, cat, args, flow, flow_end):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.flow = flow
+        self.flow_end = flow_end
+
+    def set(self, **args):
+        """Дописывает аргументы, известные только по ходу спана (статус ответа и т.п.)."""
+        self.args.update(args)
+
+    def __enter__(self):
+        self.start = _now_us()
+        if self.flow is not None:
+            step(self.flow, self.flow_end, self.start)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        _emit({"ph": "X", "name": self.name, "cat": self.cat, "ts": self.start,
+               "dur": _now_us() - self.start, "args": self.args})
+        return False
+
+
+class _NullSpan:
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = nullcontext(_NullSpan())
+
+
+def span(name, cat="app", flow=None, flow_end=False, **args):
+    """Контекстный менеджер спана. flow — ключ контакта (page_id): спаны
+    с одним ключом соединяются стрелками, flow_end=True — последний шаг."""
+    if not TRACE_ENABLED:
+        return _NULL_SPAN
+    return _Span(name, cat, args, flow, flow_end)
+
+
+def instant(name, cat="app", **args):
+    """Событие-точка (например, пропуск контакта)."""
+    if TRACE_ENABLED:
+        _emit({"ph": "i", "s": "t", "name": name, "cat": cat, "ts": _now_us(), "args": args})
+
+
+def write_trace(path):
+    with _lock:
+        events = list(_events)
+        dropped = _dropped
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                   "otherData": {"dropped_events": dropped}}, f, ensure_ascii=False)
+    return path
+
+
+@contextmanager
+def session(script):
+    """Оборачивает main(): весь запуск — корневой спан, по завершению пишет трассу."""
+    if not TRACE_ENABLED:
+        yield
+        return
+    started_at = datetime.now()
+    try:
+        with span(script, cat="run"):
+            yield
+    finally:
+        path = os.path.join(TRACE_DIR, f"{script}-{started_at.strftime('%Y%m%d-%H%M%S')}.json")
+        try:
+            write_trace(path)
+            note = f" (отброшено событий: {_dropped})" if _dropped else ""
+            print(f"  Трасса: {path}{note}")
+        except OSError as e:
+            print(f"  Не удалось записать трассу: {e}")
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Social Capital Monitor — вебхук-сервер для кнопок дайджеста
+Самостоятельная замена cloudflare-worker/worker.js на asyncio (только stdlib).
+Telegram присылает callback_query POST-запросом, и ответ на нажатие
+(answerCallbackQuery) уходит прямо в теле ответа на вебхук — toast
+появляется через один круг Telegram, без ожидания Notion.
+Затем сообщение редактируется одним editMessageText, а запись в Notion
+ставится в очередь фоновых воркеров с повторами. Если запись так и не
+удалась, в сообщение дописывается предупреждение.
+Логика действий общая с handle_callbacks.py (таблица ACTIONS).
+Несколько арендаторов (tenants.py): у каждого бота свой вебхук
+с ?bot=<арендатор>, нажатие применяется к арендатору своего чата;
+нажатия из чатов, которых нет в конфигурации, отклоняются.
+Без WEBHOOK_SECRET сервер не запускается: иначе любой, кто видит порт,
+мог бы прислать поддельное нажатие (как в worker.js — 401).
+
+Запуск:  python webhook_server.py [--host 0.0.0.0] [--port 8080]
+Регистрация вебхука:  python webhook_server.py --set-webhook https://<host>/
+"""
+import os
+import json
+import signal
+import asyncio
+import argparse
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+
+import http_client
+import tenants
+import handle_callbacks as callbacks
+
+# ── Конфигурация ──────────────────────────────────────────────────────────────
+WEBHOOK_HOST           = os.environ.get("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT           = int(os.environ.get("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET         = os.environ.get("WEBHOOK_SECRET", "")
+WEBHOOK_NOTION_WORKERS = int(os.environ.get("WEBHOOK_NOTION_WORKERS", "4"))
+WEBHOOK_NOTION_RETRIES = 3
+
+MAX_BODY_BYTES   = 1 << 20   # апдейты Telegram — единицы килобайт
+KEEPALIVE_SECS   = 60        # сколько держим простаивающее соединение
+SHUTDOWN_DRAIN   = 30        # сколько ждём очередь Notion при остановке
+
+_REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized",
+            404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large"}
+
+
+# ── Обработка апдейта ─────────────────────────────────────────────────────────
+class CallbackApp:
+    """Разбор апдейтов Telegram и фоновая очередь записей в Notion."""
+
+    def __init__(self, workers=WEBHOOK_NOTION_WORKERS, retries=WEBHOOK_NOTION_RETRIES):
+        self.queue = asyncio.Queue()
+        self.retries = retries
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(workers)]
+        self.background = set()
+
+    def authorized(self, target, headers):
+        if not WEBHOOK_SECRET:
+            return False
+        # Заголовок, который Telegram ставит по secret_token из setWebhook,
+        # или ?secret= в URL — как у Cloudflare Worker
+        if headers.get("x-telegram-bot-api-secret-token") == WEBHOOK_SECRET:
+            return True
+        query = parse_qs(urlsplit(target).query)
+        return query.get("secret", [""])[0] == WEBHOOK_SECRET
+
+    def group_for(self, target):
+        """Арендаторы бота, приславшего апдейт: по ?bot= из URL вебхука.
+        None — бот не из конфигурации."""
+        groups = callbacks.bot_groups()
+        if len(groups) == 1:
+            return groups[0]
+        bot = parse_qs(urlsplit(target).query).get("bot", [""])[0]
+        for group in groups:
+            if group[0].name == bot:
+                return group
+        return None
+
+    def handle_update(self, update, target="/"):
+        """Возвращает тело ответа на вебхук: вызов Bot API или None."""
+        callback = update.get("callback_query")
+        if not callback:
+            return None
+
+        action, page_id, chat_id, msg_id, orig_text = callbacks.parse_callback(callback)
+        group = self.group_for(target)
+        tenant = callbacks.tenant_for_chat(group, chat_id) if group else None
+        if tenant is None:
+            print(f"  Нажатие из чужого чата {chat_id} — пропускаю")
+            return {"method": "answerCallbackQuery",
+                    **callbacks.answer_callback_payload(callback["id"])}
+        if action == "notion" and page_id:
+            return {"method": "answerCallbackQuery",
+                    **callbacks.answer_callback_payload(
+                        callback["id"], callbacks.notion_link(page_id), show_alert=True)}
+        if action not in callbacks.ACTIONS or not page_id:
+            return {"method": "answerCallbackQuery",
+                    **callbacks.answer_callback_payload(callback["id"])}
+
+        apply, toast, note = callbacks.ACTIONS[action]
+        print(f"  Нажатие: {action} для {page_id}")
+        # Задача и поток копируют контекст — там виден текущий арендатор
+        with tenants.use(tenant):
+            self._spawn(self._edit(chat_id, msg_id, orig_text + f"\n\n<i>{note}</i>"))
+        self.queue.put_nowait((tenant, action, apply, page_id, chat_id, msg_id, orig_text))
+        return {"method": "answerCallbackQuery",
+                **callbacks.answer_callback_payload(callback["id"], toast)}
+
+    # ── Фоновые задачи ────────────────────────────────────────────────────────
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+
+    async def _edit(self, chat_id, msg_id, text):
+        try:
+            await asyncio.to_thread(callbacks.tg_edit_message, chat_id, msg_id, text)
+        except Exception as e:
+            print(f"  Ошибка editMessageText: {e}")
+
+    async def _worker(self):
+        while True:
+            tenant, action, apply, page_id, chat_id, msg_id, orig_text = await self.queue.get()
+            try:
+                with tenants.use(tenant):
+                    await self._write(action, apply, page_id, chat_id, msg_id, orig_text)
+            finally:
+                self.queue.task_done()
+
+    async def _write(self, action, apply, page_id, chat_id, msg_id, orig_text):
+        # 429 и Retry-After обрабатывает NotionWriter; здесь — повторы на прочие сбои
+        delay = 2.0
+        for attempt in range(1, self.retries + 1):
+            try:
+                await asyncio.to_thread(apply, page_id)
+                return
+            except Exception as e:
+                print(f"  Notion {action} для {page_id}: попытка {attempt}/{self.retries}: {e}")
+                if attempt < self.retries:
+                    await asyncio.sleep(delay)
+                    delay *= 2
+        await self._edit(chat_id, msg_id,
+                         orig_text + "\n\n<i>⚠️ Не удалось обновить Notion, нажми ещё раз позже</i>")
+
+    async def drain(self, timeout=SHUTDOWN_DRAIN):
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"  Не записано в Notion при остановке: {self.queue.qsize()}")
+        if self.background:
+            await asyncio.wait(self.background, timeout=timeout)
+        for task in self.tasks:
+            task.cancel()
+
+
+# ── HTTP ──────────────────────────────────────────────────────────────────────
+async def _respond(writer, status, body=None, keep_alive=True):
+    payload = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else b""
+    head = [
+        f"HTTP/1.1 {status} {_REASONS.get(status, '')}",
+        f"Content-Length: {len(payload)}",
+        "Connection: keep-alive" if keep_alive else "Connection: close",
+    ]
+    if payload:
+        head.append("Content-Type: application/json")
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + payload)
+    await writer.drain()
+
+
+async def _read_request(reader):
+    """Читает один HTTP/1.1 запрос. None — соединение закрыто или простаивает."""
+    line = await asyncio.wait_for(reader.readline(), KEEPALIVE_SECS)
+    if not line:
+        return None
+    method, target, version = line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+    headers = {}
+    while True:
+        line = await asyncio.wait_for(reader.readline(), KEEPALIVE_SECS)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY_BYTES:
+        return method, target, version, headers, None
+    body = await reader.readexactly(length) if length else b""
+    return method, target, version, headers, body
+
+
+def serve_connection(app):
+    async def handle(reader, writer):
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, target, version, headers, body = request
+                keep_alive = (version == "HTTP/1.1"
+                              and headers.get("connection", "").lower() != "close")
+                if body is None:
+                    await _respond(writer, 413, keep_alive=False)
+                    break
+                if method != "POST":
+                    await _respond(writer, 405 if method != "GET" else 200, keep_alive=keep_alive)
+                elif not app.authorized(target, headers):
+                    await _respond(writer, 401, keep_alive=keep_alive)
+                else:
+                    try:
+                        update = json.loads(body)
+                    except ValueError:
+                        await _respond(writer, 400, keep_alive=keep_alive)
+                    else:
+                        try:
+                            reply = app.handle_update(update, target)
+                        except Exception as e:
+                            # 200 без тела: иначе Telegram будет повторять этот апдейт
+                            print(f"  Ошибка обработки апдейта: {e}")
+                            reply = None
+                        await _respond(writer, 200, reply, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+    return handle
+
+
+async def serve(host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+    app = CallbackApp()
+    server = await asyncio.start_server(serve_connection(app), host, port)
+    print(f"[{datetime.now().isoformat()}] Вебхук-сервер слушает {host}:{port}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with server:
+        await stop.wait()
+        print("  Остановка: новые запросы не принимаем, дописываем очередь Notion...")
+        server.close()
+        await server.wait_closed()
+        await app.drain()
+    print(f"[{datetime.now().isoformat()}] Вебхук-сервер остановлен")
+
+
+def set_webhook(url):
+    """Регистрирует вебхук у Telegram (только callback_query, с secret_token).
+    Если ботов несколько — каждому свой URL с ?bot=<первый арендатор бота>."""
+    groups = callbacks.bot_groups()
+    for group in groups:
+        target = url
+        if len(groups) > 1:
+            target += ("&" if "?" in url else "?") + f"bot={group[0].name}"
+        payload = {"url": target, "allowed_updates": ["callback_query"],
+                   "secret_token": WEBHOOK_SECRET}
+        resp = http_client.post(f"{group[0].tg_api}/setWebhook", json=payload, timeout=15)
+        print(resp.json())
+
+
+# ── Главная функция ───────────────────────────────────────────────────────────
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Вебхук-сервер для кнопок дайджеста")
+    parser.add_argument("--host", default=WEBHOOK_HOST)
+    parser.add_argument("--port", type=int, default=WEBHOOK_PORT)
+    parser.add_argument("--set-webhook", metavar="URL",
+                        help="зарегистрировать вебхук на URL и выйти")
+    args = parser.parse_args(argv)
+
+    if not WEBHOOK_SECRET:
+        raise SystemExit("WEBHOOK_SECRET не задан: без него вебхук принимает "
+                         "нажатия от кого угодно")
+    if args.set_webhook:
+        set_webhook(args.set_webhook)
+        return
+    asyncio.run(serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()